@@ -0,0 +1,89 @@
+"""Abandonment of superseded searches, as per site_search_abandon_superseded.
+
+The search modal numbers its searches, and sends each number with an id of the page (in the
+X-Site-Search-Sequence header), aborting its previous request whenever it starts a new one.
+The latest number of each page is recorded in the cache, so a search can check - between
+models, at most every CHECK_INTERVAL seconds (so a remote cache isn't queried once per model) -
+whether a later one has started since, and stop querying models for results that would be
+discarded anyway. The cache must be shared between processes, as a page's searches may be served
+by any of them."""
+
+import re
+import time
+from typing import Optional
+
+from django.core.cache import caches
+
+from admin_site_search.cache import KEY_PREFIX, digest
+
+# seconds for which a page's latest search number is recorded
+TIMEOUT = 300
+# seconds between checks, while models are searched concurrently
+POLL_INTERVAL = 0.05
+# minimum seconds between the cache reads of a search's checks, i.e. later checks are skipped
+CHECK_INTERVAL = 0.02
+# "<page id>:<search number>"
+HEADER_PATTERN = re.compile(r"^([A-Za-z0-9_-]{1,64}):(\d{1,12})$")
+
+
+class SearchAbandoned(Exception):
+    """Raised once a search has been superseded, to stop searching models"""
+
+
+class SearchSequence:
+    """A single search, numbered within the sequence of searches from a page"""
+
+    def __init__(self, alias: str, key: str, number: int):
+        """:param alias: The cache alias.
+        :param key: The cache key of the page's latest number.
+        :param number: The search's number."""
+        self.alias = alias
+        self.key = key
+        self.number = number
+        self.checked_at: Optional[float] = None
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def start(self):
+        """Records the search as the page's latest, unless a later one has already started
+        (i.e. requests arrived out of order)."""
+        if (self.cache.get(self.key) or 0) < self.number:
+            self.cache.set(self.key, self.number, timeout=TIMEOUT)
+
+    def is_superseded(self) -> bool:
+        """Returns True if a later search has started, from the same page."""
+        return (self.cache.get(self.key) or 0) > self.number
+
+    def check(self):
+        """Reads the page's latest number, unless it was read less than CHECK_INTERVAL seconds
+        ago.
+
+        :raises SearchAbandoned: If a later search has started, from the same page."""
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < CHECK_INTERVAL:
+            return
+
+        self.checked_at = now
+        if self.is_superseded():
+            raise SearchAbandoned
+
+
+def parse_sequence(
+    alias: str, site_name: str, user_pk, header: Optional[str]
+) -> Optional[SearchSequence]:
+    """Returns the search's place in its page's sequence, as per the X-Site-Search-Sequence
+    header - or None if the header is missing or invalid.
+
+    :param alias: The cache alias.
+    :param site_name: The name of the admin site.
+    :param user_pk: The pk of the user, so pages can't supersede other users' searches.
+    :param header: The header's value."""
+    match = HEADER_PATTERN.match(header or "")
+    if not match:
+        return None
+
+    page, number = match.groups()
+    key = f"{KEY_PREFIX}:sequence:{digest(site_name, user_pk, page)}"
+    return SearchSequence(alias, key, int(number))
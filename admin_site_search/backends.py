@@ -0,0 +1,240 @@
+"""Search backends, which match objects for the site_search_method: either one of the built-in
+names, or the dotted path of a SearchBackend subclass.
+
+A backend is given every model that the user can view in a single search() call, so it can
+match them all at once (e.g. with one request to an external search engine). QuerySetBackend
+subclasses - including the built-in backends - instead filter each model's queryset, so that
+models can be searched in threads, with async views, the prefix memo, bloom filters, etc.
+
+Backends can also maintain an index: index_build() is used by build_search_index() (and so the
+build_site_search_index management command), and index_update() is called with batches of
+written objects, once committed - as per admin_site_search.updates."""
+
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple, Type
+
+from django.contrib.admin import ModelAdmin
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models import Field, Model, Q, QuerySet
+from django.http import HttpRequest
+from django.utils.module_loading import import_string
+
+from admin_site_search import updates
+
+if TYPE_CHECKING:
+    from admin_site_search.views import AdminSiteSearchView
+
+
+class SearchBackend:
+    """Matches objects of many models, for a single admin site"""
+
+    def __init__(self, site: "AdminSiteSearchView"):
+        """:param site: The admin site."""
+        self.site = site
+
+    def prepare(self):
+        """Called once, when the backend is created - before any search or index build. By
+        default, starts calling index_update() with written objects, if it's overridden."""
+        if type(self).index_update is not SearchBackend.index_update:
+            updates.register(self.index_update)
+
+    def search(
+        self,
+        request: HttpRequest,
+        query: str,
+        models: Dict[Type[Model], QuerySet],
+        limit: int = 5,
+    ) -> Dict[Type[Model], list]:
+        """Returns up to limit matches for each model, as model instances or pks (which are
+        retrieved from the model's queryset, in the same order). Models without matches may be
+        left out.
+
+        :param request: The HTTPRequest object.
+        :param query: The search query string.
+        :param models: Each model class that the user can view, with its queryset (as per
+        get_model_queryset), which may be restricted to the objects they can view.
+        :param limit: The maximum number of matches per model."""
+        raise NotImplementedError
+
+    def index_build(
+        self, model_classes: List[Type[Model]], chunk_size: int
+    ) -> Iterator[Tuple[Type[Model], Optional[int]]]:
+        """(Re)builds the index of each model class, yielding it with the number of objects
+        indexed - or None if it was skipped.
+
+        :param model_classes: The model classes.
+        :param chunk_size: The number of objects to read per query."""
+        raise ImproperlyConfigured(
+            f"The {type(self).__name__} search backend doesn't have an index"
+        )
+
+    def index_update(self, model_class: Type[Model], pks: List, using: str):
+        """Re-indexes the objects with the pks, or removes them from the index if they no
+        longer exist.
+
+        :param model_class: The (concrete) model class.
+        :param pks: The pks of the objects.
+        :param using: The database alias."""
+
+
+class QuerySetBackend(SearchBackend):
+    """A backend that filters each model's queryset, via match_objects()"""
+
+    def filter(
+        self,
+        request: HttpRequest,
+        query: str,
+        model_class: Type[Model],
+        model_fields: List[Field],
+        model_admin: Optional[ModelAdmin],
+        queryset: QuerySet,
+    ) -> QuerySet:
+        """Returns the queryset, filtered to the objects matching the query.
+
+        :param request: The HTTPRequest object.
+        :param query: The search query string.
+        :param model_class: The model class.
+        :param model_fields: A list of the model's fields.
+        :param model_admin: The model admin, which is non-None for all registered models.
+        :param queryset: The model's queryset, as per get_model_queryset()."""
+        # i.e. no objects, e.g. for unknown site_search_methods
+        return model_class.objects.none()
+
+    def search(
+        self,
+        request: HttpRequest,
+        query: str,
+        models: Dict[Type[Model], QuerySet],
+        limit: int = 5,
+    ) -> Dict[Type[Model], list]:
+        """Returns the first limit objects of each model's filtered queryset."""
+        matches = {}
+        for model_class, queryset in models.items():
+            plan = self.site._get_search_plan(model_class)
+            results = self.filter(
+                request, query, model_class, plan.fields, plan.model_admin, queryset
+            )
+            matches[model_class] = list(results[:limit])
+        return matches
+
+
+class ModelCharFieldsBackend(QuerySetBackend):
+    """The "model_char_fields" backend: an OR filter across all Char fields in the model, with
+    filter_field() - or, if site_search_match_terms is True, an AND of such a filter for each
+    term of the query"""
+
+    def filter(
+        self,
+        request: HttpRequest,
+        query: str,
+        model_class: Type[Model],
+        model_fields: List[Field],
+        model_admin: Optional[ModelAdmin],
+        queryset: QuerySet,
+    ) -> QuerySet:
+        site = self.site
+        plan = site._get_search_plan(model_class)
+        terms = site._query_terms(query)
+
+        if model_fields is plan.fields and not site._is_overridden("filter_field"):
+            # only the terms need binding to the precompiled lookups
+            filters = plan.filters_all(terms)
+        else:
+            filters = Q()
+
+            for term in terms:
+                # i.e. an OR filter across fields, for each term
+                term_filters = Q()
+                for field in model_fields:
+                    filter_ = site.filter_field(request, term, field)
+                    if filter_:
+                        term_filters |= filter_
+                filters &= term_filters
+
+        if not filters:
+            return model_class.objects.none()
+        return queryset.filter(filters)
+
+
+class AdminSearchFieldsBackend(QuerySetBackend):
+    """The "admin_search_fields" backend: delegates to the search_fields of the model's
+    admin"""
+
+    def filter(
+        self,
+        request: HttpRequest,
+        query: str,
+        model_class: Type[Model],
+        model_fields: List[Field],
+        model_admin: Optional[ModelAdmin],
+        queryset: QuerySet,
+    ) -> QuerySet:
+        if not model_admin or not model_admin.search_fields:
+            return model_class.objects.none()
+
+        results, may_have_duplicates = model_admin.get_search_results(
+            request=request, queryset=queryset, search_term=query
+        )
+        if may_have_duplicates:
+            # can happen if search_fields contains a many-to-many relation
+            results = results.distinct()
+        return results
+
+
+def related_models(model_class: Type[Model], search_field: str) -> List[Type[Model]]:
+    """Returns the models that the search field (of the model class' admin) looks up through
+    relations, e.g. the Team model for "team__name" - whose writes change the results of the
+    admin_search_fields method.
+
+    :param model_class: The model class.
+    :param search_field: The search field, optionally prefixed with "^", "=" or "@"."""
+    models = []
+    for name in search_field.lstrip("^=@").split(LOOKUP_SEP):
+        try:
+            field = model_class._meta.get_field(name)
+        except FieldDoesNotExist:
+            # e.g. a lookup, such as "name__exact"
+            break
+        if not field.is_relation or field.related_model is None:
+            break
+        model_class = field.related_model
+        models.append(model_class)
+    return models
+
+
+# built-in names -> backend classes. The index methods match objects against their index in
+# search(), and filter models that can't be indexed as per model_char_fields
+BUILTIN_BACKENDS: Dict[str, Type[SearchBackend]] = {
+    "model_char_fields": ModelCharFieldsBackend,
+    "admin_search_fields": AdminSearchFieldsBackend,
+    "sqlite_fts5": ModelCharFieldsBackend,
+    "in_memory_index": ModelCharFieldsBackend,
+}
+
+
+def get_backend_class(method: str) -> Type[SearchBackend]:
+    """Returns the backend class of the site_search_method: a built-in name, or the dotted
+    path of a SearchBackend subclass. Other names match no objects.
+
+    :raises ImproperlyConfigured: If the dotted path can't be imported, or isn't a
+    SearchBackend subclass."""
+    if not is_backend_path(method):
+        return BUILTIN_BACKENDS.get(method, QuerySetBackend)
+
+    try:
+        backend_class = import_string(method)
+    except ImportError as ex:
+        raise ImproperlyConfigured(
+            f"site_search_method {method!r} couldn't be imported: {ex}"
+        ) from ex
+
+    if not (
+        isinstance(backend_class, type) and issubclass(backend_class, SearchBackend)
+    ):
+        raise ImproperlyConfigured(f"{method} isn't a SearchBackend subclass")
+    return backend_class
+
+
+def is_backend_path(method: str) -> bool:
+    """Returns True if the site_search_method is the dotted path of a backend."""
+    return "." in method
@@ -0,0 +1,409 @@
+"""Per-model bloom filters of the trigrams in each model's Char fields, used to skip the database
+query of models that can't match a query (i.e. that have no object with every one of its
+trigrams) - as most models can't, for most queries.
+
+A filter can report that a model might match when it can't (a false positive, so the model is
+queried as usual), but never the reverse. Filters are built with a single scan of the model - in
+a background thread, while the model is queried as usual - and stored in the cache, shared
+between processes and kept in each process that uses them. Models with more trigrams than a
+filter of MAX_BYTES can hold (at MAX_FALSE_POSITIVE_RATE) aren't filtered, since nearly every
+query would be a false positive: their scan stops there, and that's stored in place of a filter.
+Objects written since (as per admin_site_search.updates) are added to the filter as deltas:
+each is numbered by a counter, so that every process can apply the deltas it's missing. Deleted
+objects aren't removed, and writes that don't send signals (e.g. QuerySet.update(), or raw SQL)
+aren't added, so filters are rebuilt TIMEOUT after they were built - in the cache, and in every
+process - to reflect them. If a delta is missing from the cache, e.g. evicted, the filter is
+rebuilt on the next search. Writes to models without a filter aren't read at all."""
+
+import hashlib
+import math
+import time
+from threading import Lock, Thread
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Type
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import Model
+
+from admin_site_search import updates
+from admin_site_search.cache import KEY_PREFIX
+from admin_site_search.plans import build_search_plan
+from admin_site_search.trigrams import object_text, trigrams
+
+# the target rate of false positives, per trigram
+FALSE_POSITIVE_RATE = 0.01
+# filters are sized for their model's trigrams, up to this many bytes
+MAX_BYTES = 16384
+MIN_BYTES = 64
+# models whose filter (of MAX_BYTES) would have a higher rate of false positives aren't filtered
+MAX_FALSE_POSITIVE_RATE = 0.1
+# seconds for which filters (and deltas) are used, after they're built, before they're rebuilt
+TIMEOUT = 24 * 60 * 60
+# seconds for which one process rebuilds a filter, while others query the database
+LOCK_TIMEOUT = 60
+# once a process has applied this many deltas, it stores the filter in their place
+MAX_DELTAS = 50
+
+# cache aliases in which filters are kept, and so need deltas
+_aliases: Set[str] = set()
+
+
+def filter_key(label: str) -> str:
+    """Returns the cache key of the model's filter."""
+    return f"{KEY_PREFIX}:bloom:{label}"
+
+
+def counter_key(label: str) -> str:
+    """Returns the cache key of the model's delta counter."""
+    return f"{KEY_PREFIX}:bloom:{label}:deltas"
+
+
+def delta_key(label: str, number: int) -> str:
+    """Returns the cache key of one of the model's deltas."""
+    return f"{KEY_PREFIX}:bloom:{label}:delta:{number}"
+
+
+def max_trigrams() -> int:
+    """Returns the number of trigrams that a filter of MAX_BYTES holds, at
+    MAX_FALSE_POSITIVE_RATE (with the optimal number of hashes)."""
+    return math.floor(
+        -MAX_BYTES * 8 * math.log(2) ** 2 / math.log(MAX_FALSE_POSITIVE_RATE)
+    )
+
+
+class BloomFilter:
+    """A bloom filter of trigrams"""
+
+    def __init__(self, bits: bytearray, hashes: int):
+        """:param bits: The filter's bits, 8 per byte.
+        :param hashes: The number of bits set for each trigram."""
+        self.bits = bits
+        self.hashes = hashes
+        self._size = len(bits) * 8
+
+    @classmethod
+    def for_trigrams(cls, trigram_set: Set[str]) -> "BloomFilter":
+        """Returns a new filter of the trigrams, sized for FALSE_POSITIVE_RATE (within the
+        MIN_BYTES and MAX_BYTES limits)."""
+        count = max(len(trigram_set), 1)
+        size = -count * math.log(FALSE_POSITIVE_RATE) / math.log(2) ** 2
+        nbytes = min(max(math.ceil(size / 8), MIN_BYTES), MAX_BYTES)
+        hashes = min(max(round(nbytes * 8 / count * math.log(2)), 1), 8)
+
+        bloom = cls(bytearray(nbytes), hashes)
+        bloom.update(trigram_set)
+        return bloom
+
+    def _positions(self, trigram: str) -> List[int]:
+        """Returns the positions of the trigram's bits, by double hashing. The hash doesn't
+        depend on the process (unlike hash()), since filters are shared."""
+        digest = hashlib.blake2b(trigram.encode(), digest_size=8).digest()
+        h1 = int.from_bytes(digest[:4], "little")
+        h2 = int.from_bytes(digest[4:], "little") | 1
+        return [(h1 + i * h2) % self._size for i in range(self.hashes)]
+
+    def update(self, trigram_set: Iterable[str]):
+        """Adds the trigrams to the filter."""
+        for trigram in trigram_set:
+            for position in self._positions(trigram):
+                self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, trigram: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(trigram)
+        )
+
+    def might_match(self, query: str) -> bool:
+        """Returns False if no object can contain the (case-insensitive) query, i.e. one of
+        its trigrams is definitely absent."""
+        return all(trigram in self for trigram in trigrams(query.lower()))
+
+
+class FilterEntry(NamedTuple):
+    """A model's filter, as of a delta"""
+
+    # the number of the last delta applied
+    number: int
+    # None if the model has more than max_trigrams(), so isn't filtered
+    bloom: Optional[BloomFilter]
+    # when (as per time.time()) the filter was built, i.e. read from the database
+    built: float
+
+    def is_expired(self) -> bool:
+        """Returns True if the filter was built more than TIMEOUT seconds ago, so may be
+        missing writes that didn't send signals."""
+        return time.time() - self.built >= TIMEOUT
+
+
+def index_field_names(model_class: Type[Model]) -> List[str]:
+    """Returns the names of the fields in the filter, i.e. the Char fields searched by the
+    default filter_field()."""
+    return list(build_search_plan(model_class, None).field_names)
+
+
+def model_trigrams(
+    model_class: Type[Model],
+    pks: Optional[List] = None,
+    using: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> Tuple[Set[str], int]:
+    """Returns the (trigrams, number of objects) of the model class' objects - or those with
+    the pks. Objects are read with the base manager, so that no queryset (e.g. returned by
+    get_model_queryset) has objects that aren't in the filter.
+
+    :param limit: Stop reading objects once there are more than this many trigrams."""
+    queryset = model_class._base_manager.db_manager(using).order_by()
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+
+    trigram_set = set()
+    count = 0
+    rows = queryset.values_list(*index_field_names(model_class)).iterator(
+        chunk_size=2000
+    )
+    for values in rows:
+        trigram_set.update(trigrams(object_text(values)))
+        count += 1
+        if limit is not None and len(trigram_set) > limit:
+            break
+
+    return trigram_set, count
+
+
+class BloomFilterRegistry:
+    """Loads (or builds) the filter of each model class, from the cache - keeping a copy in
+    the process, to which new deltas are applied"""
+
+    # set to build filters in a background thread, while the model is queried as usual -
+    # otherwise, they're built by the caller of get_many()
+    background = True
+
+    def __init__(self, alias: str):
+        """:param alias: The cache alias, in which filters are stored."""
+        self.alias = alias
+        self._filters: Dict[str, FilterEntry] = {}
+        # label -> thread building its filter
+        self._builds: Dict[str, Thread] = {}
+        self._lock = Lock()
+        track_filter_writes(alias)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_many(
+        self, model_classes: Iterable[Type[Model]]
+    ) -> Dict[Type[Model], Optional[BloomFilter]]:
+        """Returns the (up-to-date) filter of each model class, or None if it can't be used,
+        e.g. it's being built (in the background, or by another process), or the model has
+        too many trigrams."""
+        model_classes = list(model_classes)
+        counters = self.cache.get_many(
+            [counter_key(m._meta.label) for m in model_classes]
+        )
+        filters = {}
+
+        for model_class in model_classes:
+            label = model_class._meta.label
+            counter = counters.get(counter_key(label))
+            entry = self._filters.get(label)
+
+            if counter is not None and (
+                entry is None or entry.number > counter or entry.is_expired()
+            ):
+                # i.e. not loaded yet, the counter was reset, or it's due to be rebuilt
+                entry = self._load(label)
+
+            if counter is None or entry is None:
+                entry = self._build(model_class)
+            elif entry.number < counter:
+                entry = self._apply_deltas(label, entry, counter)
+
+            if entry is None:
+                self._filters.pop(label, None)
+            else:
+                self._filters[label] = entry
+            filters[model_class] = entry.bloom if entry else None
+
+        return filters
+
+    def build(self, model_class: Type[Model]) -> int:
+        """(Re)builds the filter of the model class, e.g. ahead of the first search. If the
+        model has more than max_trigrams(), that's stored instead.
+
+        :return: The number of objects in the filter (or read, before there were too many
+            trigrams)."""
+        label = model_class._meta.label
+        self.cache.add(counter_key(label), 0, timeout=None)
+        number = self.cache.get(counter_key(label), 0)
+
+        built = time.time()
+        limit = max_trigrams()
+        trigram_set, count = model_trigrams(model_class, limit=limit)
+        if len(trigram_set) > limit:
+            entry = FilterEntry(number, None, built)
+        else:
+            entry = FilterEntry(number, BloomFilter.for_trigrams(trigram_set), built)
+        self._store(label, entry)
+        self._filters[label] = entry
+        return count
+
+    def _load(self, label: str) -> Optional[FilterEntry]:
+        """Returns the model's stored filter, or None if it isn't stored (or has expired)."""
+        stored = self.cache.get(filter_key(label))
+        if stored is None:
+            return None
+        bloom = None
+        if stored["bits"] is not None:
+            bloom = BloomFilter(bytearray(stored["bits"]), stored["hashes"])
+        entry = FilterEntry(stored["number"], bloom, stored["built"])
+        return None if entry.is_expired() else entry
+
+    def _store(self, label: str, entry: FilterEntry):
+        """Stores the model's filter (including its deltas), until it expires."""
+        stored = {
+            "number": entry.number,
+            "bits": bytes(entry.bloom.bits) if entry.bloom else None,
+            "hashes": entry.bloom.hashes if entry.bloom else None,
+            "built": entry.built,
+        }
+        timeout = max(TIMEOUT - (time.time() - entry.built), 1)
+        self.cache.set(filter_key(label), stored, timeout=timeout)
+
+    def _build(self, model_class: Type[Model]) -> Optional[FilterEntry]:
+        """Builds the model's filter, unless another process is building it - in which case
+        None is returned. If background is set, it's built in a background thread, and None
+        is returned meanwhile."""
+        lock = f"{filter_key(model_class._meta.label)}:lock"
+        if not self.cache.add(lock, 1, timeout=LOCK_TIMEOUT):
+            return None
+
+        if self.background:
+            self._start_build(model_class, lock)
+            return None
+
+        try:
+            self.build(model_class)
+        finally:
+            self.cache.delete(lock)
+
+        # apply any deltas of objects written while building
+        entry = self._filters[model_class._meta.label]
+        counter = self.cache.get(counter_key(model_class._meta.label), entry.number)
+        return self._apply_deltas(model_class._meta.label, entry, counter)
+
+    def _start_build(self, model_class: Type[Model], lock: str):
+        """Starts building the model's filter in a background thread, releasing the lock
+        once it's built."""
+        label = model_class._meta.label
+        with self._lock:
+            if label in self._builds:
+                return
+            thread = Thread(
+                target=self._build_in_background,
+                args=(model_class, lock),
+                daemon=True,
+            )
+            self._builds[label] = thread
+        thread.start()
+
+    def _build_in_background(self, model_class: Type[Model], lock: str):
+        """Builds the model's filter. Errors are ignored, i.e. the model is queried as usual
+        until a later search starts another build."""
+        try:
+            self.build(model_class)
+        except Exception:
+            # e.g. the database is unavailable
+            pass
+        finally:
+            self.cache.delete(lock)
+            with self._lock:
+                self._builds.pop(model_class._meta.label, None)
+            # connections are thread-local, so close them before the thread exits
+            connections.close_all()
+
+    def join(self):
+        """Waits for any background builds to finish."""
+        for thread in list(self._builds.values()):
+            thread.join()
+
+    def _apply_deltas(
+        self, label: str, entry: FilterEntry, counter: int
+    ) -> Optional[FilterEntry]:
+        """Returns the entry, with deltas up to the counter applied - or None if any are
+        missing, in which case the stored filter is removed (to be rebuilt)."""
+        if counter <= entry.number:
+            return entry
+        if entry.bloom is None:
+            # i.e. the model isn't filtered, so there's nothing to add to
+            return entry._replace(number=counter)
+
+        keys = [delta_key(label, n) for n in range(entry.number + 1, counter + 1)]
+        deltas = self.cache.get_many(keys)
+        if len(deltas) < len(keys):
+            # e.g. evicted, or not yet stored by the process that wrote the objects
+            self.cache.delete(filter_key(label))
+            return None
+
+        # copied, since other threads may be using the filter
+        bloom = BloomFilter(bytearray(entry.bloom.bits), entry.bloom.hashes)
+        for key in keys:
+            bloom.update(deltas[key])
+
+        entry = FilterEntry(counter, bloom, entry.built)
+        if len(keys) >= MAX_DELTAS:
+            self._store(label, entry)
+
+        return entry
+
+
+def _related_labels(model_class: Type[Model]) -> List[str]:
+    """Returns the labels of every model sharing the model class' table, i.e. its concrete
+    model and any proxies of it."""
+    concrete_model = model_class._meta.concrete_model
+    return [
+        m._meta.label
+        for m in apps.get_models()
+        if m._meta.concrete_model is concrete_model
+    ]
+
+
+def sync(model_class: Type[Model], pks: List, using: str):
+    """Adds the trigrams of the objects with the pks, as a delta of every filter of the
+    objects' table - without reading the objects, if there isn't one. Registered as a handler
+    of admin_site_search.updates.
+
+    :param model_class: The (concrete) model class.
+    :param pks: The pks of the objects.
+    :param using: The database alias."""
+    labels = _related_labels(model_class)
+    # cache alias -> labels with a filter, i.e. a delta counter
+    counted: Dict[str, List[str]] = {}
+    for alias in list(_aliases):
+        counters = caches[alias].get_many([counter_key(label) for label in labels])
+        counted[alias] = [label for label in labels if counter_key(label) in counters]
+    if not any(counted.values()):
+        return
+
+    trigram_set, _ = model_trigrams(model_class, pks, using)
+    if not trigram_set:
+        # e.g. the objects were deleted, which filters don't need to reflect
+        return
+
+    for alias, labels in counted.items():
+        cache = caches[alias]
+        for label in labels:
+            try:
+                number = cache.incr(counter_key(label))
+            except ValueError:
+                # no filter has been built, so there's nothing to add to
+                continue
+            cache.set(delta_key(label, number), trigram_set, timeout=TIMEOUT)
+
+
+def track_filter_writes(alias: str):
+    """Starts adding deltas to the filters in the cache alias, whenever objects are saved."""
+    _aliases.add(alias)
+    updates.register(sync)
@@ -0,0 +1,215 @@
+"""Shared caching of search results, using Django's cache framework.
+
+Cached results are invalidated with a "generation" counter per model: each write to a model
+(once committed) bumps its generation, and results are only reused if the generations of every
+model they searched are unchanged."""
+
+import hashlib
+import json
+import time
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+KEY_PREFIX = "admin_site_search"
+# seconds for which requests wait for results that another request is computing, after a miss
+MISS_WAIT = 2
+# seconds between checks for those results
+MISS_POLL_INTERVAL = 0.05
+
+# cache aliases in which model generations are tracked
+_tracked_aliases: Set[str] = set()
+
+
+def digest(*parts) -> str:
+    """Returns a digest of the (JSON-serialisable) parts, for use in cache keys."""
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+def result_key(*parts) -> str:
+    """Returns the cache key of search results, as a digest of the (JSON-serialisable) parts
+    that the results depend on."""
+    return f"{KEY_PREFIX}:results:{digest(*parts)}"
+
+
+def generation_key(label: str) -> str:
+    """Returns the cache key of the model's generation counter."""
+    return f"{KEY_PREFIX}:generation:{label}"
+
+
+def _new_generation() -> int:
+    """Returns the value for a new (or evicted) generation counter - unique, so that results
+    cached before an eviction are never reused."""
+    return time.time_ns()
+
+
+def get_generations(
+    alias: str, labels: Iterable[str], key: Callable[[str], str] = generation_key
+) -> Dict[str, int]:
+    """Returns the current generation of each model label, initialising any that are missing.
+
+    :param alias: The cache alias.
+    :param labels: Model labels, i.e. "<app_label>.<ObjectName>".
+    :param key: Returns the cache key of a label's counter, e.g. of another kind of
+        generation."""
+    cache = caches[alias]
+    keys = {key(label): label for label in labels}
+    values = cache.get_many(keys)
+
+    missing = [k for k in keys if k not in values]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_generation(), timeout=None)
+        # re-read, in case another process initialised the same keys first
+        values.update(cache.get_many(missing))
+
+    return {keys[k]: v for k, v in values.items()}
+
+
+def bump_generation(alias: str, label: str):
+    """Increments the model's generation, invalidating any results that searched the model.
+
+    :param alias: The cache alias.
+    :param label: Model label, i.e. "<app_label>.<ObjectName>"."""
+    cache = caches[alias]
+    key = generation_key(label)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # missing (or evicted), so any new value is a bump - unless another process got there
+        if not cache.add(key, _new_generation(), timeout=None):
+            cache.incr(key)
+
+
+def bump_on_commit(using: str, *model_classes):
+    """Bumps the generations of the model classes (and their concrete models), once the current
+    transaction is committed - so that results cached in the meantime are invalidated."""
+    labels = set()
+    for model_class in model_classes:
+        labels.add(model_class._meta.label)
+        labels.add(model_class._meta.concrete_model._meta.label)
+
+    def bump():
+        for alias in list(_tracked_aliases):
+            for label in labels:
+                bump_generation(alias, label)
+
+    transaction.on_commit(bump, using=using)
+
+
+def _on_save_or_delete(sender, using, **kwargs):
+    """post_save/post_delete receiver, bumping the model's generation"""
+    bump_on_commit(using, sender)
+
+
+def _on_m2m_changed(sender, instance, action, model, using, **kwargs):
+    """m2m_changed receiver, bumping the generation of models on both sides of the relation"""
+    if action.startswith("post_"):
+        bump_on_commit(using, type(instance), model)
+
+
+def track_generations(alias: str):
+    """Starts bumping model generations in the cache alias, whenever a model is written to.
+
+    :param alias: The cache alias."""
+    if alias in _tracked_aliases:
+        return
+
+    _tracked_aliases.add(alias)
+    uid = f"{KEY_PREFIX}:generations"
+    post_save.connect(_on_save_or_delete, dispatch_uid=uid)
+    post_delete.connect(_on_save_or_delete, dispatch_uid=uid)
+    m2m_changed.connect(_on_m2m_changed, dispatch_uid=uid)
+
+
+class CacheTicket(NamedTuple):
+    """Returned on a cache miss: the key and generations to store freshly computed results
+    with"""
+
+    key: str
+    generations: Dict[str, int]
+
+
+class SearchResultCache:
+    """Caches (serialised) search results, supporting stale-while-revalidate: once an entry's
+    timeout has passed, a single request refreshes it, while others are served the stale
+    entry for up to stale_timeout seconds. Likewise, if there's no (valid) entry, a single
+    request computes it, while others wait for up to MISS_WAIT seconds for it to be stored"""
+
+    def __init__(self, alias: str, timeout: int, stale_timeout: int = 0):
+        """:param alias: The cache alias.
+        :param timeout: Seconds for which an entry is fresh.
+        :param stale_timeout: Seconds, after the timeout, for which a stale entry can be served
+        while it's refreshed."""
+        self.alias = alias
+        self.timeout = timeout
+        self.stale_timeout = stale_timeout
+        track_generations(alias)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(
+        self, key: str, labels: Iterable[str]
+    ) -> Tuple[Optional[bytes], Optional[CacheTicket]]:
+        """Returns a (content, ticket) pair. If the ticket is non-None, the caller should compute
+        the results and pass them to set() with the ticket.
+
+        :param key: The entry's cache key.
+        :param labels: Labels of all models that the results depend on."""
+        generations = get_generations(self.alias, labels)
+        entry = self.cache.get(key)
+        lock_timeout = max(self.stale_timeout, 1)
+
+        if entry and entry["generations"] == generations:
+            if time.time() < entry["refresh_at"]:
+                return entry["content"], None
+
+            # stale: one request refreshes the entry, while the others are served stale content
+            if not self.cache.add(f"{key}:lock", 1, timeout=lock_timeout):
+                return entry["content"], None
+        elif not self.cache.add(f"{key}:lock", 1, timeout=lock_timeout):
+            # missing (or invalidated): another request is computing the entry, so wait for it,
+            # rather than every request computing the same results at once
+            content = self._wait(key, generations)
+            if content is not None:
+                return content, None
+
+        return None, CacheTicket(key=key, generations=generations)
+
+    def _wait(self, key: str, generations: Dict[str, int]) -> Optional[bytes]:
+        """Returns the content of the entry, once it's stored (with the generations) by the
+        request holding its lock - or None if it isn't within MISS_WAIT seconds, or the lock
+        is released without storing it."""
+        deadline = time.monotonic() + MISS_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(MISS_POLL_INTERVAL)
+            entry = self.cache.get(key)
+            if entry and entry["generations"] == generations:
+                return entry["content"]
+            if self.cache.get(f"{key}:lock") is None:
+                return None
+        return None
+
+    def set(self, ticket: CacheTicket, content: bytes):
+        """Stores the content, computed after a cache miss.
+
+        :param ticket: The ticket returned by get().
+        :param content: The serialised results."""
+        entry = {
+            "content": content,
+            "generations": ticket.generations,
+            "refresh_at": time.time() + self.timeout,
+        }
+        self.cache.set(ticket.key, entry, timeout=self.timeout + self.stale_timeout)
+        self.release(ticket)
+
+    def release(self, ticket: CacheTicket):
+        """Releases the entry's lock without storing content, e.g. since the results are
+        partial - so that waiting requests compute them.
+
+        :param ticket: The ticket returned by get()."""
+        self.cache.delete(f"{ticket.key}:lock")
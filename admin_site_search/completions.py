@@ -0,0 +1,171 @@
+"""Type-ahead completions, as per site_search_completions: a sorted vocabulary of each model's
+Char field values, weighted by the number of objects with each - from which the most frequent
+values starting with a prefix are returned, without querying the database.
+
+A vocabulary is held in a few flat arrays: its (UTF-8 encoded) terms in case-insensitive order,
+their weights, and a segment tree of the heaviest term in each range. A prefix's terms are the
+range found by bisecting the terms, and its top N are found by repeatedly taking the heaviest
+term of a range, then splitting the range around it - so neither depends on the size of the
+range (i.e. how common the prefix is)."""
+
+import heapq
+from array import array
+from typing import Dict, Iterable, List, Tuple, Type
+
+from django.db.models import Model
+
+from admin_site_search.trigrams import (
+    CHUNK_SIZE,
+    TrigramIndexRegistry,
+    compact_offsets,
+)
+
+# values longer than this (e.g. URLs, or descriptions) aren't completions
+MAX_LENGTH = 64
+# sorts after every character, so that prefix + END bounds the terms starting with prefix
+END = "\U0010ffff"
+
+
+class Vocabulary:
+    """A sorted, weighted vocabulary of terms"""
+
+    def __init__(self, weighted_terms: Iterable[Tuple[str, int]]):
+        """:param weighted_terms: (term, weight) pairs. Terms that only differ by case are
+        combined, keeping the first one's case."""
+        weights: Dict[str, int] = {}
+        terms: Dict[str, str] = {}
+        for term, weight in weighted_terms:
+            key = term.lower()
+            terms.setdefault(key, term)
+            weights[key] = weights.get(key, 0) + weight
+
+        keys = sorted(terms)
+        encoded = [terms[key].encode() for key in keys]
+        self._terms = b"".join(encoded)
+        self._term_offsets = compact_offsets(_cumulative(len(t) for t in encoded))
+        self._weights = array("Q", (weights[key] for key in keys))
+
+        # the index of the heaviest term in each node's range, where node i has children 2i
+        # and 2i + 1, and the leaves (terms) are nodes len(terms) onwards
+        size = len(keys)
+        tree = array("I" if size < 2**32 else "Q", [0]) * size
+        tree.extend(range(size))
+        weights = self._weights
+        for node in range(size - 1, 0, -1):
+            a, b = tree[2 * node], tree[2 * node + 1]
+            tree[node] = b if weights[b] > weights[a] else a
+        self._tree = tree
+
+    def __len__(self) -> int:
+        return len(self._weights)
+
+    def nbytes(self) -> int:
+        """Returns the number of bytes held by the vocabulary's arrays."""
+        return (
+            len(self._terms)
+            + self._term_offsets.itemsize * len(self._term_offsets)
+            + self._weights.itemsize * len(self._weights)
+            + self._tree.itemsize * len(self._tree)
+        )
+
+    def _term(self, number: int) -> str:
+        start, end = self._term_offsets[number], self._term_offsets[number + 1]
+        return self._terms[start:end].decode()
+
+    def _heavier(self, a: int, b: int) -> int:
+        """Returns the heavier of two terms (by number), or the earlier if they're as heavy."""
+        weight_a, weight_b = self._weights[a], self._weights[b]
+        return b if weight_b > weight_a or (weight_b == weight_a and b < a) else a
+
+    def _bisect(self, key: str) -> int:
+        """Returns the number of the first term that isn't before the (lowercased) key."""
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle).lower() < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _heaviest(self, low: int, high: int) -> int:
+        """Returns the number of the heaviest term in the range [low, high), which must not be
+        empty."""
+        size = len(self)
+        best = None
+        low, high = low + size, high + size
+        while low < high:
+            if low & 1:
+                node = self._tree[low]
+                best = node if best is None else self._heavier(best, node)
+                low += 1
+            if high & 1:
+                high -= 1
+                node = self._tree[high]
+                best = node if best is None else self._heavier(best, node)
+            low >>= 1
+            high >>= 1
+        return best
+
+    def complete(self, prefix: str, limit: int) -> List[Tuple[str, int]]:
+        """Returns the (term, weight) of up to limit terms starting with the (case-insensitive)
+        prefix, heaviest (then first in order) first."""
+        prefix = prefix.lower()
+        low, high = self._bisect(prefix), self._bisect(prefix + END)
+        completions = []
+
+        # (-weight, number, low, high) of the heaviest term of each range that's left
+        ranges = []
+        if low < high:
+            number = self._heaviest(low, high)
+            ranges.append((-self._weights[number], number, low, high))
+
+        while ranges and len(completions) < limit:
+            weight, number, low, high = heapq.heappop(ranges)
+            completions.append((self._term(number), -weight))
+            for range_low, range_high in [(low, number), (number + 1, high)]:
+                if range_low < range_high:
+                    best = self._heaviest(range_low, range_high)
+                    heapq.heappush(
+                        ranges, (-self._weights[best], best, range_low, range_high)
+                    )
+
+        return completions
+
+
+def _cumulative(lengths: Iterable[int]) -> Iterable[int]:
+    """Yields the running total of the lengths, starting with 0."""
+    total = 0
+    yield total
+    for length in lengths:
+        total += length
+        yield total
+
+
+def build_vocabulary(
+    model_class: Type[Model], field_names: Tuple[str, ...]
+) -> Vocabulary:
+    """Returns a new Vocabulary of the model class' (stripped) Char field values, weighted by
+    the number of objects with each. Values longer than MAX_LENGTH are left out.
+
+    :param model_class: The model class.
+    :param field_names: The names of the fields, whose values are completions."""
+    if not field_names:
+        # values_list() would return every field
+        return Vocabulary([])
+
+    counts: Dict[str, int] = {}
+    rows = model_class._default_manager.values_list(*field_names).iterator(
+        chunk_size=CHUNK_SIZE
+    )
+    for values in rows:
+        for value in {str(v).strip() for v in values if v is not None}:
+            if value and len(value) <= MAX_LENGTH:
+                counts[value] = counts.get(value, 0) + 1
+
+    return Vocabulary(counts.items())
+
+
+class VocabularyRegistry(TrigramIndexRegistry):
+    """Lazily builds, and caches, a Vocabulary for each model class - rebuilding it (in the
+    background) whenever the model's generation changes, as per TrigramIndexRegistry"""
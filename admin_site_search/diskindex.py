@@ -0,0 +1,381 @@
+"""An on-disk trigram index, opened with mmap so that it's shared between processes (via the page
+cache) and loads without being rebuilt. Used by the "in_memory_index" site_search_method, if
+site_search_index_path is set.
+
+The file holds a JSON header, followed by one or more sections for each model - i.e. one per
+part, if the model was built in parts (by pk range) - each with:
+
+- A sorted term dictionary: fixed-width (trigram, offset, count, size) entries, looked up with a
+  binary search.
+- Postings: the (ascending) document numbers of each trigram, delta and varint encoded.
+- A document table: the offset of each document in the data blob.
+- A data blob: each document's pk and display name (length-prefixed), and lowercased (or, if
+  the section is "folded", folded) text.
+
+Documents are matched without decoding any text, i.e. the UTF-8 query is searched for in the
+mapped bytes."""
+
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Tuple
+
+from admin_site_search.postings import (
+    decode_postings,
+    decode_varint,
+    encode_postings,
+    encode_varint,
+)
+from admin_site_search.folding import fold
+from admin_site_search.trigrams import object_text, trigrams
+
+MAGIC = b"ASSIDX"
+VERSION = 2
+# magic, version, and header size
+PREFIX = struct.Struct("<6sHI")
+# trigrams are padded to 12 bytes, i.e. 3 characters of up to 4 bytes each (in UTF-8)
+TERM = struct.Struct("<12sQII")
+OFFSET = struct.Struct("<Q")
+
+
+class MappedRow(NamedTuple):
+    """A matched document: used in place of the model instance when building results"""
+
+    pk: str
+    name: str
+
+    def __str__(self) -> str:
+        return self.name
+
+
+def _section(
+    rows: Iterable[Tuple[Any, str, Iterable]], folded: bool
+) -> Tuple[dict, List[bytes]]:
+    """Returns the (sizes, parts) of a model's section, from (pk, name, values) rows. Rows
+    without any text can't be matched, so are left out."""
+    postings: Dict[bytes, List[int]] = {}
+    offsets = bytearray()
+    blob = bytearray()
+    count = 0
+
+    for pk, name, values in rows:
+        text = object_text(values, folded)
+        if not text:
+            continue
+
+        offsets += OFFSET.pack(len(blob))
+        for part in [str(pk), str(name)]:
+            encoded = part.encode()
+            encode_varint(len(encoded), blob)
+            blob += encoded
+        blob += text.encode()
+
+        for trigram in trigrams(text):
+            postings.setdefault(trigram.encode(), []).append(count)
+        count += 1
+
+    offsets += OFFSET.pack(len(blob))
+
+    terms = bytearray()
+    data = bytearray()
+    for term in sorted(postings):
+        encoded = encode_postings(postings[term])
+        terms += TERM.pack(term, len(data), len(postings[term]), len(encoded))
+        data += encoded
+
+    sizes = {"docs": count, "terms": len(postings), "folded": folded}
+    return sizes, [bytes(terms), bytes(data), bytes(offsets), bytes(blob)]
+
+
+def write_index(
+    path: str,
+    models: Iterable[Tuple[str, Iterable[Tuple[Any, str, Iterable]]]],
+    folded: bool = False,
+):
+    """Writes an index file, replacing any existing file atomically - so processes that already
+    have it open keep reading the old file.
+
+    :param path: The file path.
+    :param models: (label, rows) pairs, where rows are (pk, display name, values) tuples.
+    :param folded: Index folded text (see admin_site_search.folding), which queries of the
+    file are then folded to match."""
+    sections = {}
+    parts = []
+    # offsets are relative to the end of the header
+    position = 0
+
+    for label, rows in models:
+        sizes, section_parts = _section(rows, folded)
+        offsets = {}
+        for key, part in zip(["terms", "postings", "offsets", "blob"], section_parts):
+            offsets[f"{key}_offset"] = position
+            position += len(part)
+        sections[label] = [{**sizes, **offsets}]
+        parts.extend(section_parts)
+
+    def write(f):
+        for part in parts:
+            f.write(part)
+
+    _write_file(path, {"models": sections}, write)
+
+
+def _read_header(f) -> Tuple[dict, int]:
+    """Returns the (header, data offset) of an open index file."""
+    prefix = f.read(PREFIX.size)
+    if len(prefix) < PREFIX.size:
+        raise ValueError(f"{f.name} isn't a search index file")
+
+    magic, version, header_size = PREFIX.unpack(prefix)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{f.name} isn't a (version {VERSION}) search index file")
+
+    return json.loads(f.read(header_size)), PREFIX.size + header_size
+
+
+def index_counts(path: str) -> Dict[str, int]:
+    """Returns the number of documents of each model in an index file, from its header."""
+    with open(path, "rb") as f:
+        header, _ = _read_header(f)
+    return {
+        label: sum(section["docs"] for section in sections)
+        for label, sections in header["models"].items()
+    }
+
+
+def merge_index(paths: Iterable[str], path: str):
+    """Writes an index file containing every section of the given index files (e.g. one per
+    model, or per part of a model), replacing any existing file atomically. Sections are copied
+    as-is, so memory use doesn't depend on the size of the files - and the sections of a model
+    in multiple files are kept in the order of the paths.
+
+    :param paths: Paths of the index files to merge.
+    :param path: The file path."""
+    sources = []
+    sections = {}
+    # offsets are relative to the end of the header
+    position = 0
+
+    for source in paths:
+        with open(source, "rb") as f:
+            header, data_offset = _read_header(f)
+        size = os.path.getsize(source) - data_offset
+        for label, label_sections in header["models"].items():
+            sections.setdefault(label, []).extend(
+                {
+                    key: value + position if key.endswith("_offset") else value
+                    for key, value in section.items()
+                }
+                for section in label_sections
+            )
+        sources.append((source, data_offset))
+        position += size
+
+    def write(f):
+        for source, data_offset in sources:
+            with open(source, "rb") as source_file:
+                source_file.seek(data_offset)
+                shutil.copyfileobj(source_file, f)
+
+    _write_file(path, {"models": sections}, write)
+
+
+def _write_file(path: str, header: dict, write: Callable):
+    """Writes an index file, with the header followed by the data written by write(f) - to a
+    temporary file that then replaces any existing file atomically."""
+    encoded = json.dumps(header).encode()
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".site-search-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(PREFIX.pack(MAGIC, VERSION, len(encoded)))
+            f.write(encoded)
+            write(f)
+        # mkstemp() creates files that only the owner can read
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class _MappedSection:
+    """A single model's section of a mapped index file"""
+
+    def __init__(self, buffer: mmap.mmap, base: int, section: dict):
+        self._buffer = buffer
+        self._docs = section["docs"]
+        self._terms = section["terms"]
+        self._terms_offset = base + section["terms_offset"]
+        self._postings_offset = base + section["postings_offset"]
+        self._offsets_offset = base + section["offsets_offset"]
+        self._blob_offset = base + section["blob_offset"]
+        self._folded = section["folded"]
+        # the sorted terms, for bisect - a view over the mapped bytes
+        self._keys = _TermKeys(buffer, self._terms_offset, self._terms)
+
+    def _postings(self, term: bytes) -> List[int]:
+        """Returns the document numbers of the term, or an empty list if it isn't indexed."""
+        key = term.ljust(12, b"\x00")
+        i = bisect_left(self._keys, key)
+        if i == self._terms or self._keys[i] != key:
+            return []
+
+        _, offset, count, _ = TERM.unpack_from(
+            self._buffer, self._terms_offset + i * TERM.size
+        )
+        return decode_postings(self._buffer, self._postings_offset + offset, count)
+
+    def _document(self, number: int) -> Tuple[int, int]:
+        """Returns the (start, end) positions of the document in the buffer."""
+        position = self._offsets_offset + number * OFFSET.size
+        start, end = struct.unpack_from("<QQ", self._buffer, position)
+        return self._blob_offset + start, self._blob_offset + end
+
+    def _parts(self, start: int) -> List[Tuple[int, int]]:
+        """Returns the (start, end) positions of the pk, display name, and text of the document
+        starting at the position."""
+        parts = []
+        position = start
+        for _ in range(2):
+            size, position = decode_varint(self._buffer, position)
+            parts.append((position, position + size))
+            position += size
+        return parts + [(position, None)]
+
+    def _row(self, parts: List[Tuple[int, int]]) -> MappedRow:
+        """Returns the row of a document, from its parts."""
+        return MappedRow(*[self._buffer[s:e].decode() for s, e in parts[:2]])
+
+    def __len__(self) -> int:
+        return self._docs
+
+    def nbytes(self) -> int:
+        """Returns the size of the section, in bytes."""
+        (blob_size,) = OFFSET.unpack_from(
+            self._buffer, self._offsets_offset + self._docs * OFFSET.size
+        )
+        return self._blob_offset + blob_size - self._terms_offset
+
+    def match_all(self, terms: Iterable[str], limit: int = 5) -> List[MappedRow]:
+        """Returns up to limit documents containing every one of the (case-insensitive) terms,
+        in index order - as per TrigramIndex.match_all()."""
+        normalise = fold if self._folded else str.lower
+        _terms = [normalise(term) for term in terms]
+        if not _terms or not all(_terms):
+            return []
+
+        query_trigrams = set().union(*(trigrams(term) for term in _terms))
+        if query_trigrams:
+            postings = [self._postings(t.encode()) for t in query_trigrams]
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                if not candidates:
+                    break
+                candidates.intersection_update(posting)
+            candidates = sorted(candidates)
+        else:
+            candidates = range(self._docs)
+
+        needles = [term.encode() for term in _terms]
+        rows = []
+        for number in candidates:
+            start, end = self._document(number)
+            parts = self._parts(start)
+            text_start = parts[2][0]
+            if all(self._buffer.find(n, text_start, end) != -1 for n in needles):
+                rows.append(self._row(parts))
+                if len(rows) == limit:
+                    break
+
+        return rows
+
+
+class _MappedModel:
+    """A model's sections of a mapped index file, matched in order"""
+
+    def __init__(self, sections: List[_MappedSection]):
+        self._sections = sections
+
+    def __len__(self) -> int:
+        return sum(len(section) for section in self._sections)
+
+    def nbytes(self) -> int:
+        """Returns the size of the model's sections, in bytes."""
+        return sum(section.nbytes() for section in self._sections)
+
+    def match(self, query: str, limit: int = 5) -> List[MappedRow]:
+        """Returns up to limit documents containing the (case-insensitive) query, in index
+        order."""
+        return self.match_all([query], limit)
+
+    def match_all(self, terms: Iterable[str], limit: int = 5) -> List[MappedRow]:
+        """Returns up to limit documents containing every one of the (case-insensitive) terms,
+        in index order."""
+        rows = []
+        for section in self._sections:
+            rows.extend(section.match_all(terms, limit - len(rows)))
+            if len(rows) == limit:
+                break
+        return rows
+
+
+class _TermKeys:
+    """A read-only sequence of a section's (padded) terms, for bisect"""
+
+    def __init__(self, buffer: mmap.mmap, offset: int, count: int):
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> bytes:
+        position = self._offset + i * TERM.size
+        return self._buffer[position : position + 12]
+
+
+class MappedIndex:
+    """An index file, mapped into memory (read-only)"""
+
+    def __init__(self, path: str):
+        """:param path: The file path, as written by write_index()."""
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            header, base = _read_header(f)
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # identifies the file, so that a replaced file can be detected
+        self.signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        # labels are interned, since they're also the keys of other (per model) mappings
+        self._models = {
+            sys.intern(label): _MappedModel(
+                [_MappedSection(self._buffer, base, section) for section in sections]
+            )
+            for label, sections in header["models"].items()
+        }
+
+    def __contains__(self, label: str) -> bool:
+        return label in self._models
+
+    def section(self, label: str) -> _MappedModel:
+        """Returns the section(s) of the model label, i.e. "<app_label>.<ObjectName>"."""
+        return self._models[label]
+
+    def close(self):
+        """Unmaps the file. Not needed when a file is replaced, since the mapping is closed once
+        the (last reference to the) old index is garbage collected."""
+        self._buffer.close()
+
+
+def file_signature(path: str) -> Tuple[int, int, int]:
+    """Returns the signature of the file at the path, as per MappedIndex.signature."""
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
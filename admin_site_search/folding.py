@@ -0,0 +1,36 @@
+"""Accent- and case-folding of searchable text, as per site_search_fold_text: indexes store a
+folded copy of each object's text (when it's written), and queries are folded the same way - so
+"odegaard" and "ØDEGAARD" both match "Ødegaard", with plain comparisons of the folded strings.
+
+Text is casefolded, decomposed (NFKD) and stripped of combining marks, e.g. accents. Letters
+that don't decompose into a base letter and a mark, e.g. "ø" or "ł", are mapped to their base
+letter(s) by FOLDINGS."""
+
+import unicodedata
+
+# casefolded letters without a decomposition, and their folded equivalent
+FOLDINGS = str.maketrans(
+    {
+        "æ": "ae",
+        "đ": "d",
+        "ð": "d",
+        "ħ": "h",
+        "ı": "i",
+        "ł": "l",
+        "ø": "o",
+        "œ": "oe",
+        "þ": "th",
+        "ŧ": "t",
+    }
+)
+
+
+def fold(text: str) -> str:
+    """Returns the text casefolded, and without accents (or other combining marks)."""
+    if text.isascii():
+        # i.e. nothing to decompose, and casefold() is the same as lower()
+        return text.lower()
+
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return stripped.translate(FOLDINGS)
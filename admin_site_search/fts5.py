@@ -0,0 +1,689 @@
+"""A SQLite FTS5 index of each model's searchable text, used by the "sqlite_fts5"
+site_search_method to match objects in all models with a single MATCH query (per database).
+
+The index is a virtual table, in each model's database, with one row per object: its model
+label, pk, and the values of its Char fields. A model is indexed in full by the
+build_site_search_index command - or, once it's searched, in a background thread - in chunks that
+are each committed in a short transaction, so SQLite's (single) writer lock isn't held for the
+whole build. Until its last chunk is committed, a model isn't matched (so searches use per-model
+queries), but its rows are kept in sync on save/delete - in batches, once committed, as per
+admin_site_search.updates. Background builds are claimed in the cache, so each model is built by
+a single process.
+
+If site_search_fold_text is set, each model is indexed (and searched) under a shadow label, e.g.
+"teams.Team:folded", whose rows hold folded text (see admin_site_search.folding) - so folded
+queries are matched without folding any row at query time.
+
+Each database has numbered generations of the index, each in its own table, of which one is
+active (i.e. searched). Rebuilds are made side by side: a new generation is built (while writes
+are synced to both), validated, then made active with a single UPDATE - so searches never see a
+partially built index. Retired generations are dropped after a grace period, once searches that
+were already running against them have finished."""
+
+import logging
+import time
+from contextlib import contextmanager
+from threading import Lock, Thread
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Type
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Model
+
+from admin_site_search import updates
+from admin_site_search.cache import KEY_PREFIX, digest
+from admin_site_search.folding import fold
+from admin_site_search.plans import build_search_plan
+
+# the prefix of each generation's table, i.e. "<TABLE>_<generation>"
+TABLE = "admin_site_search_fts5"
+# each generation, with its state: "building", "active", or "retired" (with the time retired)
+GENERATIONS_TABLE = "admin_site_search_fts5_generations"
+# labels of the models being indexed (built = 0), or indexed in full (built = 1), per generation
+MODELS_TABLE = "admin_site_search_fts5_models"
+# FTS5's trigram tokenizer can't match queries shorter than this, so they're matched with LIKE
+MIN_MATCH_LENGTH = 3
+# default number of rows read (and inserted) per query, when indexing a model in full
+CHUNK_SIZE = 2000
+# appended to a model's label, for its rows of folded text
+FOLDED_SUFFIX = ":folded"
+# seconds for which a model's first build is claimed, e.g. if the building process dies
+BUILD_CLAIM_TIMEOUT = 600
+# set to build models that are searched before they're indexed in a background thread - so they're
+# matched with per-model queries meanwhile, rather than the search waiting for the build
+BACKGROUND_BUILDS = True
+
+logger = logging.getLogger(__name__)
+
+# database alias -> thread building models that were searched before they were indexed
+_builds: Dict[str, Thread] = {}
+_builds_lock = Lock()
+
+
+def is_supported(using: str) -> bool:
+    """Returns True if the database can hold the index, i.e. is SQLite."""
+    return connections[using].vendor == "sqlite"
+
+
+def index_field_names(model_class: Type[Model]) -> List[str]:
+    """Returns the names of the fields whose values are indexed, i.e. the Char fields searched
+    by the default filter_field()."""
+    return list(build_search_plan(model_class, None).field_names)
+
+
+def object_text(values: Iterable, folded: bool = False) -> str:
+    """Returns the indexed text of an object, from its field values. Values are separated by a
+    newline, so that (in practice) no query can match across two of them.
+
+    :param values: The field values.
+    :param folded: Fold the text (see admin_site_search.folding)."""
+    text = "\n".join(str(v) for v in values if v is not None and v != "")
+    return fold(text) if folded else text
+
+
+def index_label(label: str, folded: bool = False) -> str:
+    """Returns the label under which the model is indexed, i.e. its shadow label if folded."""
+    return f"{label}{FOLDED_SUFFIX}" if folded else label
+
+
+def table_name(generation: int) -> str:
+    """Returns the name of the generation's index table."""
+    return f"{TABLE}_{int(generation)}"
+
+
+def _create_index_table(cursor, generation: int):
+    """Creates the generation's index table, if it doesn't already exist."""
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table_name(generation)} "
+        f"USING fts5(label UNINDEXED, pk UNINDEXED, body, tokenize='trigram')"
+    )
+
+
+def ensure_tables(using: str) -> int:
+    """Creates the index tables, and an active generation, if they don't already exist. Once
+    they do, this is a single SELECT (of the active generation).
+
+    :return: The active generation."""
+    try:
+        generation = active_generation(using)
+    except DatabaseError:
+        # i.e. the tables don't exist yet
+        generation = None
+    if generation is not None:
+        return generation
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {GENERATIONS_TABLE} "
+            f"(generation INTEGER PRIMARY KEY, state TEXT NOT NULL, retired REAL)"
+        )
+        # i.e. at most one generation is active
+        cursor.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {GENERATIONS_TABLE}_active "
+            f"ON {GENERATIONS_TABLE} (state) WHERE state = 'active'"
+        )
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {MODELS_TABLE} "
+            f"(generation INTEGER, label TEXT, built INTEGER NOT NULL DEFAULT 1, "
+            f"PRIMARY KEY (generation, label))"
+        )
+
+    generation = active_generation(using)
+    if generation is None:
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"INSERT OR IGNORE INTO {GENERATIONS_TABLE} (state) VALUES ('active')"
+            )
+        generation = active_generation(using)
+        with connections[using].cursor() as cursor:
+            _create_index_table(cursor, generation)
+
+    return generation
+
+
+def active_generation(using: str) -> Optional[int]:
+    """Returns the active (i.e. searched) generation, or None if there isn't one yet."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"SELECT generation FROM {GENERATIONS_TABLE} WHERE state = 'active'"
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def building_generation(using: str) -> Optional[int]:
+    """Returns the latest generation that's being built, or None if there isn't one."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"SELECT MAX(generation) FROM {GENERATIONS_TABLE} WHERE state = 'building'"
+        )
+        return cursor.fetchone()[0]
+
+
+def indexed_labels(
+    using: str, labels: Iterable[str], generation: Optional[int] = None
+) -> Set[str]:
+    """Returns the model labels (of those given) that have been indexed in full, in the
+    generation (defaults to the active generation)."""
+    labels = list(labels)
+    if generation is None:
+        generation = active_generation(using)
+    if not labels or generation is None:
+        return set()
+
+    placeholders = ", ".join(["%s"] * len(labels))
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"SELECT label FROM {MODELS_TABLE} "
+            f"WHERE generation = %s AND built = 1 AND label IN ({placeholders})",
+            [generation, *labels],
+        )
+        return {label for (label,) in cursor.fetchall()}
+
+
+def build(
+    model_class: Type[Model],
+    using: str,
+    chunk_size: int = CHUNK_SIZE,
+    generation: Optional[int] = None,
+    folded: bool = False,
+) -> int:
+    """(Re)indexes every object of the model class, then marks it as indexed. Objects are read
+    (and inserted) in chunks, ordered by pk, each in its own transaction - so memory use, and
+    the time for which the database is locked, don't depend on the number of objects. Objects
+    written meanwhile are synced (see sync) as soon as the build has started.
+
+    :param model_class: The model class.
+    :param using: The database alias.
+    :param chunk_size: The number of objects read (and inserted) per query.
+    :param generation: The generation to build (defaults to the active generation).
+    :param folded: Index folded text, under the model's shadow label.
+    :return: The number of objects indexed."""
+    if generation is None:
+        generation = ensure_tables(using)
+
+    label = index_label(model_class._meta.label, folded)
+    table = table_name(generation)
+    queryset = (
+        model_class._default_manager.using(using)
+        .order_by("pk")
+        .values_list("pk", *index_field_names(model_class))
+    )
+    model_params = [generation, label]
+    model_condition = "generation = %s AND label = %s"
+
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            # i.e. not matched, but synced, until it's built
+            cursor.execute(
+                f"INSERT OR REPLACE INTO {MODELS_TABLE} (generation, label, built) "
+                f"VALUES (%s, %s, 0)",
+                model_params,
+            )
+            cursor.execute(f"DELETE FROM {table} WHERE label = %s", [label])
+
+    count = 0
+    last_pk = None
+    while True:
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                # writing first takes the writer lock, so no object in the chunk can be
+                # written (and synced) between reading it and inserting its row
+                cursor.execute(
+                    f"UPDATE {MODELS_TABLE} SET built = 0 WHERE {model_condition}",
+                    model_params,
+                )
+                chunk_queryset = (
+                    queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+                )
+                chunk = list(chunk_queryset[:chunk_size])
+                if not chunk:
+                    cursor.execute(
+                        f"UPDATE {MODELS_TABLE} SET built = 1 WHERE {model_condition}",
+                        model_params,
+                    )
+                    return count
+
+                # rows of objects synced since the build started are replaced
+                pks = [str(pk) for pk, *_ in chunk]
+                pk_placeholders = ", ".join(["%s"] * len(pks))
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE label = %s AND pk IN ({pk_placeholders})",
+                    [label, *pks],
+                )
+                _insert(
+                    cursor,
+                    table,
+                    [
+                        (label, str(pk), object_text(values, folded))
+                        for pk, *values in chunk
+                    ],
+                )
+        count += len(chunk)
+        last_pk = chunk[-1][0]
+
+
+def ensure_indexed(
+    model_classes: Iterable[Type[Model]], using: str, folded: bool = False
+) -> int:
+    """Indexes each model class in full (in the active generation), unless it's already been
+    indexed - with folded text, under its shadow label, if folded.
+
+    :return: The active generation."""
+    return index_missing(model_classes, using, folded)[0]
+
+
+def index_missing(
+    model_classes: Iterable[Type[Model]],
+    using: str,
+    folded: bool = False,
+    claim_alias: Optional[str] = None,
+    background: bool = False,
+) -> Tuple[int, Set[str]]:
+    """Indexes each model class in full (in the active generation), unless it's already been
+    indexed - as per ensure_indexed(). If claim_alias is given, each model's build is claimed
+    in that cache first, and models being built elsewhere (i.e. whose claim fails) are skipped.
+    If background is set, models are built in a background thread (see start_builds), so are
+    left out of the returned labels until a later call.
+
+    :return: The active generation, and the labels of the models indexed in it."""
+    track_index_writes()
+    generation = ensure_tables(using)
+
+    labels = {index_label(m._meta.label, folded): m for m in model_classes}
+    indexed = indexed_labels(using, labels, generation)
+
+    if background:
+        missing = [m for label, m in labels.items() if label not in indexed]
+        if missing:
+            start_builds(missing, using, generation, folded, claim_alias)
+        return generation, indexed
+
+    for label, model_class in labels.items():
+        if label in indexed:
+            continue
+        if claim_alias is None:
+            build(model_class, using, generation=generation, folded=folded)
+            indexed.add(label)
+            continue
+        with claim_build(claim_alias, using, generation, label) as claimed:
+            if claimed:
+                build(model_class, using, generation=generation, folded=folded)
+                indexed.add(label)
+
+    return generation, indexed
+
+
+def start_builds(
+    model_classes: Iterable[Type[Model]],
+    using: str,
+    generation: int,
+    folded: bool = False,
+    claim_alias: Optional[str] = None,
+):
+    """Starts indexing the model classes in full (as per build), one after another, in a
+    background thread - unless this process is already building models in the database, in
+    which case they're left to a later call. If claim_alias is given, each model's build is
+    claimed in that cache first, and skipped if it's being built elsewhere. Errors are logged,
+    i.e. the model is built again once it's next searched."""
+    with _builds_lock:
+        if using in _builds:
+            return
+        thread = Thread(
+            target=_build_in_background,
+            args=(list(model_classes), using, generation, folded, claim_alias),
+            daemon=True,
+        )
+        _builds[using] = thread
+    thread.start()
+
+
+def _build_in_background(
+    model_classes: List[Type[Model]],
+    using: str,
+    generation: int,
+    folded: bool,
+    claim_alias: Optional[str],
+):
+    """Builds the model classes in the generation, as per start_builds()."""
+    try:
+        for model_class in model_classes:
+            label = index_label(model_class._meta.label, folded)
+            try:
+                if claim_alias is None:
+                    build(model_class, using, generation=generation, folded=folded)
+                    continue
+                with claim_build(claim_alias, using, generation, label) as claimed:
+                    if claimed:
+                        build(model_class, using, generation=generation, folded=folded)
+            except Exception:
+                logger.exception("Failed to index %s in the background", label)
+    finally:
+        with _builds_lock:
+            _builds.pop(using, None)
+        # connections are thread-local, so close them before the thread exits
+        connections.close_all()
+
+
+def join_builds():
+    """Waits for any background builds (see start_builds) to finish."""
+    for thread in list(_builds.values()):
+        thread.join()
+
+
+@contextmanager
+def claim_build(alias: str, using: str, generation: int, label: str) -> Iterator[bool]:
+    """Claims the build of the model (by label) in the generation, for the duration of the
+    context - yielding False if it's already claimed, e.g. by another process.
+
+    :param alias: The cache alias, shared by the processes that may build the model.
+    :param using: The database alias."""
+    cache = caches[alias]
+    key = f"{KEY_PREFIX}:fts5-build:{digest(using, generation, label)}"
+    claimed = cache.add(key, True, timeout=BUILD_CLAIM_TIMEOUT)
+    try:
+        yield claimed
+    finally:
+        if claimed:
+            cache.delete(key)
+
+
+def start_generation(using: str, rebuild_labels: Iterable[str]) -> int:
+    """Creates a generation to build, alongside the active one - which is searched until the
+    new generation is activated. Models indexed in the active generation are copied to it,
+    other than those to rebuild. Any generations left by previous (interrupted) builds are
+    dropped.
+
+    :param using: The database alias.
+    :param rebuild_labels: Labels of the models to rebuild, rather than copy.
+    :return: The new generation."""
+    active = ensure_tables(using)
+    for generation in _generations(using, "building"):
+        drop_generation(using, generation)
+
+    rebuild_labels = list(rebuild_labels)
+    placeholders = ", ".join(["%s"] * len(rebuild_labels))
+    condition = f"AND label NOT IN ({placeholders})" if rebuild_labels else ""
+
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {GENERATIONS_TABLE} (state) VALUES ('building')"
+            )
+            generation = cursor.lastrowid
+            _create_index_table(cursor, generation)
+
+            cursor.execute(
+                f"INSERT INTO {MODELS_TABLE} (generation, label) "
+                f"SELECT %s, label FROM {MODELS_TABLE} "
+                f"WHERE generation = %s AND built = 1 {condition}",
+                [generation, active, *rebuild_labels],
+            )
+            cursor.execute(
+                f"INSERT INTO {table_name(generation)} (label, pk, body) "
+                f"SELECT label, pk, body FROM {table_name(active)} "
+                f"WHERE label IN (SELECT label FROM {MODELS_TABLE} WHERE generation = %s)",
+                [generation],
+            )
+
+    return generation
+
+
+def validate(
+    using: str,
+    generation: int,
+    model_classes: Iterable[Type[Model]],
+    folded: bool = False,
+):
+    """Checks that the generation has a row for every object of each model class (under its
+    shadow label, if folded).
+
+    :raises ValueError: If any model class hasn't been indexed, or its number of rows differs
+    from its number of objects."""
+    model_classes = list(model_classes)
+    labels = [index_label(m._meta.label, folded) for m in model_classes]
+    indexed = indexed_labels(using, labels, generation)
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"SELECT label, COUNT(*) FROM {table_name(generation)} GROUP BY label"
+        )
+        counts = dict(cursor.fetchall())
+
+    for model_class, label in zip(model_classes, labels):
+        if label not in indexed:
+            raise ValueError(f"{label} hasn't been indexed in generation {generation}")
+        expected = model_class._default_manager.using(using).count()
+        if counts.get(label, 0) != expected:
+            raise ValueError(
+                f"{label} has {counts.get(label, 0)} rows in generation {generation}, "
+                f"but {expected} objects"
+            )
+
+
+def activate(using: str, generation: int):
+    """Makes the generation active, and retires the previously active one, atomically -
+    i.e. every search uses one or the other in full."""
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {GENERATIONS_TABLE} SET state = 'retired', retired = %s "
+                f"WHERE state = 'active'",
+                [time.time()],
+            )
+            cursor.execute(
+                f"UPDATE {GENERATIONS_TABLE} SET state = 'active' WHERE generation = %s",
+                [generation],
+            )
+
+
+def drop_generation(using: str, generation: int):
+    """Drops the generation's index table, and forgets it."""
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {table_name(generation)}")
+            cursor.execute(
+                f"DELETE FROM {MODELS_TABLE} WHERE generation = %s", [generation]
+            )
+            cursor.execute(
+                f"DELETE FROM {GENERATIONS_TABLE} WHERE generation = %s", [generation]
+            )
+
+
+def collect_garbage(using: str, grace_period: float) -> List[int]:
+    """Drops the generations that were retired more than grace_period seconds ago.
+
+    :return: The dropped generations."""
+    ensure_tables(using)
+    retired_before = time.time() - grace_period
+    generations = [
+        generation
+        for generation, retired in _generations(using, "retired", with_retired=True)
+        if retired <= retired_before
+    ]
+    for generation in generations:
+        drop_generation(using, generation)
+    return generations
+
+
+def _generations(using: str, state: str, with_retired: bool = False) -> list:
+    """Returns the generations in the state - as (generation, retired) pairs, if
+    with_retired."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"SELECT generation, retired FROM {GENERATIONS_TABLE} "
+            f"WHERE state = %s ORDER BY generation",
+            [state],
+        )
+        rows = cursor.fetchall()
+    return rows if with_retired else [generation for generation, _ in rows]
+
+
+def match(
+    using: str,
+    query: str,
+    labels: Iterable[str],
+    limit: int = 5,
+    generation: Optional[int] = None,
+):
+    """Returns the (string) pks of up to limit objects matching the query, for each model label,
+    ordered by relevance (bm25). Matching is case-insensitive, as per the trigram tokenizer. To
+    match regardless of accents, pass shadow labels (see index_label), and a folded query.
+
+    :param using: The database alias.
+    :param query: The search query string.
+    :param labels: Labels of the (indexed) models to match.
+    :param limit: The maximum number of pks per model.
+    :param generation: The generation to match (defaults to the active generation)."""
+    return match_all(using, [query], labels, limit, generation)
+
+
+def match_all(
+    using: str,
+    terms: Iterable[str],
+    labels: Iterable[str],
+    limit: int = 5,
+    generation: Optional[int] = None,
+):
+    """Returns the (string) pks of up to limit objects matching every one of the terms (in any
+    of their fields), for each model label - as per match(). Terms are matched as phrases of a
+    single MATCH expression, joined with AND, other than those too short for the trigram
+    tokenizer, which are matched with LIKE."""
+    terms = list(terms)
+    labels = list(labels)
+    if not labels or not terms or not all(terms):
+        return {}
+
+    if generation is None:
+        generation = active_generation(using)
+    table = table_name(generation)
+
+    conditions = []
+    params = []
+    # phrases, i.e. each term is matched as a single (sub)string
+    phrases = [
+        '"{}"'.format(term.replace('"', '""'))
+        for term in terms
+        if len(term) >= MIN_MATCH_LENGTH
+    ]
+    if phrases:
+        conditions.append(f"{table} MATCH %s")
+        params.append(" AND ".join(phrases))
+        score = f"bm25({table})"
+    else:
+        score = "rowid"
+
+    for term in terms:
+        if len(term) < MIN_MATCH_LENGTH:
+            pattern = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append("body LIKE %s ESCAPE '\\'")
+            params.append(f"%{pattern}%")
+
+    placeholders = ", ".join(["%s"] * len(labels))
+    sql = (
+        f"SELECT label, pk FROM ("
+        f"SELECT label, pk, ROW_NUMBER() OVER (PARTITION BY label ORDER BY score) AS n "
+        f"FROM (SELECT label, pk, {score} AS score FROM {table} "
+        f"WHERE {' AND '.join(conditions)} AND label IN ({placeholders}))"
+        f") WHERE n <= %s ORDER BY label, n"
+    )
+
+    matched_pks: Dict[str, List[str]] = {}
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, [*params, *labels, limit])
+        for label, pk in cursor.fetchall():
+            matched_pks.setdefault(label, []).append(pk)
+
+    return matched_pks
+
+
+def _insert(cursor, table: str, rows: List[tuple]):
+    """Inserts (label, pk, body) rows into the index table."""
+    if rows:
+        cursor.executemany(
+            f"INSERT INTO {table} (label, pk, body) VALUES (%s, %s, %s)", rows
+        )
+
+
+def _related_labels(model_class: Type[Model]) -> List[str]:
+    """Returns the labels of every model sharing the model class' table, i.e. its concrete
+    model and any proxies of it."""
+    concrete_model = model_class._meta.concrete_model
+    return [
+        m._meta.label
+        for m in apps.get_models()
+        if m._meta.concrete_model is concrete_model
+    ]
+
+
+def sync(model_class: Type[Model], pks: List, using: str):
+    """Replaces the rows of the objects with the pks in the index, with their current values -
+    or deletes them, if the objects no longer exist. Each indexed model sharing the objects'
+    table is synced (including its shadow label), in the active generation and any that are
+    being built. Registered as a handler of admin_site_search.updates.
+
+    :param model_class: The (concrete) model class.
+    :param pks: The pks of the objects.
+    :param using: The database alias."""
+    if not is_supported(using):
+        return
+
+    related_labels = _related_labels(model_class)
+    related_labels += [index_label(label, folded=True) for label in related_labels]
+    placeholders = ", ".join(["%s"] * len(related_labels))
+    try:
+        # in a savepoint, so that a missing table doesn't break any outer transaction
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                cursor.execute(
+                    f"SELECT m.generation, m.label FROM {MODELS_TABLE} m "
+                    f"JOIN {GENERATIONS_TABLE} g ON g.generation = m.generation "
+                    f"WHERE g.state IN ('active', 'building') "
+                    f"AND m.label IN ({placeholders})",
+                    related_labels,
+                )
+                # generation -> labels indexed in it
+                generations: Dict[int, List[str]] = {}
+                for generation, label in cursor.fetchall():
+                    generations.setdefault(generation, []).append(label)
+    except DatabaseError:
+        # the index doesn't exist (yet), so there's nothing to sync
+        return
+
+    if not generations:
+        return
+
+    rows = (
+        model_class._default_manager.using(using)
+        .filter(pk__in=pks)
+        .order_by()
+        .values_list("pk", *index_field_names(model_class))
+    )
+    texts = [(str(pk), object_text(values)) for pk, *values in rows]
+    str_pks = [str(pk) for pk in pks]
+    pk_placeholders = ", ".join(["%s"] * len(str_pks))
+
+    with connections[using].cursor() as cursor:
+        for generation, labels in generations.items():
+            table = table_name(generation)
+            label_placeholders = ", ".join(["%s"] * len(labels))
+            cursor.execute(
+                f"DELETE FROM {table} WHERE label IN ({label_placeholders}) "
+                f"AND pk IN ({pk_placeholders})",
+                [*labels, *str_pks],
+            )
+            _insert(
+                cursor,
+                table,
+                [
+                    (label, pk, fold(text) if label.endswith(FOLDED_SUFFIX) else text)
+                    for label in labels
+                    for pk, text in texts
+                ],
+            )
+
+
+def track_index_writes():
+    """Starts syncing the index (in batches), whenever objects are saved or deleted."""
+    updates.register(sync)
@@ -0,0 +1,223 @@
+"""Typo-tolerant matching, as per site_search_fuzzy_max_distance: a term dictionary of each
+model's searchable words, used to expand a query that matched nothing into its nearest variants
+(e.g. "arsneal" into "arsenal") - which are then searched as usual, i.e. with exact lookups
+against the index or database.
+
+Terms near a token are found with a bigram index of the dictionary, which rules out (almost)
+every term without computing its edit distance, rather than with a BK-tree: in Python, a
+BK-tree of tens of thousands of terms takes seconds to build, and still computes thousands of
+distances per lookup."""
+
+import heapq
+import re
+from array import array
+from collections import Counter
+from itertools import islice, product
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Type
+
+from django.db.models import Model
+
+from admin_site_search.trigrams import CHUNK_SIZE, TrigramIndexRegistry
+
+TOKEN = re.compile(r"\w+")
+# terms (and query tokens) shorter than this aren't expanded
+MIN_LENGTH = 3
+# dictionaries keep this many of the most frequent terms
+MAX_TERMS = 50000
+# combinations of token expansions considered per query, for queries of many tokens
+MAX_COMBINATIONS = 1000
+
+
+def tokens(text: str) -> List[str]:
+    """Returns the (lowercased) words in the text."""
+    return TOKEN.findall(text.lower())
+
+
+def distance_limit(token: str, max_distance: int) -> int:
+    """Returns the edit distance allowed for the token: none for fewer than MIN_LENGTH
+    characters, 1 for fewer than 6, otherwise 2 - up to max_distance."""
+    if len(token) < MIN_LENGTH:
+        return 0
+    return min(max_distance, 1 if len(token) < 6 else 2)
+
+
+def levenshtein(a: str, b: str, limit: Optional[int] = None) -> int:
+    """Returns the edit distance between a and b, or limit + 1 once it's known to exceed the
+    limit (if given).
+
+    Computed with Hyyro's bit-parallel algorithm: each column of the edit distance matrix is
+    held as bit vectors (of vertical +1/-1 deltas), so each character of a takes a handful of
+    integer operations, rather than one per character of b."""
+    if len(b) > len(a):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    if not b:
+        return len(a)
+
+    # character -> bit mask of its positions in b
+    peq: Dict[str, int] = {}
+    for i, char in enumerate(b):
+        peq[char] = peq.get(char, 0) | (1 << i)
+
+    mask = (1 << len(b)) - 1
+    last = 1 << (len(b) - 1)
+    positive, negative = mask, 0
+    score = len(b)
+
+    for i, char in enumerate(a):
+        eq = peq.get(char, 0)
+        xv = eq | negative
+        xh = (((eq & positive) + positive) ^ positive) | eq
+        ph = negative | ~(xh | positive)
+        mh = positive & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        if limit is not None and score - (len(a) - 1 - i) > limit:
+            # i.e. it can't decrease to within the limit, by one per remaining character
+            return limit + 1
+        ph = (ph << 1) | 1
+        mh <<= 1
+        positive = (mh | ~(xv | ph)) & mask
+        negative = ph & xv & mask
+
+    return score
+
+
+def bigrams(term: str) -> Set[str]:
+    """Returns the distinct bigrams of the term, padded so that its first and last characters
+    are in two bigrams each (like the others)."""
+    padded = f"${term}$"
+    return {padded[i : i + 2] for i in range(len(padded) - 1)}
+
+
+class TermDictionary:
+    """The terms (i.e. words) of a model's searchable text, with the number of objects that
+    have each - and an index of the terms with each bigram, for finding those near a token"""
+
+    def __init__(self, texts: Iterable[str]):
+        """:param texts: The searchable text of each object."""
+        counts = Counter()
+        for text in texts:
+            counts.update(set(tokens(text)))
+
+        self._counts: Dict[str, int] = {
+            term: count
+            for term, count in counts.most_common(MAX_TERMS)
+            if len(term) >= MIN_LENGTH
+        }
+        self._terms: List[str] = list(self._counts)
+
+        postings: Dict[str, List[int]] = {}
+        for number, term in enumerate(self._terms):
+            for bigram in bigrams(term):
+                postings.setdefault(bigram, []).append(number)
+        self._postings: Dict[str, array] = {
+            bigram: array("I", numbers) for bigram, numbers in postings.items()
+        }
+
+    def __contains__(self, term: str) -> bool:
+        return term in self._counts
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def expand(
+        self, token: str, max_distance: int, limit: int
+    ) -> List[Tuple[str, int]]:
+        """Returns the (term, distance) of up to limit terms within max_distance of the token
+        (other than the token itself), nearest (then most frequent) first.
+
+        Each edit changes at most 2 (padded) bigrams, so a term within max_distance shares at
+        least all but 2 * max_distance of the token's bigrams. Only terms that do are compared
+        with the token, and they're found by counting the terms in its bigrams' postings."""
+        token_bigrams = bigrams(token)
+        threshold = len(token_bigrams) - 2 * max_distance
+
+        if threshold > 0:
+            shared = Counter()
+            for bigram in token_bigrams:
+                shared.update(self._postings.get(bigram, ()))
+            numbers = [n for n, count in shared.items() if count >= threshold]
+        else:
+            # i.e. a short token, which may not share any bigrams with nearby terms
+            numbers = range(len(self._terms))
+
+        candidates = []
+        for number in numbers:
+            term = self._terms[number]
+            distance = levenshtein(token, term, max_distance)
+            if 0 < distance <= max_distance:
+                candidates.append((distance, -self._counts[term], term))
+
+        nearest = heapq.nsmallest(limit, candidates)
+        return [(term, distance) for distance, _, term in nearest]
+
+    def variants(
+        self, query: str, max_distance: int, limit: int
+    ) -> List[Tuple[str, int]]:
+        """Returns the (variant, distance) of up to limit variants of the query, in which
+        tokens that aren't terms are replaced by nearby terms - nearest first. Variants are
+        lowercased, but otherwise keep the query's punctuation and spacing.
+
+        :param query: The search query string.
+        :param max_distance: The maximum edit distance, per token.
+        :param limit: The maximum number of variants (and expansions per token)."""
+        query = query.lower()
+        options = []
+        for token in tokens(query):
+            token_limit = distance_limit(token, max_distance)
+            if token in self or token_limit == 0:
+                options.append([(token, 0)])
+            else:
+                # the token may still match as a substring, if another token is expanded
+                options.append([(token, 0), *self.expand(token, token_limit, limit)])
+
+        if all(len(o) == 1 for o in options):
+            return []
+
+        combinations = sorted(
+            (
+                sum(distance for _, distance in combination),
+                [term for term, _ in combination],
+            )
+            for combination in islice(product(*options), MAX_COMBINATIONS)
+        )
+
+        variants = []
+        for distance, terms in combinations:
+            if distance == 0:
+                # i.e. the query itself
+                continue
+            replacements = iter(terms)
+            variants.append((TOKEN.sub(lambda _: next(replacements), query), distance))
+            if len(variants) == limit:
+                break
+
+        return variants
+
+
+def build_term_dictionary(
+    model_class: Type[Model], field_names: Tuple[str, ...]
+) -> TermDictionary:
+    """Returns a new TermDictionary of every object of the model class.
+
+    :param model_class: The model class.
+    :param field_names: The names of the fields, whose values are searchable."""
+    if not field_names:
+        # values_list() would return every field
+        return TermDictionary([])
+
+    rows = model_class._default_manager.values_list(*field_names).iterator(
+        chunk_size=CHUNK_SIZE
+    )
+    return TermDictionary(
+        " ".join(str(v) for v in values if v is not None) for values in rows
+    )
+
+
+class TermDictionaryRegistry(TrigramIndexRegistry):
+    """Lazily builds, and caches, a TermDictionary for each model class - rebuilding it (in
+    the background) whenever the model's generation changes, as per TrigramIndexRegistry"""
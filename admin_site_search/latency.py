@@ -0,0 +1,44 @@
+"""Adaptive debounce of the search modal, as per site_search_debounce_range.
+
+The modal waits for the user to pause typing before searching, for a delay proportional to the
+(moving average) latency of its searches: so sites with fast searches respond sharply, and
+slower ones (or those under load) don't queue up searches that will be superseded anyway. The
+server tracks the latency of its own searches too, and recommends a debounce to the modal (in
+the X-Site-Search-Debounce header), since that reflects its load - from every user."""
+
+from threading import Lock
+from typing import Optional, Tuple
+
+# weight of each new latency in the moving average
+ALPHA = 0.2
+# the debounce, as a multiple of the latency
+FACTOR = 2
+
+
+class SearchLatency:
+    """The exponentially weighted moving average of search latencies, in this process"""
+
+    def __init__(self):
+        self._lock = Lock()
+        # seconds, or None until a search has been recorded
+        self.average: Optional[float] = None
+
+    def record(self, seconds: float):
+        """Adds a search's latency to the average.
+
+        :param seconds: The search's latency."""
+        with self._lock:
+            if self.average is None:
+                self.average = seconds
+            else:
+                self.average += ALPHA * (seconds - self.average)
+
+    def debounce(self, debounce_range: Tuple[int, int]) -> Optional[int]:
+        """Returns the recommended debounce (in ms), within the range - or None until a search
+        has been recorded.
+
+        :param debounce_range: The minimum and maximum debounce (in ms)."""
+        if self.average is None:
+            return None
+        minimum, maximum = debounce_range
+        return max(minimum, min(maximum, round(self.average * 1000 * FACTOR)))
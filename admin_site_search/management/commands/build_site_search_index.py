@@ -0,0 +1,136 @@
+"""Management command for (re)building the search index of an admin site, as per its
+site_search_method: the SQLite FTS5 index, the site_search_index_path file - which can be
+built by a pool of worker processes, with --workers - or model_char_fields bloom filters."""
+
+import time
+from typing import List, Optional, Type
+
+from django.apps import apps
+from django.contrib.admin.sites import all_sites
+from django.contrib.admin.sites import site as default_site
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Model
+
+from admin_site_search.views import AdminSiteSearchView
+
+
+def get_site(name: str) -> AdminSiteSearchView:
+    """Returns the admin site with the name, if it has an AdminSiteSearchView - preferring
+    admin.site, if other sites have the same name (e.g. the default, "admin")."""
+    sites = [
+        site
+        for site in all_sites
+        if site.name == name and isinstance(site, AdminSiteSearchView)
+    ]
+    for site in sites:
+        if default_site == site:
+            return site
+    if sites:
+        return sites[0]
+    raise CommandError(f'No admin site named "{name}" has an AdminSiteSearchView')
+
+
+def get_model_classes(site: AdminSiteSearchView, labels) -> Optional[List[Type[Model]]]:
+    """Returns the model classes with the labels, or None (i.e. all models) if no labels are
+    given."""
+    if not labels:
+        return None
+
+    model_classes = []
+    for label in labels:
+        try:
+            model_class = apps.get_model(label)
+        except (LookupError, ValueError):
+            raise CommandError(f'Unknown model "{label}"')
+        if model_class not in site._registry:
+            raise CommandError(f'"{label}" isn\'t registered with the site')
+        model_classes.append(model_class)
+
+    return model_classes
+
+
+class Command(BaseCommand):
+    """(Re)builds the search index, one model at a time, reporting the rate of each"""
+
+    help = "(Re)build the search index of an admin site"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--site",
+            default="admin",
+            help="The name of the admin site (default: admin).",
+        )
+        parser.add_argument(
+            "--models",
+            nargs="+",
+            metavar="app_label.ModelName",
+            help="Only build these (registered) models.",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Skip models that were built by an interrupted build.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="The number of objects read per query (default: 2000).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Build the index file in this many processes (default: 1).",
+        )
+        parser.add_argument(
+            "--part-size",
+            type=int,
+            default=100000,
+            help=(
+                "With --workers, split models into parts of up to this many objects "
+                "(default: 100000)."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        site = get_site(options["site"])
+        model_classes = get_model_classes(site, options["models"])
+
+        try:
+            builds = site.build_search_index(
+                model_classes=model_classes,
+                resume=options["resume"],
+                chunk_size=options["chunk_size"],
+                workers=options["workers"],
+                part_size=options["part_size"],
+            )
+            start = previous = time.perf_counter()
+            total = 0
+            for model_class, count in builds:
+                end = time.perf_counter()
+                self._report(model_class._meta.label, count, end - previous)
+                previous = end
+                total += count or 0
+        except (ImproperlyConfigured, ValueError) as ex:
+            raise CommandError(str(ex))
+
+        seconds = time.perf_counter() - start
+        rate = total / seconds if seconds else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Built the search index: {total} rows in {seconds:.2f}s "
+                f"({rate:.0f} rows/sec)"
+            )
+        )
+
+    def _report(self, label: str, count, seconds: float):
+        """Writes the outcome of building a single model."""
+        if count is None:
+            self.stdout.write(self.style.WARNING(f"{label}: skipped"))
+        else:
+            rate = count / seconds if seconds else 0
+            self.stdout.write(
+                f"{label}: {count} rows in {seconds:.2f}s ({rate:.0f} rows/sec)"
+            )
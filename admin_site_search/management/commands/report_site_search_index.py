@@ -0,0 +1,55 @@
+"""Management command for reporting the memory used by the in_memory_index index of each model,
+of an admin site."""
+
+from django.core.management import BaseCommand
+
+from admin_site_search.management.commands.build_site_search_index import (
+    get_model_classes,
+    get_site,
+)
+
+
+class Command(BaseCommand):
+    """Reports the size of each model's index, in bytes (and bytes per object)"""
+
+    help = "Report the memory used by the in_memory_index index of each model"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--site",
+            default="admin",
+            help="The name of the admin site (default: admin).",
+        )
+        parser.add_argument(
+            "--models",
+            nargs="+",
+            metavar="app_label.ModelName",
+            help="Only report these (registered) models.",
+        )
+
+    def handle(self, *args, **options):
+        site = get_site(options["site"])
+        model_classes = get_model_classes(site, options["models"])
+
+        total_count = total_bytes = 0
+        for model_class, count, nbytes, mapped in site.search_index_sizes(
+            model_classes
+        ):
+            source = "mapped" if mapped else "in-process"
+            self.stdout.write(
+                f"{model_class._meta.label}: {nbytes} bytes for {count} rows "
+                f"({self._per_row(nbytes, count)} bytes/row, {source})"
+            )
+            total_count += count
+            total_bytes += nbytes
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Total: {total_bytes} bytes for {total_count} rows "
+                f"({self._per_row(total_bytes, total_count)} bytes/row)"
+            )
+        )
+
+    def _per_row(self, nbytes: int, count: int) -> str:
+        """Returns the number of bytes per row, formatted."""
+        return f"{nbytes / count:.1f}" if count else "-"
@@ -0,0 +1,100 @@
+"""A short-lived, per-user memo of each model's matched objects, used to answer queries that
+extend the previous query (i.e. while the user is typing) without querying the database.
+
+With case-insensitive substring matching, a query can only match objects that also match any
+prefix of it. So if a model had fewer matches than the limit for a prefix, those are the only
+candidates - and they can be filtered in Python instead. Entries are discarded as soon as the
+generation of any model the user can view changes, as per admin_site_search.cache."""
+
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from django.core.cache import caches
+
+from admin_site_search.cache import (
+    KEY_PREFIX,
+    digest,
+    get_generations,
+    track_generations,
+)
+
+
+def memo_key(*parts) -> str:
+    """Returns the cache key of a memo, as a digest of the (JSON-serialisable) parts that
+    identify it, e.g. the user."""
+    return f"{KEY_PREFIX}:memo:{digest(*parts)}"
+
+
+class MemoRow(NamedTuple):
+    """A memoised object: used in place of the model instance when building results"""
+
+    pk: Any
+    # str(obj), when the object was retrieved
+    name: str
+    # the lowercased values of the fields that queries are matched against
+    values: Tuple[str, ...]
+
+    def __str__(self) -> str:
+        return self.name
+
+    def matches(self, query: str) -> bool:
+        """Returns True if any value contains the (lowercased) query."""
+        return any(query in value for value in self.values)
+
+
+class PrefixMemo:
+    """A user's memo entries, loaded once per request: for each model label, the last query
+    that was searched and all of its (fewer than the limit) matching objects"""
+
+    def __init__(self, alias: str, timeout: int, key: str, labels: Iterable[str]):
+        """:param alias: The cache alias.
+        :param timeout: Seconds for which entries are kept, after the last update.
+        :param key: The memo's cache key, e.g. as per memo_key().
+        :param labels: Labels of all models that the user can view."""
+        self.alias = alias
+        self.timeout = timeout
+        self.key = key
+        track_generations(alias)
+        # read before any objects are retrieved, so that concurrent writes invalidate them
+        self.generations = get_generations(alias, labels)
+
+        memo = caches[alias].get(key)
+        if memo and memo["generations"] == self.generations:
+            self._entries: Dict[str, Tuple[str, List[MemoRow]]] = memo["entries"]
+        else:
+            self._entries = {}
+
+        self._updated = False
+
+    def lookup(
+        self, label: str, query: str, terms: Optional[Sequence[str]] = None
+    ) -> Optional[List[MemoRow]]:
+        """Returns the model's objects matching the (lowercased) query, or None if they can't
+        be determined from the memo.
+
+        :param label: The model label, i.e. "<app_label>.<ObjectName>".
+        :param query: The lowercased search query.
+        :param terms: The (lowercased) terms that objects must all contain, if the query's
+        terms are matched separately (defaults to the query as a whole). Extending a query
+        only extends or adds terms, so its matches are still among the prefix's."""
+        entry = self._entries.get(label)
+        if entry is None or not query.startswith(entry[0]):
+            return None
+
+        terms = [query] if terms is None else terms
+        return [row for row in entry[1] if all(row.matches(t) for t in terms)]
+
+    def record(self, label: str, query: str, rows: List[MemoRow]):
+        """Records the model's objects matching the (lowercased) query, which must be every
+        matching object, i.e. fewer than the limit.
+
+        :param label: The model label, i.e. "<app_label>.<ObjectName>".
+        :param query: The lowercased search query.
+        :param rows: The matching objects."""
+        self._entries[label] = (query, rows)
+        self._updated = True
+
+    def save(self):
+        """Stores the entries, if any were recorded during the request."""
+        if self._updated:
+            memo = {"generations": self.generations, "entries": self._entries}
+            caches[self.alias].set(self.key, memo, timeout=self.timeout)
@@ -0,0 +1,71 @@
+"""A prebuilt index of (lowercased) model metadata, i.e. object and field names, which can be
+matched against a query with a single substring search across all models."""
+
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Hashable, Iterable, List, Set, Tuple, Type
+
+from django.db.models import Field, Model
+
+# separates terms in the index, so that a match can't span two terms (or models)
+SEPARATOR = "\x00"
+
+
+class MetadataIndex:
+    """Concatenates every key's lowercased terms into a single string (blob), and maps match
+    positions in that blob back to keys"""
+
+    def __init__(self, entries: Iterable[Tuple[Hashable, Iterable[str]]]):
+        """:param entries: (key, terms) pairs, where terms are matched case-insensitively."""
+        parts = []
+        position = 0
+
+        self._keys: List[Hashable] = []
+        self._starts: List[int] = []
+
+        for key, terms in entries:
+            part = SEPARATOR + SEPARATOR.join(str(t).lower() for t in terms if t)
+            self._keys.append(key)
+            self._starts.append(position)
+            parts.append(part)
+            position += len(part)
+
+        self._blob = "".join(parts)
+        self._key_set = set(self._keys)
+        self.match = lru_cache(maxsize=256)(self._match)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._key_set
+
+    def _match(self, query: str) -> Set[Hashable]:
+        """Returns the keys with at least one term containing the (case-insensitive) query."""
+        _query = query.lower()
+        if not _query or SEPARATOR in _query:
+            return set()
+
+        matches = set()
+        position = self._blob.find(_query)
+
+        while position != -1:
+            i = bisect_right(self._starts, position) - 1
+            matches.add(self._keys[i])
+
+            if i + 1 == len(self._starts):
+                break
+            # skip to the next key, since this one is already matched
+            position = self._blob.find(_query, self._starts[i + 1])
+
+        return matches
+
+
+def model_metadata_terms(
+    model_class: Type[Model], fields: Iterable[Field]
+) -> List[str]:
+    """Returns the terms matched by the default match_model(): the model's class name, and the
+    name, verbose name and help text of each field."""
+    terms = [model_class._meta.object_name]
+    for field in fields:
+        terms.append(field.name)
+        terms.append(getattr(field, "verbose_name", ""))
+        terms.append(getattr(field, "help_text", ""))
+    return terms
@@ -0,0 +1,138 @@
+"""Parallel builds of the in_memory_index file, as per build_search_index(workers=...).
+
+The build is split into parts: one per model, or - for models with more than part_size objects -
+one per range of pks. Each part is written to its own segment file by a pool of worker
+processes, each with its own database connections - and its own instance of the admin site,
+imported from its dotted path (since spawned workers don't inherit it) - after which the
+segments are merged into the index file (in which a model built in parts has a section per part,
+in pk order).
+
+A model's pk ranges are saved alongside its segments, so that a resumed build writes the same
+parts - even if objects have been created or deleted since."""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import escape, glob
+from typing import Any, Iterator, List, NamedTuple, Optional, Tuple, Type
+
+import django
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Model
+from django.utils.module_loading import import_string
+
+
+class Part(NamedTuple):
+    """A part of a model, written to its own segment file"""
+
+    label: str
+    # the segment file
+    path: str
+    # the (low, high) pks of the part, where low is inclusive and high is exclusive - either of
+    # which may be None, i.e. unbounded. None if the part is the whole model
+    bounds: Optional[Tuple[Any, Any]] = None
+
+
+def plan_parts(
+    model_class: Type[Model], directory: str, part_size: Optional[int] = None
+) -> List[Part]:
+    """Returns the parts of the model class, in pk order: those saved by a previous build,
+    if any, otherwise one part per part_size objects - or a single part, if part_size is None
+    (or the model has fewer objects).
+
+    :param model_class: The model class.
+    :param directory: The directory of the segment files.
+    :param part_size: The maximum number of objects per part (optional)."""
+    label = model_class._meta.label
+    plan_path = os.path.join(directory, f"{label}.parts.json")
+
+    if os.path.exists(plan_path):
+        with open(plan_path) as f:
+            boundaries = json.load(f)
+    elif part_size:
+        boundaries = _boundaries(model_class, part_size)
+        if boundaries:
+            with open(plan_path, "w") as f:
+                json.dump(boundaries, f, cls=DjangoJSONEncoder)
+    else:
+        boundaries = []
+
+    if not boundaries:
+        return [Part(label, os.path.join(directory, f"{label}.idx"))]
+
+    lows = [None, *boundaries]
+    highs = [*boundaries, None]
+    return [
+        Part(label, os.path.join(directory, f"{label}.{i:05d}.idx"), (low, high))
+        for i, (low, high) in enumerate(zip(lows, highs))
+    ]
+
+
+def remove_parts(model_class: Type[Model], directory: str):
+    """Removes the model class' segment files, and saved parts, from the directory."""
+    label = escape(model_class._meta.label)
+    paths = [
+        *glob(os.path.join(directory, f"{label}.idx")),
+        *glob(os.path.join(directory, f"{label}.[0-9]*.idx")),
+        *glob(os.path.join(directory, f"{label}.parts.json")),
+    ]
+    for path in paths:
+        os.remove(path)
+
+
+def _boundaries(model_class: Type[Model], part_size: int) -> list:
+    """Returns the first pk of each part (but the first) of the model class, i.e. of every
+    part_size objects in pk order. Each is found from the last, so no query scans more than
+    part_size rows."""
+    pks = model_class._default_manager.order_by("pk").values_list("pk", flat=True)
+    boundaries = []
+
+    while True:
+        queryset = pks.filter(pk__gte=boundaries[-1]) if boundaries else pks
+        try:
+            boundaries.append(queryset[part_size])
+        except IndexError:
+            return boundaries
+
+
+def build_parts(
+    site_path: str, parts: List[Part], chunk_size: int, workers: int
+) -> Iterator[Tuple[Part, int]]:
+    """Writes the segment file of each part, in a pool of worker processes, yielding each part
+    with its number of objects once it's written (in order of completion).
+
+    :param site_path: The dotted path of the admin site, which writes each part.
+    :param parts: The parts to write.
+    :param chunk_size: The number of objects read per query.
+    :param workers: The number of worker processes."""
+    # so that (forked) workers don't share the connections, but open their own
+    connections.close_all()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = {
+            executor.submit(build_part, site_path, part, chunk_size): part
+            for part in parts
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def build_part(site_path: str, part: Part, chunk_size: int) -> int:
+    """Writes the segment file of the part, in a worker process.
+
+    :param site_path: The dotted path of the admin site, e.g. "django.contrib.admin.site".
+    :return: The number of objects written."""
+    site = import_string(site_path)
+    try:
+        return site._write_segment(apps.get_model(part.label), part, chunk_size)
+    finally:
+        connections.close_all()
+
+
+def _init_worker():
+    """Sets up Django in worker processes that don't inherit it, i.e. that are spawned
+    rather than forked."""
+    if not apps.ready:
+        django.setup()
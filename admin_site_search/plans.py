@@ -0,0 +1,95 @@
+"""Search plans: everything needed to search a model's objects, that doesn't change between
+requests - built once per model, then reused."""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+from django.contrib.admin import ModelAdmin
+from django.db.models import CharField, Field, Model, Q
+
+
+@dataclass(frozen=True)
+class SearchPlan:
+    """The precompiled search plan for a single model"""
+
+    model_class: Type[Model]
+    # the model's admin, which is non-None for all registered models
+    model_admin: Optional[ModelAdmin]
+    # the model's fields, as per _meta.get_fields()
+    fields: Tuple[Field, ...]
+    # the "<field>__icontains" lookups, for the default filter_field()
+    lookups: Tuple[str, ...]
+
+    def filters(self, query: str) -> Q:
+        """Returns an OR filter across all lookups, bound to the (case-insensitive) query."""
+        _query = query.lower()
+        filters = Q()
+        for lookup in self.lookups:
+            filters |= Q(**{lookup: _query})
+        return filters
+
+    def filters_all(self, terms: Iterable[str]) -> Q:
+        """Returns an AND filter of each term's filters(), i.e. matching objects that contain
+        every term, each in any field. Terms are combined in the order given, e.g. as per
+        split_terms()."""
+        filters = Q()
+        for term in terms:
+            filters &= self.filters(term)
+        return filters
+
+    @property
+    def field_names(self) -> Tuple[str, ...]:
+        """Returns the names of the fields that the lookups filter on."""
+        return tuple(lookup.rsplit("__", 1)[0] for lookup in self.lookups)
+
+
+def split_terms(query: str) -> List[str]:
+    """Returns the (lowercased) whitespace-separated terms of the query, most selective first.
+
+    Selectivity is estimated by length, since longer substrings are rarer - so the database
+    can rule out most rows with the first term. Terms that are contained in another term are
+    left out, since every object that matches the other term matches them too."""
+    # stable, so terms of the same length keep the query's order
+    terms = sorted(dict.fromkeys(query.lower().split()), key=len, reverse=True)
+    selected: List[str] = []
+    for term in terms:
+        if not any(term in other for other in selected):
+            selected.append(term)
+    return selected
+
+
+def build_search_plan(
+    model_class: Type[Model], model_admin: Optional[ModelAdmin]
+) -> SearchPlan:
+    """Returns a new SearchPlan for the model class."""
+    fields = model_class._meta.get_fields()
+    lookups = tuple(
+        f"{field.name}__icontains" for field in fields if isinstance(field, CharField)
+    )
+    return SearchPlan(
+        model_class=model_class, model_admin=model_admin, fields=fields, lookups=lookups
+    )
+
+
+class SearchPlanRegistry:
+    """Lazily builds, and caches, a SearchPlan for each model class"""
+
+    def __init__(self, build: Callable[[Type[Model]], SearchPlan]):
+        """:param build: Callable returning a new plan, for the given model class."""
+        self._build = build
+        self._plans: Dict[Type[Model], SearchPlan] = {}
+
+    def get(self, model_class: Type[Model]) -> SearchPlan:
+        """Returns the (cached) plan for the model class."""
+        plan = self._plans.get(model_class)
+        if plan is None:
+            # worst case, concurrent requests build the same plan more than once
+            plan = self._plans.setdefault(model_class, self._build(model_class))
+        return plan
+
+    def invalidate(self, model_class: Optional[Type[Model]] = None):
+        """Removes the plan for the model class, or all plans if model_class is None."""
+        if model_class is None:
+            self._plans.clear()
+        else:
+            self._plans.pop(model_class, None)
@@ -0,0 +1,52 @@
+"""Compact posting lists, shared by the in-process (admin_site_search.trigrams) and on-disk
+(admin_site_search.diskindex) trigram indexes: the ascending document numbers of a trigram,
+encoded as the deltas between them - each a varint, i.e. 7 bits per byte - so that most take a
+single byte."""
+
+from typing import List, Tuple
+
+
+def encode_varint(value: int, out: bytearray):
+    """Appends the (non-negative) value to out, 7 bits per byte."""
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(buffer, position: int) -> Tuple[int, int]:
+    """Returns the (value, next position) of the varint at the position in the buffer."""
+    value = shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def encode_postings(numbers) -> bytes:
+    """Returns the (ascending) numbers, as varint-encoded deltas."""
+    out = bytearray()
+    previous = 0
+    for number in numbers:
+        delta = number - previous
+        if delta < 0x80:
+            # i.e. a single byte, inlined since it's by far the most common
+            out.append(delta)
+        else:
+            encode_varint(delta, out)
+        previous = number
+    return bytes(out)
+
+
+def decode_postings(buffer, position: int, count: int) -> List[int]:
+    """Returns the count numbers encoded (by encode_postings) at the position in the buffer."""
+    numbers = []
+    number = 0
+    for _ in range(count):
+        delta, position = decode_varint(buffer, position)
+        number += delta
+        numbers.append(number)
+    return numbers
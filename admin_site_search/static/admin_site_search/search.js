@@ -44,13 +44,225 @@ document.addEventListener('alpine:init', () => {
         return path;
     }
 
+    /**
+     * Retrieves the admin completions path from the script element's data-complete-path
+     * attribute, which is only set if completions are enabled (site_search_completions).
+     */
+    function getCompletePath() {
+        return document.getElementById('admin-site-search-script')?.dataset.completePath;
+    }
+
+    /**
+     * A bounded LRU cache of search results, keyed by query. Entries expire after the timeout,
+     * and the least recently used are evicted once there are more than maxEntries, or their
+     * (serialised) size exceeds maxBytes. If storageKey is set, entries are kept in
+     * sessionStorage, so they're reused across page loads in the tab.
+     */
+    class ResultCache {
+        constructor({ timeout, maxEntries, maxBytes, storageKey }) {
+            this.timeout = timeout * 1000;
+            this.maxEntries = maxEntries;
+            this.maxBytes = maxBytes;
+            this.storageKey = storageKey;
+            // query -> { json, size, expiresAt }, least recently used first
+            this.entries = new Map();
+            this.bytes = 0;
+            this.load();
+        }
+
+        /**
+         * Returns the results of the query, or undefined if they aren't cached (or expired).
+         */
+        get(query) {
+            const entry = this.entries.get(query);
+            if (!entry) {
+                return undefined;
+            }
+            this.delete(query);
+            if (entry.expiresAt <= Date.now()) {
+                this.save();
+                return undefined;
+            }
+            // i.e. move to the most recently used end
+            this.insert(query, entry);
+            return JSON.parse(entry.json);
+        }
+
+        /**
+         * Stores the results of the query, then evicts entries beyond the caps.
+         */
+        set(query, data) {
+            const json = JSON.stringify(data);
+            const size = new TextEncoder().encode(json).length;
+            this.delete(query);
+            if (size <= this.maxBytes) {
+                this.insert(query, { json, size, expiresAt: Date.now() + this.timeout });
+            }
+            this.evict();
+            this.save();
+        }
+
+        insert(query, entry) {
+            this.entries.set(query, entry);
+            this.bytes += entry.size;
+        }
+
+        delete(query) {
+            const entry = this.entries.get(query);
+            if (entry) {
+                this.entries.delete(query);
+                this.bytes -= entry.size;
+            }
+        }
+
+        evict() {
+            const now = Date.now();
+            for (const [query, entry] of this.entries) {
+                const overCap = this.entries.size > this.maxEntries || this.bytes > this.maxBytes;
+                if (!overCap && entry.expiresAt > now) {
+                    continue;
+                }
+                this.delete(query);
+            }
+        }
+
+        load() {
+            if (!this.storageKey) {
+                return;
+            }
+            try {
+                const stored = JSON.parse(sessionStorage.getItem(this.storageKey) ?? '[]');
+                for (const [query, entry] of stored) {
+                    this.insert(query, entry);
+                }
+                this.evict();
+            } catch (e) {
+                console.warn("admin-site-search", "Failed to load cached results", e);
+            }
+        }
+
+        save() {
+            if (!this.storageKey) {
+                return;
+            }
+            try {
+                sessionStorage.setItem(this.storageKey, JSON.stringify([...this.entries]));
+            } catch (e) {
+                // e.g. the storage quota is exceeded, so keep the entries in memory only
+                console.warn("admin-site-search", "Failed to store cached results", e);
+            }
+        }
+    }
+
+    /**
+     * Returns the result cache, as per the script element's data-cache-* attributes, which are
+     * only set if it's enabled (site_search_client_cache_timeout) - otherwise, null.
+     */
+    function getResultCache(searchPath) {
+        const dataset = document.getElementById('admin-site-search-script')?.dataset ?? {};
+        const timeout = Number(dataset.cacheTimeout);
+        if (!timeout) {
+            return null;
+        }
+
+        return new ResultCache({
+            timeout: timeout,
+            maxEntries: 100,
+            maxBytes: 512 * 1024,
+            // results depend on the user and language, as well as the query
+            storageKey: 'cachePersist' in dataset
+                ? `admin-site-search:${searchPath}:${dataset.cacheScope}`
+                : null,
+        });
+    }
+
+    /**
+     * The delay after the user stops typing before searching, proportional to the (moving
+     * average) latency of searches - or the server's recommendation, if that's longer, since it
+     * reflects its load from every user. Kept within the script element's data-debounce-min
+     * and data-debounce-max (site_search_debounce_range).
+     */
+    class AdaptiveDebounce {
+        constructor() {
+            const dataset = document.getElementById('admin-site-search-script')?.dataset ?? {};
+            this.min = Number(dataset.debounceMin) || 150;
+            this.max = Number(dataset.debounceMax) || 1000;
+            // weight of each new latency in the moving average
+            this.alpha = 0.2;
+            // the delay, as a multiple of the latency
+            this.factor = 2;
+            // ms, or null until a search has completed
+            this.latency = null;
+            this.hint = null;
+        }
+
+        /**
+         * Returns the delay (in ms), which is 750ms until a search has completed.
+         */
+        delay() {
+            const delay = this.latency === null ? 750 : this.latency * this.factor;
+            return Math.round(Math.max(this.min, Math.min(this.max, delay), this.hint ?? 0));
+        }
+
+        /**
+         * Adds a search's latency to the average, along with the server's recommended delay
+         * (the X-Site-Search-Debounce header) - if any.
+         */
+        record(latency, hint) {
+            if (this.latency === null) {
+                this.latency = latency;
+            } else {
+                this.latency += this.alpha * (latency - this.latency);
+            }
+            const hintNumber = Number(hint);
+            this.hint = hint && hintNumber > 0 ? Math.min(this.max, hintNumber) : null;
+        }
+    }
+
+    /**
+     * Yields each line of the response body, as it's received.
+     */
+    async function* readLines(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            buffer += decoder.decode(value, { stream: !done });
+
+            const lines = buffer.split('\n');
+            // the last line may be incomplete, so keep it until more is received
+            buffer = lines.pop();
+            for (const line of lines) {
+                if (line) {
+                    yield line;
+                }
+            }
+
+            if (done) {
+                break;
+            }
+        }
+    }
+
     /**
      * State/functions for performing searches.
      */
     Alpine.data('siteSearch', () => {
         const adminSearchPath = getSearchPath();
+        const adminCompletePath = getCompletePath();
+        const resultCache = getResultCache(adminSearchPath);
+        const debounce = new AdaptiveDebounce();
         const minChars = 2;
         const resultsEmpty = { apps: [] };
+        // identifies this page's searches, so the server can abandon those that are superseded
+        const pageId = Math.random().toString(36).slice(2);
+        let searchNumber = 0;
+        // aborts the in-flight search (kept out of the reactive state, as it's a native object)
+        let controller = null;
+        // schedules onInputDebounce(), after the debounce's delay
+        let debounceTimer = null;
 
         return {
             /**
@@ -70,56 +282,165 @@ document.addEventListener('alpine:init', () => {
              */
             results: resultsEmpty,
             /**
-             * Fetch search results from /<admin_path>/search/.
+             * Completions of the value, shown until the (debounced) search has results.
+             */
+            completions: [],
+            /**
+             * Fetch search results from /<admin_path>/search/. If they're streamed (i.e.
+             * site_search_stream is True), onApp is called with the results so far as each app
+             * is received.
+             */
+            async fetchResults(onApp) {
+                this.abortSearch();
+                controller = new AbortController();
+                const started = performance.now();
+
+                const response = await fetch(`${adminSearchPath}?q=${encodeURIComponent(this.value)}`, {
+                    signal: controller.signal,
+                    headers: {
+                        Accept: 'application/x-ndjson, application/json',
+                        'X-Site-Search-Sequence': `${pageId}:${++searchNumber}`,
+                    },
+                });
+                const hint = response.headers.get('X-Site-Search-Debounce');
+                if (!response.headers.get('Content-Type')?.startsWith('application/x-ndjson')) {
+                    const data = await response.json();
+                    debounce.record(performance.now() - started, hint);
+                    return data;
+                }
+
+                // an {"app": ...} line per app, then a {"counts": ..., "errors": ..., "partial": ...} line
+                const data = { results: { apps: [] } };
+                for await (const line of readLines(response)) {
+                    const chunk = JSON.parse(line);
+                    if (chunk.app) {
+                        data.results.apps.push(chunk.app);
+                        onApp({ apps: [...data.results.apps] });
+                    } else {
+                        Object.assign(data, chunk);
+                    }
+                }
+                debounce.record(performance.now() - started, hint);
+                return data;
+            },
+            /**
+             * Aborts the in-flight search (if any), since its results would be stale.
              */
-            async fetchResults() {
-                const response = await fetch(`${adminSearchPath}?q=${encodeURIComponent(this.value)}`);
-                return await response.json();
+            abortSearch() {
+                controller?.abort();
+                controller = null;
+            },
+            /**
+             * Fetch completions from /<admin_path>/search/complete/, and show them - unless the
+             * value has changed, or been searched, since.
+             */
+            async fetchCompletions() {
+                const value = this.value;
+                try {
+                    const response = await fetch(`${adminCompletePath}?q=${encodeURIComponent(value)}`);
+                    const data = await response.json();
+                    if (value === this.value && this.helpText === 'Searching...') {
+                        this.completions = data.completions;
+                    }
+                } catch (e) {
+                    console.warn("admin-site-search", "Failed to fetch completions", e);
+                }
+            },
+            /**
+             * Searches for the completion straight away, rather than after the debounce.
+             */
+            selectCompletion(completion) {
+                this.value = completion;
+                this.completions = [];
+                clearTimeout(debounceTimer);
+                this.onInputDebounce();
+                this.focusOnInput();
             },
             /**
              * Perform a search, if the min number of chars are entered, and update loading/error helpText.
-             * This should be debounced/throttled to avoid excessive requests.
+             * This is debounced by onInputInstant(), to avoid excessive requests. Results in the
+             * result cache are shown without a request.
              */
             async onInputDebounce() {
                 if (this.value.length < minChars) {
                     this.results = resultsEmpty;
-                } else {
-                    this.helpText = 'Searching...'
-                    try {
-                        const data = await this.fetchResults();
-                        this.results = data.results;
-
-                        const countApps = data.counts.apps;
-                        const countModels = data.counts.models;
-                        const countObjects = data.counts.objects;
+                    return;
+                }
 
-                        if (data.errors?.length > 0) {
-                            console.warn('Errors occurred during search', data.errors);
-                        }
+                const value = this.value;
+                const cached = resultCache?.get(value);
+                if (cached) {
+                    this.showResults(cached);
+                    return;
+                }
 
-                        if (countApps > 0 || countModels > 0 || countObjects > 0) {
-                            this.helpText = `Showing ${pluralise('app', countApps)}, 
-                            ${pluralise('model', countModels)}, 
-                            and ${pluralise('object', countObjects)}`;
-                        } else {
-                            this.helpText = `No results for "${this.value}"`;
-                        }
-                    } catch (e) {
-                        this.helpText = 'An unexpected error occurred';
-                        console.error("admin-site-search", e);
+                this.helpText = 'Searching...'
+                try {
+                    const data = await this.fetchResults((results) => {
+                        this.results = results;
+                        this.completions = [];
+                    });
+                    this.showResults(data);
+                    // i.e. not if a model failed, even if its error isn't included (DEBUG=False)
+                    if (!data.partial) {
+                        resultCache?.set(value, data);
                     }
+                } catch (e) {
+                    if (e.name === 'AbortError') {
+                        // superseded by a later search, which updates the state instead
+                        return;
+                    }
+                    this.helpText = 'An unexpected error occurred';
+                    console.error("admin-site-search", e);
                 }
             },
             /**
-             * Updates the helpText value, based on the number of chars inputted.
+             * Shows the results, and their counts, in place of the helpText.
+             */
+            showResults(data) {
+                this.results = data.results;
+                this.completions = [];
+
+                const countApps = data.counts.apps;
+                const countModels = data.counts.models;
+                const countObjects = data.counts.objects;
+
+                if (data.errors?.length > 0) {
+                    console.warn('Errors occurred during search', data.errors);
+                }
+
+                if (countApps > 0 || countModels > 0 || countObjects > 0) {
+                    this.helpText = `Showing ${pluralise('app', countApps)}, 
+                    ${pluralise('model', countModels)}, 
+                    and ${pluralise('object', countObjects)}`;
+                } else {
+                    this.helpText = `No results for "${this.value}"`;
+                }
+            },
+            /**
+             * Updates the helpText value, based on the number of chars inputted, and (re)schedules
+             * onInputDebounce() after the debounce's delay.
              */
             onInputInstant() {
+                this.abortSearch();
+                clearTimeout(debounceTimer);
+                debounceTimer = setTimeout(() => this.onInputDebounce(), debounce.delay());
                 this.results = resultsEmpty;
+                this.completions = [];
                 if (this.value.length > 0) {
                     if (this.value.length < minChars) {
                         this.helpText = `Enter ${minChars} or more characters...`;
                     } else {
-                        this.helpText = "Searching...";
+                        const cached = resultCache?.get(this.value);
+                        if (cached) {
+                            // i.e. shown straight away, rather than after the debounce
+                            this.showResults(cached);
+                        } else {
+                            this.helpText = "Searching...";
+                            if (adminCompletePath) {
+                                this.fetchCompletions();
+                            }
+                        }
                     }
                 }
             },
@@ -0,0 +1,551 @@
+"""An in-process trigram index of each model's searchable text, used by the "in_memory_index"
+site_search_method to match objects without querying the database.
+
+Each object's (lowercased) text is split into trigrams, i.e. every substring of 3 characters, and
+a posting list of matching objects is kept per trigram. A query can only be contained in text
+that has every one of its trigrams, so intersecting their posting lists gives the candidates -
+which are then verified with a substring check. Indexes are built in a background thread, the
+first time their model is searched (which is then searched in the database until it's built), and
+rebuilt whenever its generation changes, as per admin_site_search.cache - while the previous index
+is searched - so that searches don't wait for (or repeat) the build. Indexes of the
+in_memory_index method are instead updated with the objects written since they were built: each
+write (as per admin_site_search.updates) is stored in the cache as a numbered delta of pks, which
+every process re-reads into a small index of updated objects - until there are MAX_UPDATES of
+them, or a delta is missing (e.g. evicted), in which case the index is rebuilt.
+
+Indexes are held in a few flat arrays and byte strings, rather than a Python object per
+posting/object, so that they take tens of bytes per object: a sorted vocabulary (of trigrams
+packed into integers) looked up with bisect, delta and varint encoded posting lists, and the
+UTF-8 encoded pks and texts - in which queries are found without decoding them."""
+
+import copy
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from threading import Lock, Thread
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import Model
+
+from admin_site_search import updates
+from admin_site_search.cache import (
+    KEY_PREFIX,
+    generation_key,
+    get_generations,
+    track_generations,
+)
+from admin_site_search.folding import fold
+from admin_site_search.postings import decode_postings, encode_postings
+
+# rows read per query, when building a model's index
+CHUNK_SIZE = 2000
+# once there are this few candidates, they're verified rather than intersected further
+VERIFY_THRESHOLD = 256
+# indexes are rebuilt, rather than updated, once this many objects have been written since
+MAX_UPDATES = 1000
+# seconds for which deltas (of written objects) are kept, for every process to apply
+DELTA_TIMEOUT = 24 * 60 * 60
+
+# cache aliases in which indexes are updated, and so need deltas
+_aliases: Set[str] = set()
+
+
+def trigrams(text: str) -> Set[str]:
+    """Returns every substring of 3 characters in the text."""
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def object_text(values: Iterable, folded: bool = False) -> str:
+    """Returns the indexed text of an object, from its field values. Values are separated by a
+    newline, so that (in practice) no query can match across two of them.
+
+    :param values: The field values.
+    :param folded: Fold the text (see admin_site_search.folding), rather than lowercase it."""
+    text = "\n".join(str(v) for v in values if v is not None and v != "")
+    return fold(text) if folded else text.lower()
+
+
+def counter_key(label: str) -> str:
+    """Returns the cache key of the model's delta counter."""
+    return f"{KEY_PREFIX}:trigrams:{label}:deltas"
+
+
+def delta_key(label: str, number: int) -> str:
+    """Returns the cache key of one of the model's deltas."""
+    return f"{KEY_PREFIX}:trigrams:{label}:delta:{number}"
+
+
+def trigram_key(trigram: str) -> int:
+    """Returns the trigram packed into an integer, i.e. 21 bits per (unicode) character."""
+    a, b, c = trigram
+    return (ord(a) << 42) | (ord(b) << 21) | ord(c)
+
+
+def compact_offsets(values: Iterable[int]) -> array:
+    """Returns the (ascending) offsets as an array of 4 byte integers, or 8 byte integers if
+    they don't fit."""
+    offsets = array("Q", values)
+    if not offsets or offsets[-1] < 2**32:
+        return array("I", offsets)
+    return offsets
+
+
+class TrigramIndex:
+    """A trigram index of a single model's objects, in the order they were given"""
+
+    def __init__(self, rows: Iterable[Tuple[Any, Iterable]], folded: bool = False):
+        """:param rows: (pk, values) pairs, where values are matched case-insensitively.
+        :param folded: Match values (and queries) regardless of accents, too."""
+        self.folded = folded
+        pks = bytearray()
+        texts = bytearray()
+        pk_offsets = array("Q", [0])
+        text_offsets = array("Q", [0])
+        # trigram -> the numbers of the objects with it - which, since objects are added in
+        # order, are ascending
+        postings: Dict[str, array] = {}
+
+        for i, (pk, values) in enumerate(rows):
+            text = object_text(values, folded)
+            pks += str(pk).encode()
+            texts += text.encode()
+            pk_offsets.append(len(pks))
+            text_offsets.append(len(texts))
+            for trigram in trigrams(text):
+                posting = postings.get(trigram)
+                if posting is None:
+                    posting = postings[trigram] = array("I")
+                posting.append(i)
+
+        self._pks = bytes(pks)
+        self._texts = bytes(texts)
+        self._pk_offsets = compact_offsets(pk_offsets)
+        self._text_offsets = compact_offsets(text_offsets)
+
+        # the sorted vocabulary, and each trigram's (position, count) in the postings
+        terms = sorted((trigram_key(t), t) for t in postings)
+        data = bytearray()
+        positions = array("Q")
+        self._counts = array("I")
+        for _, trigram in terms:
+            posting = postings.pop(trigram)
+            positions.append(len(data))
+            self._counts.append(len(posting))
+            data += encode_postings(posting)
+
+        self._terms = array("Q", [key for key, _ in terms])
+        self._positions = compact_offsets(positions)
+        self._postings = bytes(data)
+
+        # the (string) pks of objects written since, which aren't matched - and an index of
+        # those that still exist, matched after the others (see updated())
+        self._written: FrozenSet[str] = frozenset()
+        self._updates: Optional[TrigramIndex] = None
+
+    def __len__(self) -> int:
+        count = len(self._pk_offsets) - 1
+        if self._written:
+            count -= sum(1 for n in range(count) if self._pk(n) in self._written)
+        if self._updates is not None:
+            count += len(self._updates)
+        return count
+
+    def nbytes(self) -> int:
+        """Returns the (approximate) memory used by the index, in bytes."""
+        return sum(
+            sys.getsizeof(value)
+            for value in [
+                self._pks,
+                self._texts,
+                self._pk_offsets,
+                self._text_offsets,
+                self._terms,
+                self._positions,
+                self._counts,
+                self._postings,
+                self._written,
+            ]
+        ) + (self._updates.nbytes() if self._updates is not None else 0)
+
+    def written_count(self) -> int:
+        """Returns the number of objects written since the index was built, as per
+        updated()."""
+        return len(self._written)
+
+    def updated(
+        self, rows: Iterable[Tuple[Any, Iterable]], pks: Iterable
+    ) -> "TrigramIndex":
+        """Returns a copy of the index, updated with written objects without rebuilding it:
+        they're no longer matched in this index, and those that still exist are (re-)added
+        to a small index of updated objects - which is matched after this one.
+
+        :param rows: (pk, values) pairs of the written objects that still exist.
+        :param pks: The pks of the written objects."""
+        written = {str(pk) for pk in pks}
+        previous = []
+        if self._updates is not None:
+            previous = [
+                (pk, [text]) for pk, text in self._updates._rows() if pk not in written
+            ]
+
+        index = copy.copy(self)
+        index._written = self._written | written
+        index._updates = TrigramIndex(previous + list(rows), self.folded)
+        return index
+
+    def _rows(self) -> Iterable[Tuple[str, str]]:
+        """Yields the (string) pk and (normalised) text of every object, in order."""
+        for number in range(len(self._pk_offsets) - 1):
+            start, end = self._text_offsets[number], self._text_offsets[number + 1]
+            yield self._pk(number), self._texts[start:end].decode()
+
+    def _posting(self, trigram: str) -> Optional[Tuple[int, int]]:
+        """Returns the (position, count) of the trigram's posting list, or None if no object
+        has the trigram."""
+        key = trigram_key(trigram)
+        i = bisect_left(self._terms, key)
+        if i == len(self._terms) or self._terms[i] != key:
+            return None
+        return self._positions[i], self._counts[i]
+
+    def _pk(self, number: int) -> str:
+        """Returns the (string) pk of the object."""
+        return self._pks[
+            self._pk_offsets[number] : self._pk_offsets[number + 1]
+        ].decode()
+
+    def _contains(self, number: int, needle: bytes) -> bool:
+        """Returns True if the object's text contains the (UTF-8 encoded) needle."""
+        start, end = self._text_offsets[number], self._text_offsets[number + 1]
+        return self._texts.find(needle, start, end) != -1
+
+    def _scan(self, needle: bytes) -> Iterable[int]:
+        """Yields the numbers of the objects whose text contains the needle, in order, by
+        searching all texts at once."""
+        position = self._texts.find(needle)
+        while position != -1:
+            number = bisect_right(self._text_offsets, position) - 1
+            end = self._text_offsets[number + 1]
+            if position + len(needle) <= end:
+                yield number
+                # i.e. the next object's text
+                position = self._texts.find(needle, end)
+            else:
+                # spans two texts, so try again from the next one
+                position = self._texts.find(needle, position + 1)
+
+    def match(self, query: str, limit: int = 5) -> List[str]:
+        """Returns the (string) pks of up to limit objects containing the (case-insensitive)
+        query, in index order.
+
+        :param query: The search query string.
+        :param limit: The maximum number of pks."""
+        return self.match_all([query], limit)
+
+    def match_all(self, terms: Iterable[str], limit: int = 5) -> List[str]:
+        """Returns the (string) pks of up to limit objects containing every one of the
+        (case-insensitive) terms, in index order. The terms may be in different fields.
+
+        The candidates are the intersection of the posting lists of every term's trigrams,
+        cheapest first - so the rarest trigram of any term narrows the candidates of all.
+
+        :param terms: The search terms, e.g. as per split_terms().
+        :param limit: The maximum number of pks."""
+        terms = list(terms)
+        pks = self._match_all(terms, limit)
+        if self._updates is not None and len(pks) < limit:
+            pks.extend(self._updates.match_all(terms, limit - len(pks)))
+        return pks
+
+    def _match_all(self, terms: List[str], limit: int) -> List[str]:
+        """Returns the (string) pks of up to limit objects containing every one of the terms,
+        as per match_all() - other than written (or updated) objects."""
+        normalise = fold if self.folded else str.lower
+        _terms = [normalise(term) for term in terms]
+        if not _terms or not all(_terms):
+            return []
+
+        needles = [term.encode() for term in _terms]
+        query_trigrams = set().union(*(trigrams(term) for term in _terms))
+        if not query_trigrams:
+            # too short to have trigrams, so every object's text is searched (for the longest)
+            needles.sort(key=len, reverse=True)
+            candidates = self._scan(needles[0])
+        else:
+            postings = [self._posting(t) for t in query_trigrams]
+            if not all(postings):
+                # a trigram that no object has, so nothing can match
+                return []
+
+            # cheapest first, so the candidate set is as small as possible from the start
+            postings.sort(key=lambda posting: posting[1])
+            candidate_set = set(decode_postings(self._postings, *postings[0]))
+            for position, count in postings[1:]:
+                if len(candidate_set) <= VERIFY_THRESHOLD:
+                    # cheaper to verify than to decode more (longer) posting lists
+                    break
+                candidate_set.intersection_update(
+                    decode_postings(self._postings, position, count)
+                )
+            candidates = sorted(candidate_set)
+
+        pks = []
+        for number in candidates:
+            if all(self._contains(number, needle) for needle in needles):
+                pk = self._pk(number)
+                if pk in self._written:
+                    # i.e. it's been updated (or deleted) since
+                    continue
+                pks.append(pk)
+                if len(pks) == limit:
+                    break
+
+        return pks
+
+
+def build_trigram_index(
+    model_class: Type[Model], field_names: Iterable[str], folded: bool = False
+) -> TrigramIndex:
+    """Returns a new TrigramIndex of every object of the model class, in the default order.
+
+    :param model_class: The model class.
+    :param field_names: The names of the fields to index.
+    :param folded: Index folded text, as per TrigramIndex."""
+    rows = model_class._default_manager.values_list("pk", *field_names).iterator(
+        chunk_size=CHUNK_SIZE
+    )
+    return TrigramIndex(((pk, values) for pk, *values in rows), folded)
+
+
+def update_trigram_index(
+    model_class: Type[Model], field_names: Iterable[str], index: TrigramIndex, pks: List
+) -> TrigramIndex:
+    """Returns the index, updated with the objects of the model class with the pks - as per
+    TrigramIndex.updated(), with each object re-read with the same manager as
+    build_trigram_index().
+
+    :param model_class: The model class.
+    :param field_names: The names of the indexed fields.
+    :param index: The model class' index.
+    :param pks: The pks of the written objects."""
+    rows = []
+    for i in range(0, len(pks), updates.BATCH_SIZE):
+        queryset = model_class._default_manager.filter(
+            pk__in=pks[i : i + updates.BATCH_SIZE]
+        )
+        rows.extend(
+            (pk, values) for pk, *values in queryset.values_list("pk", *field_names)
+        )
+    return index.updated(rows, pks)
+
+
+def _related_labels(model_class: Type[Model]) -> List[str]:
+    """Returns the labels of every model sharing the model class' table, i.e. its concrete
+    model and any proxies of it."""
+    concrete_model = model_class._meta.concrete_model
+    return [
+        m._meta.label
+        for m in apps.get_models()
+        if m._meta.concrete_model is concrete_model
+    ]
+
+
+def sync(model_class: Type[Model], pks: List, using: str):
+    """Adds the pks, as a delta of every index of the objects' table - unless no process has
+    an index of it, i.e. there's no delta counter. Registered as a handler of
+    admin_site_search.updates.
+
+    :param model_class: The (concrete) model class.
+    :param pks: The pks of the objects.
+    :param using: The database alias."""
+    labels = _related_labels(model_class)
+    for alias in list(_aliases):
+        cache = caches[alias]
+        counters = cache.get_many([counter_key(label) for label in labels])
+        for label in labels:
+            if counter_key(label) not in counters:
+                continue
+            try:
+                number = cache.incr(counter_key(label))
+            except ValueError:
+                # i.e. evicted since, so there's nothing to add to
+                continue
+            cache.set(delta_key(label, number), list(pks), timeout=DELTA_TIMEOUT)
+
+
+def track_trigram_writes(alias: str):
+    """Starts adding deltas of written objects to the cache alias, for indexes to be updated
+    with."""
+    _aliases.add(alias)
+    updates.register(sync)
+
+
+class TrigramIndexRegistry:
+    """Lazily builds, and caches, a TrigramIndex for each model class - rebuilding it whenever
+    the model's generation changes (or, if it's given an update callable, updating it with
+    each delta of written objects)"""
+
+    # set to (re)build indexes in a background thread, returning the previous index (or none)
+    # meanwhile - otherwise, they're built by the caller of get_many()
+    background = True
+
+    def __init__(
+        self,
+        alias: str,
+        build: Callable[[Type[Model]], TrigramIndex],
+        update: Optional[
+            Callable[[Type[Model], TrigramIndex, List], TrigramIndex]
+        ] = None,
+    ):
+        """:param alias: The cache alias, in which model generations are tracked.
+        :param build: Callable returning a new index, for the given model class.
+        :param update: Callable returning the given index (of the given model class), updated
+            with the objects with the given pks. If it's given, indexes are versioned by the
+            number of the last delta applied to them, rather than by generation."""
+        self.alias = alias
+        self._build = build
+        self._update = update
+        # model class -> (generation - or delta number, if updated - index)
+        self._indexes: Dict[Type[Model], Tuple[int, TrigramIndex]] = {}
+        # model class -> thread (re)building its index
+        self._builds: Dict[Type[Model], Thread] = {}
+        # incremented by invalidate(), so builds started before it are discarded
+        self._epoch = 0
+        self._lock = Lock()
+        if update is None:
+            track_generations(alias)
+        else:
+            track_trigram_writes(alias)
+
+    def get_many(
+        self, model_classes: Iterable[Type[Model]], wait: bool = False
+    ) -> Dict[Type[Model], TrigramIndex]:
+        """Returns the index for each model class, which is built the first time it's needed,
+        and rebuilt once the model's generation changes - or, if update is given, updated with
+        any new deltas (unless they can't be, see _apply_deltas). If background is set,
+        (re)builds are made in a background thread, meanwhile returning the previous index -
+        or, for models that haven't been built yet, leaving them out.
+
+        :param model_classes: The model classes.
+        :param wait: Build missing indexes in the caller, even if background is set."""
+        model_classes = list(model_classes)
+        generations = get_generations(
+            self.alias,
+            [m._meta.label for m in model_classes],
+            key=generation_key if self._update is None else counter_key,
+        )
+        indexes = {}
+
+        for model_class in model_classes:
+            # read before building, so that concurrent writes cause another rebuild
+            generation = generations[model_class._meta.label]
+            entry = self._indexes.get(model_class)
+
+            if entry is not None and entry[0] != generation and self._update:
+                entry = self._apply_deltas(model_class, entry, generation) or entry
+
+            if entry is None and self.background and not wait:
+                # i.e. the caller searches the model in the database, until it's built
+                self._start_build(model_class, generation)
+                continue
+            if entry is None or (entry[0] != generation and not self.background):
+                entry = (generation, self._build(model_class))
+                self._indexes[model_class] = entry
+            elif entry[0] != generation:
+                self._start_build(model_class, generation)
+
+            indexes[model_class] = entry[1]
+
+        return indexes
+
+    def _apply_deltas(
+        self, model_class: Type[Model], entry: Tuple[int, TrigramIndex], counter: int
+    ) -> Optional[Tuple[int, TrigramIndex]]:
+        """Returns the entry, updated with the deltas up to the counter - or None if it
+        should be rebuilt instead: i.e. the counter was reset (e.g. evicted), a delta is
+        missing, there have been more than MAX_UPDATES writes since it was built, or it
+        can't be updated (e.g. the database is unavailable)."""
+        number, index = entry
+        if not number < counter <= number + MAX_UPDATES:
+            return None
+
+        label = model_class._meta.label
+        keys = [delta_key(label, n) for n in range(number + 1, counter + 1)]
+        deltas = caches[self.alias].get_many(keys)
+        if len(deltas) < len(keys):
+            return None
+        pks = list(set().union(*deltas.values()))
+        if index.written_count() + len(pks) > MAX_UPDATES:
+            return None
+
+        try:
+            entry = (counter, self._update(model_class, index, pks))
+        except Exception:
+            # e.g. the database is unavailable, so it's rebuilt (or retried) instead
+            return None
+        with self._lock:
+            if self._indexes.get(model_class) is not None:
+                self._indexes[model_class] = entry
+        return entry
+
+    def _start_build(self, model_class: Type[Model], generation: int):
+        """Starts (re)building the model class' index in a background thread, unless it's
+        already being built."""
+        with self._lock:
+            if model_class in self._builds:
+                return
+            thread = Thread(
+                target=self._build_in_background,
+                args=(model_class, generation, self._epoch),
+                daemon=True,
+            )
+            self._builds[model_class] = thread
+        thread.start()
+
+    def _build_in_background(
+        self, model_class: Type[Model], generation: int, epoch: int
+    ):
+        """(Re)builds the model class' index, replacing any previous one - unless the
+        registry has been invalidated since the build started. Errors are ignored, i.e. the
+        previous index (if any) is returned until a later search starts another build."""
+        try:
+            index = self._build(model_class)
+            with self._lock:
+                if epoch == self._epoch:
+                    self._indexes[model_class] = (generation, index)
+        except Exception:
+            # e.g. the database is unavailable, so keep the previous index
+            pass
+        finally:
+            with self._lock:
+                self._builds.pop(model_class, None)
+            # connections are thread-local, so close them before the thread exits
+            connections.close_all()
+
+    def join(self):
+        """Waits for any background builds to finish."""
+        for thread in list(self._builds.values()):
+            thread.join()
+
+    def invalidate(self, model_class: Optional[Type[Model]] = None):
+        """Removes the index for the model class, or all indexes if model_class is None."""
+        with self._lock:
+            self._epoch += 1
+            if model_class is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(model_class, None)
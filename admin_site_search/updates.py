@@ -0,0 +1,170 @@
+"""Batched, incremental updates of search indexes, whenever objects are written to.
+
+Written objects are recorded as (model, pk) pairs, rather than indexed straight away: they're
+collected for the whole transaction (or savepoint), then flushed to every registered index in
+one batch once it's committed. Since each pk is only recorded once, repeated saves of the same
+object collapse into a single update. Each batch is flushed by its own on-commit callback, so
+it's discarded with the callback if the transaction (or savepoint) is rolled back. Only models
+registered with an admin site are recorded (so not e.g. sessions, or admin log entries), and a
+handler that fails is logged rather than raised - since the write has been committed by then.
+
+Bulk operations that don't send signals, i.e. bulk_create() and QuerySet.update(), should be
+followed by reindex_queryset()."""
+
+import logging
+import threading
+from typing import Callable, Dict, FrozenSet, Iterable, List, Set, Type
+
+from django.contrib.admin.sites import all_sites
+from django.db import transaction
+from django.db.models import Model, QuerySet
+from django.db.models.signals import post_delete, post_save
+
+from admin_site_search.cache import bump_on_commit
+from admin_site_search.plans import build_search_plan
+
+logger = logging.getLogger(__name__)
+
+# flushed in batches of this many pks, to stay below database parameter limits
+BATCH_SIZE = 500
+
+# callables accepting (model_class, pks, using), which sync the objects to an index
+_handlers: List[Callable[[Type[Model], List, str], None]] = []
+_tracking = False
+# per thread, database alias -> batches awaiting commit
+_local = threading.local()
+
+
+class Batch:
+    """The objects recorded in a transaction - or a savepoint within it - which are flushed by
+    its on-commit callback, i.e. the batch itself. If the transaction (or savepoint) is rolled
+    back, Django discards the callback, and so the batch"""
+
+    def __init__(self, using: str, savepoint_ids: FrozenSet[str]):
+        """:param using: The database alias.
+        :param savepoint_ids: The ids of the savepoints that the objects were written in."""
+        self.using = using
+        self.savepoint_ids = savepoint_ids
+        # concrete model -> pks
+        self.pks: Dict[Type[Model], Set] = {}
+
+    def __call__(self):
+        flush(self)
+
+
+def _pending() -> Dict[str, List[Batch]]:
+    """Returns the batches of the current thread, that are awaiting commit."""
+    if not hasattr(_local, "pending"):
+        _local.pending = {}
+    return _local.pending
+
+
+def _awaiting_commit(using: str) -> List[Batch]:
+    """Returns the batches of the current thread for the database, leaving out (and
+    discarding) those whose callback has been discarded - i.e. that were rolled back."""
+    # (as read by Django's captureOnCommitCallbacks)
+    callbacks = transaction.get_connection(using).run_on_commit
+    registered = {id(callback[1]) for callback in callbacks}
+    batches = [b for b in _pending().get(using, []) if id(b) in registered]
+    _pending()[using] = batches
+    return batches
+
+
+def is_indexed(model_class: Type[Model]) -> bool:
+    """Returns True if the model class (or a proxy of it) is registered with any admin site,
+    and has any indexed (i.e. Char) fields."""
+    concrete_model = model_class._meta.concrete_model
+    registered = any(
+        m._meta.concrete_model is concrete_model for s in all_sites for m in s._registry
+    )
+    return registered and bool(build_search_plan(model_class, None).field_names)
+
+
+def register(handler: Callable[[Type[Model], List, str], None]):
+    """Registers a handler, which is flushed batches of written objects - and starts recording
+    written objects.
+
+    :param handler: Callable accepting (model_class, pks, using), which should re-index the
+    objects with the pks, or remove them from the index if they no longer exist."""
+    if handler not in _handlers:
+        _handlers.append(handler)
+    track_writes()
+
+
+def record(model_class: Type[Model], pks: Iterable, using: str):
+    """Records objects as written, to be flushed once the current transaction is committed
+    (or straight away, if there's no transaction).
+
+    :param model_class: The model class.
+    :param pks: The pks of the objects.
+    :param using: The database alias."""
+    if not is_indexed(model_class):
+        # nothing is indexed, so there's nothing to update
+        return
+
+    concrete_model = model_class._meta.concrete_model
+    # objects written in the same savepoint are rolled back together, so share a batch
+    savepoint_ids = frozenset(
+        sid for sid in transaction.get_connection(using).savepoint_ids if sid
+    )
+    batches = _awaiting_commit(using)
+    batch = next((b for b in batches if b.savepoint_ids == savepoint_ids), None)
+    if batch is None:
+        batch = Batch(using, savepoint_ids)
+        batches.append(batch)
+
+    batch.pks.setdefault(concrete_model, set()).update(pks)
+    # one callback per record (called straight away, if there's no transaction) - all but the
+    # first (per commit) find the batch flushed already
+    transaction.on_commit(batch, using=using)
+
+
+def flush(batch: Batch):
+    """Flushes the batch of objects to every handler. Errors are logged, rather than raised,
+    so they don't fail the (committed) write - or stop the other handlers."""
+    batches = _pending().get(batch.using, [])
+    if batch in batches:
+        batches.remove(batch)
+    using = batch.using
+    pending, batch.pks = batch.pks, {}
+
+    for model_class, pks in pending.items():
+        pks = list(pks)
+        for i in range(0, len(pks), BATCH_SIZE):
+            for handler in _handlers:
+                try:
+                    handler(model_class, pks[i : i + BATCH_SIZE], using)
+                except Exception:
+                    logger.exception(
+                        "Failed to flush %s objects to %r",
+                        model_class._meta.label,
+                        handler,
+                    )
+
+
+def reindex_queryset(queryset: QuerySet):
+    """Re-indexes every object in the queryset, once the current transaction is committed.
+    Cached results (and in-process indexes) of the model are also invalidated. Should be
+    called after writes that don't send signals, e.g. bulk_create() or QuerySet.update().
+
+    :param queryset: The objects to re-index."""
+    pks = queryset.values_list("pk", flat=True).iterator(chunk_size=BATCH_SIZE)
+    record(queryset.model, pks, queryset.db)
+    bump_on_commit(queryset.db, queryset.model)
+
+
+def _on_write(sender, instance, using, **kwargs):
+    """post_save/post_delete receiver, recording the written object"""
+    record(sender, [instance.pk], using)
+
+
+def track_writes():
+    """Starts recording objects, whenever they're saved or deleted."""
+    global _tracking
+    if _tracking:
+        return
+
+    _tracking = True
+    uid = "admin_site_search:updates"
+    post_save.connect(_on_write, dispatch_uid=uid)
+    post_delete.connect(_on_write, dispatch_uid=uid)
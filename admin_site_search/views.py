@@ -1,36 +1,402 @@
-from typing import List, Optional
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from functools import partial, update_wrapper
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Collection,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
+import django
+from asgiref.sync import sync_to_async
 from django.apps import apps
 from django.conf import settings
 from django.contrib.admin import ModelAdmin
-from django.db.models import CharField, Field, Model, Q, QuerySet
-from django.http import HttpRequest, JsonResponse
-from django.urls import path
-from typing import Literal
+from django.contrib.admin.sites import site as default_site
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connections, router, transaction
+from django.db.models import CharField, Field, Model, Q, QuerySet, Value
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.functions import Cast
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.urls import path, reverse
+from django.utils import translation
+from django.utils.cache import add_never_cache_headers
 
-SiteSearchMethodType = Literal["model_char_fields", "admin_search_fields"]
+from admin_site_search import fts5, parallel
+from admin_site_search.abandon import (
+    POLL_INTERVAL,
+    SearchAbandoned,
+    SearchSequence,
+    parse_sequence,
+)
+from admin_site_search.backends import (
+    QuerySetBackend,
+    SearchBackend,
+    get_backend_class,
+    is_backend_path,
+    related_models,
+)
+from admin_site_search.bloom import BloomFilterRegistry, track_filter_writes
+from admin_site_search.cache import (
+    CacheTicket,
+    SearchResultCache,
+    result_key,
+    track_generations,
+)
+from admin_site_search.completions import (
+    Vocabulary,
+    VocabularyRegistry,
+    build_vocabulary,
+)
+from admin_site_search.diskindex import (
+    MappedIndex,
+    MappedRow,
+    file_signature,
+    index_counts,
+    merge_index,
+    write_index,
+)
+from admin_site_search.folding import fold
+from admin_site_search.fuzzy import (
+    TermDictionary,
+    TermDictionaryRegistry,
+    build_term_dictionary,
+)
+from admin_site_search.latency import SearchLatency
+from admin_site_search.memo import MemoRow, PrefixMemo, memo_key
+from admin_site_search.metadata import MetadataIndex, model_metadata_terms
+from admin_site_search.plans import (
+    SearchPlan,
+    SearchPlanRegistry,
+    build_search_plan,
+    split_terms,
+)
+from admin_site_search.trigrams import (
+    TrigramIndex,
+    TrigramIndexRegistry,
+    build_trigram_index,
+    track_trigram_writes,
+    update_trigram_index,
+)
+
+# overridable methods that are passed the request, so may match differently for each user
+REQUEST_HOOKS = [
+    "match_app",
+    "match_model",
+    "match_objects",
+    "amatch_objects",
+    "filter_field",
+    "get_model_queryset",
+    "aget_model_queryset",
+    "get_model_class",
+]
+
+# cache backends that aren't shared between processes, so writes in one don't reach the others
+PROCESS_LOCAL_CACHES = [
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+]
+
+# site_search_methods that match against folded text, if site_search_fold_text is set
+FOLDED_METHODS = ["sqlite_fts5", "in_memory_index"]
+
+SiteSearchMethodType = Literal[
+    "model_char_fields", "admin_search_fields", "sqlite_fts5", "in_memory_index"
+]
 
 
 class AdminSiteSearchView:
     """Adds a search/ view, to the admin site"""
 
     site_search_path = "search/"
-    site_search_method: Literal["model_char_fields", "admin_search_fields"] = (
-        "model_char_fields"
-    )
+    # one of SiteSearchMethodType, or the dotted path of a SearchBackend subclass
+    site_search_method: Union[SiteSearchMethodType, str] = "model_char_fields"
+    # set to run each model's search in a thread pool, with this many threads
+    site_search_max_workers: Optional[int] = None
+    # set to route site_search_path to asearch(), instead of search()
+    site_search_async: bool = False
+    # set to stream results as NDJSON, an app at a time, to clients that accept it
+    site_search_stream: bool = False
+    # set to stop searching models for a query once a later one, from the same page, has started
+    site_search_abandon_superseded: bool = False
+    # set to match objects with a single UNION ALL query (model_char_fields, if match_objects isn't
+    # overridden)
+    site_search_union_all: bool = False
+    # set to cache results for this many seconds - shared between users with the same permissions
+    site_search_cache_timeout: Optional[int] = None
+    # seconds, after the timeout, for which stale results are served while one request refreshes
+    site_search_cache_stale_timeout: int = 30
+    # the cache used for results, as per the CACHES setting
+    site_search_cache_alias: str = "default"
+    # set to memoise each user's matches for this many seconds, to answer extended queries
+    site_search_prefix_memo_timeout: Optional[int] = None
+    # set to skip querying models that can't match, as per per-model trigram bloom filters
+    site_search_bloom_filters: bool = False
+    # set to search models without matches for query variants, within this edit distance per word
+    site_search_fuzzy_max_distance: Optional[int] = None
+    # the maximum number of query variants searched, nearest first
+    site_search_fuzzy_max_expansions: int = 3
+    # set to add a search/complete/ route, returning up to this many type-ahead completions
+    site_search_completions: Optional[int] = None
+    # set to reuse results in the browser for this many seconds, e.g. after backspacing
+    site_search_client_cache_timeout: Optional[int] = None
+    # set to keep the browser's results in sessionStorage, i.e. across page loads in a tab
+    site_search_client_cache_persist: bool = False
+    # the range (in ms) of the modal's debounce, which adapts to the latency of searches
+    site_search_debounce_range: Tuple[int, int] = (150, 1000)
+    # set to match objects containing every (whitespace-separated) term of the query, in any field
+    site_search_match_terms: bool = False
+    # set to match sqlite_fts5/in_memory_index queries regardless of accents, against folded text
+    site_search_fold_text: bool = False
+    # set to match in_memory_index queries against this index file, from write_search_index()
+    site_search_index_path: Optional[str] = None
+    # seconds for which retired sqlite_fts5 generations are kept, after a rebuild, before dropped
+    site_search_index_grace_period: int = 600
+    # set to the dotted path of this site, for build workers to import (defaults to admin.site)
+    site_search_import_path: Optional[str] = None
+
+    def __init__(self, *args, **kwargs):
+        """Extends super() to set up the (lazily built) search plans"""
+        super().__init__(*args, **kwargs)
+        self._search_plans = SearchPlanRegistry(self._build_search_plan)
+        # language code -> MetadataIndex
+        self._metadata_indexes = {}
+        # lazily created, since site_search_cache_alias may be set after __init__
+        self._trigram_indexes: Optional[TrigramIndexRegistry] = None
+        self._bloom_filters: Optional[BloomFilterRegistry] = None
+        self._term_dictionaries: Optional[TermDictionaryRegistry] = None
+        self._vocabularies: Optional[VocabularyRegistry] = None
+        # the mapped site_search_index_path, (re)opened on the next search after it's replaced
+        self._mapped_index: Optional[MappedIndex] = None
+        # (site_search_method, backend), recreated if site_search_method is changed
+        self._backend: Optional[Tuple[str, SearchBackend]] = None
+        # the latency of searches, from which the modal's debounce is recommended
+        self._search_latency = SearchLatency()
+
+        if (
+            self.site_search_cache_timeout is not None
+            or self.site_search_prefix_memo_timeout is not None
+            or self.site_search_method == "in_memory_index"
+            or self.site_search_fuzzy_max_distance is not None
+            or self.site_search_completions is not None
+        ):
+            # writes must invalidate results, even in processes that haven't searched yet
+            track_generations(self.site_search_cache_alias)
+
+        if self.site_search_method == "sqlite_fts5":
+            # writes must be synced to the index, even in processes that haven't searched yet
+            fts5.track_index_writes()
+
+        if self.site_search_method == "in_memory_index":
+            # writes must be added to indexes, even in processes that haven't searched yet
+            track_trigram_writes(self.site_search_cache_alias)
+
+        if self.site_search_bloom_filters:
+            # writes must be added to filters, even in processes that haven't searched yet
+            track_filter_writes(self.site_search_cache_alias)
+
+        if is_backend_path(self.site_search_method):
+            # writes must be passed to the backend, even in processes that haven't searched yet
+            self._get_backend()
+
+    def register(self, *args, **kwargs):
+        """Extends super() to invalidate search plans, since model admins may have changed"""
+        super().register(*args, **kwargs)
+        self.invalidate_search_plans()
+
+    def unregister(self, *args, **kwargs):
+        """Extends super() to invalidate search plans, since model admins may have changed"""
+        super().unregister(*args, **kwargs)
+        self.invalidate_search_plans()
+
+    def check(self, app_configs):
+        """Extends super()'s system checks, to warn if features that rely on writes (or
+        searches) being seen by every process use a site_search_cache_alias that isn't shared
+        between them."""
+        errors = super().check(app_configs)
+
+        features = [
+            name
+            for name, enabled in [
+                (
+                    "site_search_cache_timeout",
+                    self.site_search_cache_timeout is not None,
+                ),
+                (
+                    "site_search_prefix_memo_timeout",
+                    self.site_search_prefix_memo_timeout is not None,
+                ),
+                (
+                    'site_search_method = "in_memory_index"',
+                    self.site_search_method == "in_memory_index",
+                ),
+                ("site_search_bloom_filters", self.site_search_bloom_filters),
+                (
+                    "site_search_fuzzy_max_distance",
+                    self.site_search_fuzzy_max_distance is not None,
+                ),
+                ("site_search_completions", self.site_search_completions is not None),
+                ("site_search_abandon_superseded", self.site_search_abandon_superseded),
+            ]
+            if enabled
+        ]
+        alias = self.site_search_cache_alias
+        backend = settings.CACHES.get(alias, {}).get("BACKEND")
+
+        if features and backend in PROCESS_LOCAL_CACHES:
+            errors.append(
+                checks.Warning(
+                    f"{', '.join(features)} rely on the {alias!r} cache "
+                    f"(site_search_cache_alias), which isn't shared between processes.",
+                    hint=(
+                        "Writes in one process won't invalidate the cached results, or "
+                        "indexes, of others - so set site_search_cache_alias to a shared "
+                        "cache (e.g. Redis or Memcached), unless the site is served by a "
+                        "single process."
+                    ),
+                    obj=self,
+                    id="admin_site_search.W001",
+                )
+            )
+
+        if self.site_search_fold_text and self.site_search_method not in FOLDED_METHODS:
+            errors.append(
+                checks.Warning(
+                    f"site_search_fold_text has no effect with site_search_method = "
+                    f"{self.site_search_method!r}, which queries each model's own fields.",
+                    hint=(
+                        'Set site_search_method to "in_memory_index" (or "sqlite_fts5", on '
+                        "SQLite) to match queries regardless of accents and case."
+                    ),
+                    obj=self,
+                    id="admin_site_search.W002",
+                )
+            )
+
+        return errors
+
+    def invalidate_search_plans(self, model_class: Optional[Type[Model]] = None):
+        """Removes the cached search plan for the model class, or all plans if model_class is
+        None. Plans, and the indexes built from them, are rebuilt on the next search.
+
+        :param model_class: The model class (optional)."""
+        self._search_plans.invalidate(model_class)
+        self._metadata_indexes.clear()
+        if self._trigram_indexes:
+            self._trigram_indexes.invalidate(model_class)
+        if self._term_dictionaries:
+            self._term_dictionaries.invalidate(model_class)
+        if self._vocabularies:
+            self._vocabularies.invalidate(model_class)
+
+    def _get_search_plan(self, model_class: Type[Model]) -> SearchPlan:
+        """Returns the cached search plan for the model class."""
+        return self._search_plans.get(model_class)
+
+    def _build_search_plan(self, model_class: Type[Model]) -> SearchPlan:
+        """Returns a new search plan for the model class."""
+        return build_search_plan(model_class, self._registry.get(model_class))
+
+    def _query_terms(self, query: str) -> List[str]:
+        """Returns the terms that objects must contain (each in any field) to match the query:
+        its terms, most selective first, if site_search_match_terms is True - otherwise the
+        query as a whole."""
+        if self.site_search_match_terms:
+            return split_terms(query)
+        return [query]
+
+    def _get_backend(self) -> SearchBackend:
+        """Returns the (prepared) backend of the site_search_method."""
+        method = self.site_search_method
+        if self._backend is None or self._backend[0] != method:
+            backend = get_backend_class(method)(self)
+            backend.prepare()
+            self._backend = (method, backend)
+        return self._backend[1]
+
+    def _matches_models_at_once(self) -> bool:
+        """Returns True if objects are matched for all models at once, rather than by filtering
+        each model's queryset."""
+        return self.site_search_method in ["sqlite_fts5", "in_memory_index"] or not (
+            isinstance(self._get_backend(), QuerySetBackend)
+        )
+
+    def _indexes_match_defaults(self) -> bool:
+        """Returns True if the indexes (of Char fields) match the same objects as
+        match_objects(), i.e. neither it nor filter_field is overridden. Otherwise, models are
+        matched with per-model queries, so customisations keep working."""
+        return not any(
+            self._is_overridden(name)
+            for name in ["match_objects", "amatch_objects", "filter_field"]
+        )
+
+    def _is_overridden(self, name: str) -> bool:
+        """Returns True if the method has been overridden, i.e. precompiled defaults can't be
+        used in its place."""
+        return getattr(type(self), name) is not getattr(AdminSiteSearchView, name)
 
     def get_urls(self):
-        """Extends super()'s urls, to include search/"""
+        """Extends super()'s urls, to include search/ (and search/complete/, if
+        site_search_completions is set)"""
         urlpatterns = super().get_urls()
 
-        search = path(
-            self.site_search_path, self.admin_view(self.search), name="site-search"
-        )
+        if self.site_search_async:
+            view = self._async_admin_view(self.asearch)
+        else:
+            view = self.admin_view(self.search)
+
+        search = path(self.site_search_path, view, name="site-search")
         # avoid append() so that "catch_all_view" is last
         urlpatterns.insert(0, search)
 
+        if self.site_search_completions is not None:
+            complete = path(
+                f"{self.site_search_path}complete/",
+                self.admin_view(self.complete),
+                name="site-search-complete",
+            )
+            urlpatterns.insert(0, complete)
+
         return urlpatterns
 
+    def each_context(self, request: HttpRequest) -> dict:
+        """Extends super()'s context, with whether completions are enabled, the browser's result
+        cache settings, and the range of its debounce (used by the admin_site_search/head.html
+        template)"""
+        context = super().each_context(request)
+        context["site_search_completions"] = self.site_search_completions is not None
+        context["site_search_client_cache_timeout"] = (
+            self.site_search_client_cache_timeout
+        )
+        context["site_search_client_cache_persist"] = (
+            self.site_search_client_cache_persist
+        )
+        context["site_search_debounce_range"] = self.site_search_debounce_range
+        return context
+
     def search(self, request: HttpRequest) -> JsonResponse:
         """Returns a JsonResponse containing results from matching the "q" query parameter to
         application names, model names, and all instance CharFields. Only apps/models that the
@@ -39,89 +405,1764 @@ class AdminSiteSearchView:
         :param request: The HTTPRequest object."""
         query = request.GET.get("q", "")
 
-        results = {"apps": []}
-        counts = {"apps": 0, "models": 0, "objects": 0}
-        errors = []
-
         if not query:
             # missing query, so return empty results
-            return JsonResponse(
-                {"results": results, "counts": counts, "errors": errors}
+            return JsonResponse(self._search_response(request, query, [], []))
+
+        started = time.monotonic()
+        # same app list used to create the admin page for a user
+        app_list = self.get_app_list(request)
+        sequence = self._start_search_sequence(request)
+
+        content, ticket = self._get_cached_content(request, query, app_list)
+        if content is not None:
+            return self._hint_debounce(
+                HttpResponse(content, content_type="application/json")
+            )
+
+        app_models = [(app, model) for app in app_list for model in app["models"]]
+        memo = self._get_prefix_memo(request, query, app_list)
+        skip = self._get_bloom_skips(request, query, app_models)
+
+        if self._accepts_stream(request):
+            outcomes = self._iter_outcomes(
+                request, query, app_models, memo, skip, sequence
+            )
+            return self._hint_debounce(
+                self._stream_response(
+                    self._stream_search(
+                        request, query, app_list, outcomes, ticket, memo, started
+                    )
+                )
             )
 
+        try:
+            outcomes = self._search_models(
+                request, query, app_models, memo, skip, sequence
+            )
+            outcomes = self._search_fuzzy(
+                request, query, app_models, outcomes, sequence
+            )
+        except SearchAbandoned:
+            # the client has aborted the request, so there's nothing to respond with
+            self._release_cached_content(ticket)
+            return HttpResponse(status=204)
+
+        data = self._search_response(request, query, app_list, outcomes)
+        response = JsonResponse(data)
+        self._set_cached_content(ticket, data, response)
+        if memo:
+            memo.save()
+
+        self._search_latency.record(time.monotonic() - started)
+        return self._hint_debounce(response)
+
+    async def asearch(self, request: HttpRequest) -> JsonResponse:
+        """Async variant of search(), routed to if site_search_async is True. Each model's
+        objects are retrieved with amatch_objects(), concurrently, so the slowest model
+        (rather than the sum of all models) determines the response time.
+
+        :param request: The HTTPRequest object."""
+        query = request.GET.get("q", "")
+
+        if not query:
+            # missing query, so return empty results
+            return JsonResponse(self._search_response(request, query, [], []))
+
+        started = time.monotonic()
         # same app list used to create the admin page for a user
+        app_list = await sync_to_async(self.get_app_list)(request)
+        sequence = await sync_to_async(self._start_search_sequence)(request)
+
+        content, ticket = await sync_to_async(self._get_cached_content)(
+            request, query, app_list
+        )
+        if content is not None:
+            return self._hint_debounce(
+                HttpResponse(content, content_type="application/json")
+            )
+
+        app_models = [(app, model) for app in app_list for model in app["models"]]
+        memo = await sync_to_async(self._get_prefix_memo)(request, query, app_list)
+        skip = await sync_to_async(self._get_bloom_skips)(request, query, app_models)
+
+        # async iterators can only be streamed by django >= 4.2
+        if self._accepts_stream(request) and django.VERSION >= (4, 2):
+            outcomes = self._aiter_outcomes(
+                request, query, app_models, memo, skip, sequence
+            )
+            return self._hint_debounce(
+                self._stream_response(
+                    self._astream_search(
+                        request, query, app_list, outcomes, ticket, memo, started
+                    )
+                )
+            )
+
+        try:
+            outcomes = await self._await_unless_abandoned(
+                self._asearch_models(request, query, app_models, memo, skip), sequence
+            )
+            outcomes = await sync_to_async(self._search_fuzzy)(
+                request, query, app_models, outcomes, sequence
+            )
+        except SearchAbandoned:
+            # the client has aborted the request, so there's nothing to respond with
+            self._release_cached_content(ticket)
+            return HttpResponse(status=204)
+
+        data = self._search_response(request, query, app_list, outcomes)
+        response = JsonResponse(data)
+        await sync_to_async(self._set_cached_content)(ticket, data, response)
+        if memo:
+            await sync_to_async(memo.save)()
+
+        self._search_latency.record(time.monotonic() - started)
+        return self._hint_debounce(response)
+
+    async def _asearch_models(
+        self,
+        request: HttpRequest,
+        query: str,
+        app_models: List[Tuple[dict, dict]],
+        memo: Optional[PrefixMemo] = None,
+        skip: Collection[str] = (),
+    ) -> List[Tuple[Optional[dict], Optional[dict]]]:
+        """Async variant of _search_models(), which searches models concurrently."""
+        if self._matches_models_at_once():
+            # a single query (or none), so there's nothing to gather
+            return await sync_to_async(self._search_models_indexed)(
+                request, query, app_models
+            )
+        elif self._use_union_all():
+            # a single query, so there's nothing to gather
+            return await sync_to_async(self._search_models_union)(
+                request, query, app_models, memo, skip
+            )
+        return await asyncio.gather(
+            *[
+                self._asearch_model(request, query, app, model, memo=memo, skip=skip)
+                for app, model in app_models
+            ]
+        )
+
+    def _start_search_sequence(self, request: HttpRequest) -> Optional[SearchSequence]:
+        """Records the search as the latest from its page, and returns it - or None if
+        site_search_abandon_superseded is False, or the client didn't number the search."""
+        if not self.site_search_abandon_superseded:
+            return None
+
+        sequence = parse_sequence(
+            self.site_search_cache_alias,
+            self.name,
+            request.user.pk,
+            request.headers.get("X-Site-Search-Sequence"),
+        )
+        if sequence:
+            sequence.start()
+        return sequence
+
+    async def _await_unless_abandoned(
+        self, awaitable: Awaitable, sequence: Optional[SearchSequence]
+    ) -> Any:
+        """Returns the awaitable's result - or, if the search is superseded first (as checked
+        straight away, then every POLL_INTERVAL seconds), cancels it and raises
+        SearchAbandoned."""
+        if sequence is None:
+            return await awaitable
+
+        task = asyncio.ensure_future(awaitable)
+        try:
+            while True:
+                await sync_to_async(sequence.check)()
+                done, _ = await asyncio.wait({task}, timeout=POLL_INTERVAL)
+                if done:
+                    return task.result()
+        finally:
+            # e.g. superseded, or the client disconnected (i.e. this coroutine was cancelled)
+            task.cancel()
+
+    def _accepts_stream(self, request: HttpRequest) -> bool:
+        """Returns True if results should be streamed, i.e. site_search_stream is True and the
+        client accepts NDJSON."""
+        accept = request.headers.get("Accept", "")
+        return self.site_search_stream and "application/x-ndjson" in accept
+
+    def _streams_outcomes(self) -> bool:
+        """Returns True if each model's outcome is known as soon as it's searched, i.e. models
+        aren't matched at once, and there's no fuzzy search of the models without matches."""
+        return (
+            not self._matches_models_at_once()
+            and not self._use_union_all()
+            and self.site_search_fuzzy_max_distance is None
+        )
+
+    def _iter_outcomes(
+        self,
+        request: HttpRequest,
+        query: str,
+        app_models: List[Tuple[dict, dict]],
+        memo: Optional[PrefixMemo] = None,
+        skip: Collection[str] = (),
+        sequence: Optional[SearchSequence] = None,
+    ) -> Iterator[Tuple[Optional[dict], Optional[dict]]]:
+        """Yields a (model_result, error) pair for every (app, model) pair, in the same order, as
+        per _search_models() and _search_fuzzy() - each as soon as the model is searched, if
+        possible (see _streams_outcomes)."""
+        if not self._streams_outcomes():
+            outcomes = self._search_models(
+                request, query, app_models, memo, skip, sequence
+            )
+            yield from self._search_fuzzy(
+                request, query, app_models, outcomes, sequence
+            )
+            return
+
+        yield from self._imap_models(
+            request,
+            partial(self._search_model, request, query, memo=memo, skip=skip),
+            app_models,
+            sequence,
+        )
+
+    async def _aiter_outcomes(
+        self,
+        request: HttpRequest,
+        query: str,
+        app_models: List[Tuple[dict, dict]],
+        memo: Optional[PrefixMemo] = None,
+        skip: Collection[str] = (),
+        sequence: Optional[SearchSequence] = None,
+    ) -> AsyncIterator[Tuple[Optional[dict], Optional[dict]]]:
+        """Async variant of _iter_outcomes(), which searches models concurrently."""
+        if not self._streams_outcomes():
+            outcomes = await self._await_unless_abandoned(
+                self._asearch_models(request, query, app_models, memo, skip), sequence
+            )
+            outcomes = await sync_to_async(self._search_fuzzy)(
+                request, query, app_models, outcomes, sequence
+            )
+            for outcome in outcomes:
+                yield outcome
+            return
+
+        tasks = [
+            asyncio.ensure_future(
+                self._asearch_model(request, query, app, model, memo=memo, skip=skip)
+            )
+            for app, model in app_models
+        ]
+        try:
+            for task in tasks:
+                outcome = await self._await_unless_abandoned(task, sequence)
+                yield outcome
+        finally:
+            # e.g. the client disconnected, so the remaining models aren't needed
+            for task in tasks:
+                task.cancel()
+
+    def _stream_response(self, lines: Any) -> StreamingHttpResponse:
+        """Returns a StreamingHttpResponse of the (sync or async) iterator of NDJSON lines."""
+        response = StreamingHttpResponse(lines, content_type="application/x-ndjson")
+        # i.e. proxies (e.g. nginx) should pass each line on, rather than buffer the response
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def _hint_debounce(self, response: HttpResponse) -> HttpResponse:
+        """Sets the X-Site-Search-Debounce header of the response: the debounce (in ms) that
+        the modal should wait for, as per the latency of recent searches - if any."""
+        debounce = self._search_latency.debounce(self.site_search_debounce_range)
+        if debounce is not None:
+            response["X-Site-Search-Debounce"] = str(debounce)
+        return response
+
+    def _stream_line(self, data: dict) -> bytes:
+        """Returns the data as a line of NDJSON."""
+        return json.dumps(data, cls=DjangoJSONEncoder).encode() + b"\n"
+
+    def _stream_search(
+        self,
+        request: HttpRequest,
+        query: str,
+        app_list: List[dict],
+        outcomes: Iterator[Tuple[Optional[dict], Optional[dict]]],
+        ticket: Optional[CacheTicket],
+        memo: Optional[PrefixMemo],
+        started: float,
+    ) -> Iterator[bytes]:
+        """Yields the response as NDJSON lines: an {"app": app_result} line for each app in the
+        results, as soon as its models have been searched, then a {"counts", "errors",
+        "partial"} line.
+        The whole response is then cached (as JSON), and its latency (since started) recorded,
+        as per search()."""
+        data = self._search_response(request, query, [], [])
+
+        try:
+            for app in app_list:
+                app_outcomes = [next(outcomes) for _ in app["models"]]
+                app_result = self._add_app_result(
+                    request, query, app, app_outcomes, data
+                )
+                if app_result:
+                    yield self._stream_line({"app": app_result})
+        except SearchAbandoned:
+            # the client has aborted the request, so end the stream (without counts)
+            self._release_cached_content(ticket)
+            return
+
+        yield self._stream_line(
+            {
+                "counts": data["counts"],
+                "errors": data["errors"],
+                "partial": data["partial"],
+            }
+        )
+        self._set_cached_content(ticket, data, JsonResponse(data))
+        if memo:
+            memo.save()
+        self._search_latency.record(time.monotonic() - started)
+
+    async def _astream_search(
+        self,
+        request: HttpRequest,
+        query: str,
+        app_list: List[dict],
+        outcomes: AsyncIterator[Tuple[Optional[dict], Optional[dict]]],
+        ticket: Optional[CacheTicket],
+        memo: Optional[PrefixMemo],
+        started: float,
+    ) -> AsyncIterator[bytes]:
+        """Async variant of _stream_search()."""
+        data = self._search_response(request, query, [], [])
+
+        try:
+            for app in app_list:
+                app_outcomes = [await outcomes.__anext__() for _ in app["models"]]
+                app_result = self._add_app_result(
+                    request, query, app, app_outcomes, data
+                )
+                if app_result:
+                    yield self._stream_line({"app": app_result})
+        except SearchAbandoned:
+            # the client has aborted the request, so end the stream (without counts)
+            self._release_cached_content(ticket)
+            return
+        finally:
+            # i.e. cancel the remaining searches, if the response was abandoned
+            await outcomes.aclose()
+
+        yield self._stream_line(
+            {
+                "counts": data["counts"],
+                "errors": data["errors"],
+                "partial": data["partial"],
+            }
+        )
+        await sync_to_async(self._set_cached_content)(ticket, data, JsonResponse(data))
+        if memo:
+            await sync_to_async(memo.save)()
+        self._search_latency.record(time.monotonic() - started)
+
+    def complete(self, request: HttpRequest) -> JsonResponse:
+        """Returns a JsonResponse containing up to site_search_completions completions of the
+        "q" query parameter: the names of apps and models that start with it, then the most
+        frequent Char field values that do - of the models that the user can view. Values are
+        completed from an in-process vocabulary of each model, so the database is only queried
+        to (re)build it, i.e. after the model is written to.
+
+        :param request: The HTTPRequest object."""
+        query = request.GET.get("q", "").strip()
+        if not query:
+            return JsonResponse({"completions": []})
+
+        limit = self.site_search_completions
+        key = query.lower()
         app_list = self.get_app_list(request)
 
+        names = []
+        model_classes = set()
         for app in app_list:
-            app_result = {
-                "id": app["app_label"],
-                "name": app["name"],
-                "url": app["app_url"] if app["has_module_perms"] else None,
-                "models": [],
-            }
+            names.append(app["name"])
+            for model in app["models"]:
+                names.append(model["name"])
+                with suppress(Exception):
+                    # e.g. get_model_class failed, in which case there's nothing to complete
+                    model_class = self._get_searchable_model_class(request, app, model)
+                    if model_class:
+                        model_classes.add(model_class)
+
+        try:
+            vocabularies = self._get_vocabularies().get_many(model_classes)
+        except Exception:
+            # e.g. a model's table can't be read, so only names are completed
+            vocabularies = {}
+        # (term, weight) of each model's heaviest completions, heaviest (then in order) first
+        values = sorted(
+            (
+                completion
+                for vocabulary in vocabularies.values()
+                for completion in vocabulary.complete(query, limit)
+            ),
+            key=lambda completion: (-completion[1], completion[0].lower()),
+        )
+        terms = [n for n in names if n.lower().startswith(key)]
+        terms.extend(term for term, _ in values)
 
+        completions = {}
+        for term in terms:
+            # terms that only differ by case are completed once
+            completions.setdefault(term.lower(), term)
+            if len(completions) == limit:
+                break
+
+        return JsonResponse({"completions": list(completions.values())})
+
+    def _get_vocabularies(self) -> VocabularyRegistry:
+        """Returns the registry of (in-process) vocabularies, used if site_search_completions is
+        set."""
+        if self._vocabularies is None:
+            self._vocabularies = VocabularyRegistry(
+                self.site_search_cache_alias, self._build_vocabulary
+            )
+        return self._vocabularies
+
+    def _build_vocabulary(self, model_class: Type[Model]) -> Vocabulary:
+        """Returns a new vocabulary of the model class' Char field values."""
+        field_names = self._get_search_plan(model_class).field_names
+        return build_vocabulary(model_class, field_names)
+
+    def _get_cached_content(
+        self, request: HttpRequest, query: str, app_list: List[dict]
+    ) -> Tuple[Optional[bytes], Optional[CacheTicket]]:
+        """Returns a (content, ticket) pair from the result cache, as per SearchResultCache.get().
+        Both values are None if caching is disabled."""
+        if self.site_search_cache_timeout is None:
+            return None, None
+
+        result_cache = self._get_result_cache()
+        # results depend on every model that the user can view
+        labels = self._viewable_labels(app_list)
+        if self.site_search_method == "admin_search_fields":
+            # ...and the models that their search_fields look up, through relations
+            labels.extend(self._search_field_labels(request, app_list))
+
+        return result_cache.get(self._cache_key(request, query, app_list), labels)
+
+    def _set_cached_content(
+        self, ticket: Optional[CacheTicket], data: dict, response: HttpResponse
+    ):
+        """Stores the response content in the result cache, after a cache miss. Partial
+        responses (i.e. a model raised, whether or not the error is included) aren't cached,
+        since the errors may be temporary."""
+        if ticket is not None and not data["partial"]:
+            self._get_result_cache().set(ticket, response.content)
+        else:
+            self._release_cached_content(ticket)
+
+    def _release_cached_content(self, ticket: Optional[CacheTicket]):
+        """Releases the result cache's lock, after a cache miss whose results aren't stored -
+        so that requests waiting for them compute them instead."""
+        if ticket is not None:
+            self._get_result_cache().release(ticket)
+
+    def _get_result_cache(self) -> SearchResultCache:
+        """Returns the result cache, as per the site_search_cache_* attributes."""
+        return SearchResultCache(
+            alias=self.site_search_cache_alias,
+            timeout=self.site_search_cache_timeout,
+            stale_timeout=self.site_search_cache_stale_timeout,
+        )
+
+    def _cache_key(self, request: HttpRequest, query: str, app_list: List[dict]) -> str:
+        """Returns the result cache key, for the (normalised) query, search method and language,
+        and the user's permission signature. Results are shared between users with the same
+        permissions, unless a method that's passed the request is overridden, or objects are
+        matched by a custom backend (i.e. results may depend on the user)."""
+        if self.site_search_method in ["sqlite_fts5", "in_memory_index"] or (
+            self.site_search_method == "model_char_fields"
+            and not self._is_overridden("filter_field")
+        ):
+            # by default, all matching is case-insensitive
+            query = query.lower()
+
+        permissions = [
+            (
+                app["app_label"],
+                app["app_url"] if app["has_module_perms"] else None,
+                [
+                    (m["object_name"], m["admin_url"], m["perms"]["add"])
+                    for m in app["models"]
+                    if m["perms"]["view"]
+                ],
+            )
+            for app in app_list
+        ]
+
+        user = None
+        if is_backend_path(self.site_search_method) or any(
+            self._is_overridden(name) for name in REQUEST_HOOKS
+        ):
+            user = request.user.pk
+
+        return result_key(
+            self.name,
+            query,
+            self.site_search_method,
+            translation.get_language(),
+            permissions,
+            user,
+        )
+
+    def _viewable_labels(self, app_list: List[dict]) -> List[str]:
+        """Returns the labels of all models in the app list that the user can view."""
+        return [
+            f"{app['app_label']}.{model['object_name']}"
+            for app in app_list
+            for model in app["models"]
+            if model["perms"]["view"]
+        ]
+
+    def _search_field_labels(
+        self, request: HttpRequest, app_list: List[dict]
+    ) -> Set[str]:
+        """Returns the labels of the models that the search_fields of each model in the app
+        list (that the user can view) look up through relations, e.g. "team__name"."""
+        labels = set()
+        for app in app_list:
             for model in app["models"]:
-                try:
-                    can_view = model["perms"]["view"]
-                    can_add = model["perms"]["add"]
+                with suppress(Exception):
+                    # e.g. get_model_class failed, in which case the model isn't searched
+                    model_class = self._get_searchable_model_class(request, app, model)
+                    model_admin = self._registry.get(model_class)
+                    if model_admin:
+                        for search_field in model_admin.get_search_fields(request):
+                            labels.update(
+                                m._meta.label
+                                for m in related_models(model_class, search_field)
+                            )
+        return labels
 
-                    if not can_view:
-                        # user has no permission to view this model, so skip
-                        continue
+    def _get_prefix_memo(
+        self, request: HttpRequest, query: str, app_list: List[dict]
+    ) -> Optional[PrefixMemo]:
+        """Returns the user's prefix memo, or None if it's disabled - or can't be used, since
+        matching may not be case-insensitive substring matching of Char fields."""
+        if (
+            self.site_search_prefix_memo_timeout is None
+            or not self._matches_char_fields(query)
+        ):
+            return None
 
-                    model_class = self.get_model_class(request, app["app_label"], model)
-                    if not model_class:
-                        # unable to retrieve model class, so skip
-                        continue
+        return PrefixMemo(
+            alias=self.site_search_cache_alias,
+            timeout=self.site_search_prefix_memo_timeout,
+            key=memo_key(self.name, request.user.pk, translation.get_language()),
+            labels=self._viewable_labels(app_list),
+        )
 
-                    fields = model_class._meta.get_fields()
-                    objects = self.match_objects(request, query, model_class, fields)
+    def _matches_char_fields(self, query: str) -> bool:
+        """Returns True if objects are matched by case-insensitive substring matching of Char
+        fields (i.e. the defaults), in a way that Python can reproduce."""
+        return (
+            self.site_search_method == "model_char_fields"
+            and not any(
+                self._is_overridden(name)
+                for name in ["match_objects", "amatch_objects", "filter_field"]
+            )
+            # python's lower() may not agree with the database's, for non-ascii characters
+            and query.isascii()
+        )
+
+    def _get_bloom_skips(
+        self, request: HttpRequest, query: str, app_models: List[Tuple[dict, dict]]
+    ) -> Set[str]:
+        """Returns the labels of the models whose bloom filter rules out every object, i.e.
+        that don't need querying. Empty if filters are disabled, or can't be used."""
+        if not self.site_search_bloom_filters or not self._matches_char_fields(query):
+            return set()
+
+        model_classes = []
+        for app, model in app_models:
+            with suppress(Exception):
+                # errors are reported when the model is searched
+                model_class = self._get_searchable_model_class(request, app, model)
+                if model_class:
+                    model_classes.append(model_class)
+
+        filters = self._get_bloom_filters().get_many(model_classes)
+        terms = self._query_terms(query)
+        return {
+            model_class._meta.label
+            for model_class, bloom in filters.items()
+            if bloom is not None and not all(bloom.might_match(t) for t in terms)
+        }
+
+    def _get_bloom_filters(self) -> BloomFilterRegistry:
+        """Returns the registry of bloom filters, used if site_search_bloom_filters is True."""
+        if self._bloom_filters is None:
+            self._bloom_filters = BloomFilterRegistry(self.site_search_cache_alias)
+        return self._bloom_filters
+
+    def _get_memo_objects(
+        self, memo: Optional[PrefixMemo], query: str, model_class: Type[Model]
+    ) -> Optional[List[MemoRow]]:
+        """Returns the model's objects from the prefix memo, or None if they need searching."""
+        if memo is None:
+            return None
+        return memo.lookup(
+            model_class._meta.label, query.lower(), self._query_terms(query.lower())
+        )
 
-                    # haven't matched any objects, or model names, so skip
-                    if not objects and not self.match_model(
-                        request, query, model["name"], model["object_name"], fields
-                    ):
-                        continue
-
-                    model_result = {
-                        "id": f"{app['app_label']}.{model['object_name']}",
-                        "name": model["name"],
-                        "url": model["admin_url"],
-                        "url_add": model["add_url"] if can_add else None,
-                        "objects": [],
-                    }
-
-                    for obj in objects:
-                        object_result = {
-                            "id": str(obj.pk),
-                            "name": str(obj),
-                            "url": f"{model['admin_url']}{obj.pk}",
-                        }
-                        model_result["objects"].append(object_result)
-                        counts["objects"] += 1
-
-                    app_result["models"].append(model_result)
-                    counts["models"] += 1
-                except Exception as ex:
-                    # except/skip to avoid unexpected issues with one model preventing any results
-                    # from being returned - log the error client-side instead (not in production)
-                    if settings.DEBUG:
-                        errors.append(
-                            {
-                                "error": repr(ex),
-                                "error_message": str(ex),
-                                "app": app["app_label"],
-                                "model": model["object_name"],
-                            }
-                        )
+    def _record_memo_objects(
+        self,
+        memo: Optional[PrefixMemo],
+        query: str,
+        model_class: Type[Model],
+        objects: List[Model],
+        model_result: Optional[dict],
+    ):
+        """Records the model's objects in the prefix memo, if they're every match."""
+        if memo is None or len(objects) >= 5:
+            return
+
+        field_names = self._get_search_plan(model_class).field_names
+        object_results = model_result["objects"] if model_result else []
+        rows = []
+
+        for obj, object_result in zip(objects, object_results):
+            if obj.get_deferred_fields().intersection(field_names):
+                # e.g. get_model_queryset uses only(), so values would need more queries
+                return
+
+            values = [getattr(obj, name) for name in field_names]
+            rows.append(
+                MemoRow(
+                    pk=obj.pk,
+                    name=object_result["name"],
+                    values=tuple(str(v).lower() for v in values if v is not None),
+                )
+            )
+
+        memo.record(model_class._meta.label, query.lower(), rows)
+
+    def _search_response(
+        self,
+        request: HttpRequest,
+        query: str,
+        app_list: List[dict],
+        outcomes: List[Tuple[Optional[dict], Optional[dict]]],
+    ) -> dict:
+        """Returns the response data, after combining the app list with the (model_result,
+        error) outcome of searching each model - in the same order as app_list."""
+        data = {
+            "results": {"apps": []},
+            "counts": {"apps": 0, "models": 0, "objects": 0},
+            "errors": [],
+            # i.e. a model raised, so its results are missing (even if errors aren't included)
+            "partial": False,
+        }
+
+        outcomes = iter(outcomes)
+
+        for app in app_list:
+            app_outcomes = [next(outcomes) for _ in app["models"]]
+            self._add_app_result(request, query, app, app_outcomes, data)
+
+        return data
+
+    def _add_app_result(
+        self,
+        request: HttpRequest,
+        query: str,
+        app: dict,
+        outcomes: List[Tuple[Optional[dict], Optional[dict]]],
+        data: dict,
+    ) -> Optional[dict]:
+        """Adds the app's result (and errors) to the response data, and returns it - or None if
+        neither the app, nor any of its models, were matched.
+
+        :param outcomes: The (model_result, error) outcome of each of the app's models."""
+        app_result = {
+            "id": app["app_label"],
+            "name": app["name"],
+            "url": app["app_url"] if app["has_module_perms"] else None,
+            "models": [],
+        }
+        counts = data["counts"]
+
+        for model_result, error in outcomes:
+            if error is not None:
+                data["partial"] = True
+                if error:
+                    data["errors"].append(error)
+            elif model_result:
+                app_result["models"].append(model_result)
+                counts["models"] += 1
+                counts["objects"] += len(model_result["objects"])
+
+        # we've matched some models or objects, or the app name
+        if app_result["models"] or self.match_app(request, query, app["name"]):
+            data["results"]["apps"].append(app_result)
+            counts["apps"] += 1
+            return app_result
+        return None
+
+    def _map_models(
+        self,
+        request: HttpRequest,
+        func: Callable[[dict, dict], Any],
+        app_models: List[Tuple[dict, dict]],
+        sequence: Optional[SearchSequence] = None,
+    ) -> List[Any]:
+        """Applies func to every (app, model) pair, and returns the results in the same order
+        (see _imap_models)."""
+        return list(self._imap_models(request, func, app_models, sequence))
+
+    def _imap_models(
+        self,
+        request: HttpRequest,
+        func: Callable[[dict, dict], Any],
+        app_models: List[Tuple[dict, dict]],
+        sequence: Optional[SearchSequence] = None,
+    ) -> Iterator[Any]:
+        """Applies func to every (app, model) pair, and yields the results in the same order -
+        each as soon as it (and those before it) are ready.
+
+        Pairs are processed one-by-one, unless site_search_max_workers is greater than one, in
+        which case they're sent to a bounded thread pool. Each thread uses its own database
+        connections (closed after each pair), and the request's active language.
+
+        :param request: The HTTPRequest object.
+        :param func: A callable accepting the app and model dicts.
+        :param app_models: A list of (app, model) dicts, as per get_app_list().
+        :param sequence: The search's sequence, checked before each pair is processed.
+        :raises SearchAbandoned: If the sequence is superseded."""
+        if (self.site_search_max_workers or 0) < 2 or len(app_models) < 2:
+            for app, model in app_models:
+                if sequence:
+                    sequence.check()
+                yield func(app, model)
+            return
+
+        language = translation.get_language()
+
+        def run_in_thread(app: dict, model: dict) -> Any:
+            try:
+                if sequence:
+                    # i.e. skip the pairs still queued, once superseded
+                    sequence.check()
+                with translation.override(language):
+                    return func(app, model)
+            finally:
+                # connections are thread-local, so the worker closes its own - rather than
+                # leaving them open once the pool exits
+                connections.close_all()
+
+        max_workers = min(self.site_search_max_workers, len(app_models))
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            # map() yields results in the order they were submitted
+            yield from executor.map(lambda pair: run_in_thread(*pair), app_models)
+        finally:
+            executor.shutdown(wait=True)
+
+    def _search_models(
+        self,
+        request: HttpRequest,
+        query: str,
+        app_models: List[Tuple[dict, dict]],
+        memo: Optional[PrefixMemo] = None,
+        skip: Collection[str] = (),
+        sequence: Optional[SearchSequence] = None,
+    ) -> List[Tuple[Optional[dict], Optional[dict]]]:
+        """Returns a (model_result, error) pair for every (app, model) pair, in the same order,
+        after matching the query as per the site_search_method (and related attributes).
+
+        :raises SearchAbandoned: If the search's sequence is superseded, between models."""
+        if self._matches_models_at_once():
+            return self._search_models_indexed(request, query, app_models)
+        elif self._use_union_all():
+            return self._search_models_union(request, query, app_models, memo, skip)
+        else:
+            return self._map_models(
+                request,
+                partial(self._search_model, request, query, memo=memo, skip=skip),
+                app_models,
+                sequence,
+            )
+
+    def _search_fuzzy(
+        self,
+        request: HttpRequest,
+        query: str,
+        app_models: List[Tuple[dict, dict]],
+        outcomes: List[Tuple[Optional[dict], Optional[dict]]],
+        sequence: Optional[SearchSequence] = None,
+    ) -> List[Tuple[Optional[dict], Optional[dict]]]:
+        """Returns the outcomes, after searching each model without matching objects for the
+        nearest variants of the query (as per its term dictionary) - if
+        site_search_fuzzy_max_distance is set. Variants are searched nearest first, up to
+        site_search_fuzzy_max_expansions of them, and only for the models that still have no
+        matching objects."""
+        if self.site_search_fuzzy_max_distance is None:
+            return outcomes
+
+        def settled(outcome: Tuple[Optional[dict], Optional[dict]]) -> bool:
+            # i.e. there are matching objects, or an error that a variant won't fix
+            model_result, error = outcome
+            return error is not None or bool(model_result and model_result["objects"])
+
+        # index (in app_models) -> model class, of models without matching objects
+        unmatched = {}
+        for i, (app, model) in enumerate(app_models):
+            if settled(outcomes[i]):
+                continue
+            with suppress(Exception):
+                # errors were reported when the model was searched
+                model_class = self._get_searchable_model_class(request, app, model)
+                if model_class:
+                    unmatched[i] = model_class
+
+        if not unmatched:
+            return outcomes
+
+        try:
+            dictionaries = self._get_term_dictionaries().get_many(
+                set(unmatched.values())
+            )
+        except Exception:
+            # e.g. a model's table can't be read, so there are no variants to search
+            return outcomes
+        # variant -> (distance, indexes of the models that it's a variant for)
+        variants = {}
+        for i, model_class in unmatched.items():
+            if model_class not in dictionaries:
+                # i.e. it's still being built
+                continue
+            for variant, distance in dictionaries[model_class].variants(
+                query,
+                self.site_search_fuzzy_max_distance,
+                self.site_search_fuzzy_max_expansions,
+            ):
+                entry = variants.setdefault(variant, (distance, []))
+                entry[1].append(i)
+
+        nearest = sorted(variants.items(), key=lambda item: item[1][0])
+        outcomes = list(outcomes)
+
+        for variant, (_, indexes) in nearest[: self.site_search_fuzzy_max_expansions]:
+            # models may have been matched by a nearer variant
+            indexes = [i for i in indexes if not settled(outcomes[i])]
+            if not indexes:
+                continue
+
+            variant_outcomes = self._search_models(
+                request, variant, [app_models[i] for i in indexes], sequence=sequence
+            )
+            for i, outcome in zip(indexes, variant_outcomes):
+                if settled(outcome) and outcome[1] is None:
+                    outcomes[i] = outcome
+
+        return outcomes
+
+    def _get_term_dictionaries(self) -> TermDictionaryRegistry:
+        """Returns the registry of (in-process) term dictionaries, used if
+        site_search_fuzzy_max_distance is set."""
+        if self._term_dictionaries is None:
+            self._term_dictionaries = TermDictionaryRegistry(
+                self.site_search_cache_alias, self._build_term_dictionary
+            )
+        return self._term_dictionaries
+
+    def _build_term_dictionary(self, model_class: Type[Model]) -> TermDictionary:
+        """Returns a new term dictionary of the model class' Char fields."""
+        field_names = self._get_search_plan(model_class).field_names
+        return build_term_dictionary(model_class, field_names)
+
+    def _search_model(
+        self,
+        request: HttpRequest,
+        query: str,
+        app: dict,
+        model: dict,
+        memo: Optional[PrefixMemo] = None,
+        skip: Collection[str] = (),
+    ) -> Tuple[Optional[dict], Optional[dict]]:
+        """Returns a (model_result, error) pair, after matching the query against a single model
+        and its objects. Both values are None if the model is skipped, or not matched. Models
+        labelled in skip are known not to have matching objects, so aren't queried."""
+        try:
+            model_class = self._get_searchable_model_class(request, app, model)
+            if not model_class:
+                return None, None
+
+            fields = self._get_search_plan(model_class).fields
+            objects = self._get_memo_objects(memo, query, model_class)
+            memoised = objects is not None
+
+            if not memoised and model_class._meta.label in skip:
+                objects = []
+            elif not memoised:
+                objects = self.match_objects(request, query, model_class, fields)
+                if memo:
+                    objects = list(objects)
+
+            model_result = self._model_result(
+                request, query, app, model, model_class, fields, objects
+            )
+            if not memoised:
+                self._record_memo_objects(
+                    memo, query, model_class, objects, model_result
+                )
+            return model_result, None
+        except Exception as ex:
+            return None, self._model_error(app, model, ex)
+
+    async def _asearch_model(
+        self,
+        request: HttpRequest,
+        query: str,
+        app: dict,
+        model: dict,
+        memo: Optional[PrefixMemo] = None,
+        skip: Collection[str] = (),
+    ) -> Tuple[Optional[dict], Optional[dict]]:
+        """Async variant of _search_model(), which retrieves objects with amatch_objects()."""
+        try:
+            model_class = self._get_searchable_model_class(request, app, model)
+            if not model_class:
+                return None, None
+
+            fields = self._get_search_plan(model_class).fields
+            objects = self._get_memo_objects(memo, query, model_class)
+            if objects is None and model_class._meta.label in skip:
+                objects = []
+
+            if objects is not None:
+                # nothing to query
+                model_result = self._model_result(
+                    request, query, app, model, model_class, fields, objects
+                )
+                return model_result, None
+
+            objects = await self.amatch_objects(request, query, model_class, fields)
+
+            # str(obj) may query related objects, so build the result synchronously
+            model_result = await sync_to_async(self._model_result)(
+                request, query, app, model, model_class, fields, objects
+            )
+            self._record_memo_objects(memo, query, model_class, objects, model_result)
+            return model_result, None
+        except Exception as ex:
+            return None, self._model_error(app, model, ex)
+
+    def _use_union_all(self) -> bool:
+        """Returns True if objects should be matched with a single UNION ALL query. Not if
+        match_objects (or amatch_objects) is overridden, since the query is built from
+        _filter_objects() - so would ignore how the override matches objects."""
+        return (
+            self.site_search_union_all
+            and self.site_search_method == "model_char_fields"
+            and not any(
+                self._is_overridden(name)
+                for name in ["match_objects", "amatch_objects"]
+            )
+        )
+
+    def _search_models_union(
+        self,
+        request: HttpRequest,
+        query: str,
+        app_models: List[Tuple[dict, dict]],
+        memo: Optional[PrefixMemo] = None,
+        skip: Collection[str] = (),
+    ) -> List[Tuple[Optional[dict], Optional[dict]]]:
+        """Returns a (model_result, error) pair for every (app, model) pair, in the same order,
+        after matching objects with a single UNION ALL query (per database). Models labelled in
+        skip are left out of the query.
+
+        Each branch of the query selects the model label and pk of (up to 5) matching objects.
+        Display names (i.e. str(obj)) can't be computed in SQL, so the matched objects are then
+        retrieved for the models that have any matches."""
+        outcomes = [(None, None)] * len(app_models)
+        # index (in app_models) -> (model_class, fields, queryset, results)
+        targets = {}
+
+        for i, (app, model) in enumerate(app_models):
+            try:
+                model_class = self._get_searchable_model_class(request, app, model)
+                if not model_class:
+                    continue
+
+                plan = self._get_search_plan(model_class)
+                fields = plan.fields
+
+                objects = self._get_memo_objects(memo, query, model_class)
+                if objects is None and model_class._meta.label in skip:
+                    objects = []
+                if objects is not None:
+                    # nothing to query, so leave out of the UNION ALL
+                    model_result = self._model_result(
+                        request, query, app, model, model_class, fields, objects
+                    )
+                    outcomes[i] = (model_result, None)
                     continue
 
-            # we've matched some models or objects, or the app name
-            if app_result["models"] or self.match_app(request, query, app["name"]):
-                results["apps"].append(app_result)
-                counts["apps"] += 1
+                model_admin = plan.model_admin
+                queryset = self.get_model_queryset(request, model_class, model_admin)
+                results = self._filter_objects(
+                    request, query, model_class, fields, model_admin, queryset
+                )
+                targets[i] = (model_class, fields, queryset, results)
+            except Exception as ex:
+                outcomes[i] = (None, self._model_error(app, model, ex))
+
+        try:
+            matched_pks = self._union_all_pks(
+                [(i, t[0], t[3]) for i, t in targets.items()]
+            )
+        except DatabaseError:
+            # e.g. one model's queryset is invalid, so fall back to one query per model
+            matched_pks = None
+
+        for i, (model_class, fields, queryset, results) in targets.items():
+            app, model = app_models[i]
+            try:
+                if matched_pks is None:
+                    objects = list(results[:5])
+                elif matched_pks.get(i):
+                    objects = self._objects_by_pks(queryset, matched_pks[i])
+                else:
+                    objects = []
+
+                model_result = self._model_result(
+                    request, query, app, model, model_class, fields, objects
+                )
+                self._record_memo_objects(
+                    memo, query, model_class, objects, model_result
+                )
+                outcomes[i] = (model_result, None)
+            except Exception as ex:
+                outcomes[i] = (None, self._model_error(app, model, ex))
+
+        return outcomes
+
+    def _union_all_pks(
+        self, branches: List[Tuple[int, Model, QuerySet]]
+    ) -> Dict[int, List[str]]:
+        """Returns the (string) pks of up to 5 objects for each (index, model_class, results)
+        branch, keyed by index - using one UNION ALL query for each database."""
+        queries = {}
+
+        for i, model_class, results in branches:
+            if results.query.is_empty():
+                # e.g. no Char fields, so nothing to query
+                continue
+
+            branch = results.annotate(
+                _site_search_label=Value(model_class._meta.label, CharField()),
+                _site_search_pk=Cast("pk", CharField()),
+            ).values_list("_site_search_label", "_site_search_pk")[:5]
+            queries.setdefault(branch.db, []).append((i, model_class, branch))
+
+        matched_pks = {}
+
+        for db, db_branches in queries.items():
+            connection = connections[db]
+            indexes = {model_class._meta.label: i for i, model_class, _ in db_branches}
+            parts = []
+            params = []
+
+            for n, (_, _, branch) in enumerate(db_branches):
+                sql, branch_params = branch.query.get_compiler(using=db).as_sql()
+                # wrap each branch, since not all databases support a LIMIT per branch
+                alias = connection.ops.quote_name(f"site_search_{n}")
+                parts.append(f"SELECT * FROM ({sql}) {alias}")
+                params.extend(branch_params)
+
+            # i.e. a savepoint, so a failed query doesn't abort the request's transaction (e.g.
+            # with ATOMIC_REQUESTS on PostgreSQL), and the fallback queries can still run
+            with transaction.atomic(using=db), connection.cursor() as cursor:
+                cursor.execute(" UNION ALL ".join(parts), params)
+                for label, pk in cursor.fetchall():
+                    matched_pks.setdefault(indexes[label], []).append(pk)
+
+        return matched_pks
+
+    def _objects_by_pks(self, queryset: QuerySet, pks: List[str]) -> List[Model]:
+        """Returns the objects in the queryset with the given (string) pks, in the same order.
+        Objects that aren't in the queryset are left out.
+
+        The pks are compared as per the pk field's to_python(), since their string forms may
+        differ from str(obj.pk) - e.g. UUIDs, which are cast to hex by SQLite and MySQL."""
+        to_python = queryset.model._meta.pk.to_python
+        by_pk = {o.pk: o for o in queryset.filter(pk__in=pks)}
+        objects = (by_pk.get(to_python(pk)) for pk in pks)
+        return [o for o in objects if o is not None]
+
+    def _search_models_indexed(
+        self,
+        request: HttpRequest,
+        query: str,
+        app_models: List[Tuple[dict, dict]],
+    ) -> List[Tuple[Optional[dict], Optional[dict]]]:
+        """Returns a (model_result, error) pair for every (app, model) pair, in the same order,
+        after matching objects in all models at once - as per the site_search_method:
+
+        - sqlite_fts5: a single query against the SQLite FTS5 index (per database).
+        - in_memory_index: the in-process trigram index, i.e. without any queries.
+        - a SearchBackend: a single call to its search(), with each model's queryset.
+
+        Matched objects are then retrieved from get_model_queryset(), so may be fewer than 5 if
+        it's been restricted. Models that can't be indexed are searched with match_objects(). If
+        a SearchBackend's search() raises, every model's outcome is the error, since it's the
+        backend that decides what matches."""
+        outcomes = [(None, None)] * len(app_models)
+        # index (in app_models) -> (model_class, fields, queryset)
+        targets = {}
+
+        for i, (app, model) in enumerate(app_models):
+            try:
+                model_class = self._get_searchable_model_class(request, app, model)
+                if not model_class:
+                    continue
+
+                plan = self._get_search_plan(model_class)
+                queryset = self.get_model_queryset(
+                    request, model_class, plan.model_admin
+                )
+                targets[i] = (model_class, plan.fields, queryset)
+            except Exception as ex:
+                outcomes[i] = (None, self._model_error(app, model, ex))
+
+        if self.site_search_method == "sqlite_fts5":
+            matched_pks = self._match_pks_fts5(query, targets)
+        elif self.site_search_method == "in_memory_index":
+            matched_pks = self._match_pks_trigrams(query, targets)
+        else:
+            try:
+                matched_pks = self._match_pks_backend(request, query, targets)
+            except Exception as ex:
+                for i in targets:
+                    outcomes[i] = (None, self._model_error(*app_models[i], ex))
+                return outcomes
+
+        for i, (model_class, fields, queryset) in targets.items():
+            app, model = app_models[i]
+            try:
+                matches = matched_pks.get(i)
+                if matches is None:
+                    objects = self.match_objects(request, query, model_class, fields)
+                elif matches and not isinstance(matches[0], str):
+                    # rows with display names, so there's nothing to retrieve
+                    objects = matches
+                elif matches:
+                    objects = self._objects_by_pks(queryset, matches)
+                else:
+                    objects = []
+
+                model_result = self._model_result(
+                    request, query, app, model, model_class, fields, objects
+                )
+                outcomes[i] = (model_result, None)
+            except Exception as ex:
+                outcomes[i] = (None, self._model_error(app, model, ex))
+
+        return outcomes
+
+    def _match_pks_backend(
+        self,
+        request: HttpRequest,
+        query: str,
+        targets: Dict[int, Tuple[Model, List[Field], QuerySet]],
+    ) -> Dict[int, list]:
+        """Returns up to 5 objects (or their string pks) matching the query, keyed by index (in
+        app_models) - as per the backend's search(). Models left out of its hits have none."""
+        querysets = {
+            model_class: queryset for model_class, _, queryset in targets.values()
+        }
+        hits = self._get_backend().search(request, query, querysets, limit=5)
+
+        matched = {}
+        for i, (model_class, _, _) in targets.items():
+            model_hits = list(hits.get(model_class) or [])[:5]
+            if model_hits and not isinstance(model_hits[0], Model):
+                model_hits = [str(pk) for pk in model_hits]
+            matched[i] = model_hits
+        return matched
+
+    def _match_pks_fts5(
+        self, query: str, targets: Dict[int, Tuple[Model, List[Field], QuerySet]]
+    ) -> Dict[int, List[str]]:
+        """Returns the (string) pks of up to 5 objects matching the query, keyed by index (in
+        targets), with one query against the FTS5 index for each database. Models that haven't
+        been indexed are built in a background thread (see fts5.start_builds) - with folded
+        text, under their shadow labels, if site_search_fold_text is set.
+
+        Models in databases that can't hold the index (i.e. not SQLite), and those that are
+        still being built, are left out - as are all models if match_objects or filter_field
+        are overridden (see _indexes_match_defaults)."""
+        if not self._indexes_match_defaults():
+            return {}
+
+        # database alias -> indexes (in targets) of models stored in that database
+        databases = {}
+        for i, (_, _, queryset) in targets.items():
+            databases.setdefault(queryset.db, []).append(i)
+
+        matched_pks = {}
+        folded = self.site_search_fold_text
+        terms = [fold(t) if folded else t for t in self._query_terms(query)]
+
+        for db, indexes in databases.items():
+            if not fts5.is_supported(db):
+                continue
+
+            model_classes = [targets[i][0] for i in indexes]
+            labels = [fts5.index_label(m._meta.label, folded) for m in model_classes]
+            try:
+                generation, indexed = fts5.index_missing(
+                    model_classes,
+                    db,
+                    folded,
+                    claim_alias=self.site_search_cache_alias,
+                    background=fts5.BACKGROUND_BUILDS,
+                )
+                label_pks = fts5.match_all(
+                    db,
+                    terms,
+                    [label for label in labels if label in indexed],
+                    generation=generation,
+                )
+            except DatabaseError:
+                # e.g. FTS5 isn't available, so fall back to one query per model
+                continue
+
+            for i, label in zip(indexes, labels):
+                if label in indexed:
+                    matched_pks[i] = label_pks.get(label, [])
+
+        return matched_pks
+
+    def _match_pks_trigrams(
+        self, query: str, targets: Dict[int, Tuple[Model, List[Field], QuerySet]]
+    ) -> Dict[int, list]:
+        """Returns up to 5 objects matching the query, keyed by index (in targets), from the
+        trigram index of each model: either the site_search_index_path file, or (for models
+        that aren't in the file) an index built in-process.
+
+        Matches are (string) pks, or - from the file, if get_model_queryset isn't overridden -
+        MappedRow objects, which have the display name and so don't need retrieving (other
+        than checking that they haven't been deleted, see _live_rows). All models
+        are left out if match_objects or filter_field are overridden (see
+        _indexes_match_defaults), as are models whose in-process index can't be built - or is
+        still being built, in the background."""
+        if not self._indexes_match_defaults():
+            return {}
+
+        mapped_index = self._get_mapped_index()
+        use_rows = not self._is_overridden("get_model_queryset")
+        terms = self._query_terms(query)
+        matches = {}
+        # index (in targets) -> model class, for models that aren't in the file
+        unmapped = {}
+
+        for i, (model_class, _, queryset) in targets.items():
+            label = model_class._meta.label
+            if mapped_index is not None and label in mapped_index:
+                rows = mapped_index.section(label).match_all(terms)
+                if use_rows:
+                    matches[i] = self._live_rows(queryset, rows)
+                else:
+                    matches[i] = [row.pk for row in rows]
+            else:
+                unmapped[i] = model_class
+
+        if unmapped:
+            try:
+                indexes = self._get_trigram_indexes().get_many(set(unmapped.values()))
+            except Exception:
+                # e.g. a model's table can't be read, so fall back to one query per model
+                indexes = {}
+            for i, model_class in unmapped.items():
+                if model_class in indexes:
+                    matches[i] = indexes[model_class].match_all(terms)
+
+        return matches
+
+    def _live_rows(self, queryset: QuerySet, rows: List[MappedRow]) -> List[MappedRow]:
+        """Returns the rows (matched in the index file) of objects that are still in the
+        queryset, since the file is a snapshot - which may have rows of deleted objects. Only
+        their pks are queried, since the rows have the display names."""
+        if not rows:
+            return rows
+
+        to_python = queryset.model._meta.pk.to_python
+        pks = queryset.filter(pk__in=[row.pk for row in rows]).values_list(
+            "pk", flat=True
+        )
+        live_pks = set(pks)
+        return [row for row in rows if to_python(row.pk) in live_pks]
+
+    def _get_mapped_index(self) -> Optional[MappedIndex]:
+        """Returns the mapped site_search_index_path file, or None if it's not set (or doesn't
+        exist). The file is re-mapped if it's been replaced since it was last mapped."""
+        if self.site_search_index_path is None:
+            return None
+
+        try:
+            signature = file_signature(self.site_search_index_path)
+        except FileNotFoundError:
+            return None
+
+        mapped_index = self._mapped_index
+        if mapped_index is None or mapped_index.signature != signature:
+            mapped_index = MappedIndex(self.site_search_index_path)
+            self._mapped_index = mapped_index
+
+        return mapped_index
+
+    def write_search_index(self, path: Optional[str] = None):
+        """Writes the trigram index of every registered model's Char fields to a file, which
+        is used by the in_memory_index site_search_method if site_search_index_path is set.
+        Each object's display name is stored alongside its pk, so that matches don't need
+        retrieving from the database.
+
+        :param path: The file path (defaults to site_search_index_path)."""
+        path = path or self.site_search_index_path
+        if not path:
+            raise ValueError("A path is required, if site_search_index_path isn't set")
+
+        write_index(
+            path,
+            (
+                (model_class._meta.label, self._index_rows(model_class))
+                for model_class in list(self._registry)
+            ),
+            self.site_search_fold_text,
+        )
+
+    def build_search_index(
+        self,
+        model_classes: Optional[Iterable[Type[Model]]] = None,
+        resume: bool = False,
+        chunk_size: int = 2000,
+        workers: int = 1,
+        part_size: int = 100000,
+    ) -> Iterator[Tuple[Type[Model], Optional[int]]]:
+        """(Re)builds the index used by the site_search_method, one model at a time (unless
+        workers is more than 1) - yielding each model class with the number of objects indexed,
+        or None if it was skipped. Used by the build_site_search_index management command.
+
+        In both cases, searches keep using the current index until the new one has been built
+        in full and validated, at which point it replaces the current one atomically.
+
+        - sqlite_fts5: each model is re-indexed in a new generation of its database's index
+          (and skipped if that isn't SQLite), to which other models are copied. The generation
+          is activated once each model's row count matches its number of objects, and
+          generations retired more than site_search_index_grace_period seconds ago are dropped.
+        - in_memory_index: each model is written to a segment file, in the "<path>.segments"
+          directory (where path is site_search_index_path), after which all segments in the
+          directory are merged into a new file. The new file replaces the index file once each
+          model's document count matches its segment. If workers is more than 1, segments are
+          written in parallel, by a pool of that many processes - with models of more than
+          part_size objects split into a segment per pk range (see admin_site_search.parallel).
+        - model_char_fields: if site_search_bloom_filters is True, each model's bloom filter is
+          built, and stored in the cache (see admin_site_search.bloom), ahead of the first
+          search. Otherwise, there's no index to build.
+        - a SearchBackend: as per its index_build() (with workers 1 only).
+
+        :param model_classes: The model classes to build (defaults to all registered models).
+        :param resume: Skip models that were built by an interrupted build.
+        :param chunk_size: The number of objects read per query.
+        :param workers: The number of worker processes (in_memory_index only).
+        :param part_size: The maximum number of objects per segment, if workers is more than 1.
+        :raises ValueError: If the new index fails validation, in which case it's discarded."""
+        if model_classes is None:
+            model_classes = list(self._registry)
+
+        if self.site_search_method == "sqlite_fts5":
+            if workers > 1:
+                # SQLite has a single writer, so the index can't be written in parallel
+                raise ImproperlyConfigured(
+                    "The sqlite_fts5 index can't be built with more than one worker"
+                )
+            yield from self._build_fts5_index(model_classes, resume, chunk_size)
+        elif self.site_search_method == "in_memory_index":
+            if not self.site_search_index_path:
+                raise ImproperlyConfigured(
+                    "site_search_index_path must be set, to build the in_memory_index file"
+                )
+            yield from self._build_index_file(
+                model_classes, resume, chunk_size, workers, part_size
+            )
+        elif (
+            self.site_search_method == "model_char_fields"
+            and self.site_search_bloom_filters
+        ):
+            if workers > 1:
+                raise ImproperlyConfigured(
+                    "Bloom filters can't be built with more than one worker"
+                )
+            for model_class in model_classes:
+                yield model_class, self._get_bloom_filters().build(model_class)
+        elif is_backend_path(self.site_search_method):
+            if workers > 1:
+                raise ImproperlyConfigured(
+                    "Search backends can't be built with more than one worker"
+                )
+            yield from self._get_backend().index_build(list(model_classes), chunk_size)
+        else:
+            raise ImproperlyConfigured(
+                f"The {self.site_search_method} site_search_method doesn't have an index"
+            )
+
+    def _build_fts5_index(
+        self, model_classes: List[Type[Model]], resume: bool, chunk_size: int
+    ) -> Iterator[Tuple[Type[Model], Optional[int]]]:
+        """Builds a new generation of the FTS5 index of each database, then validates and
+        activates it, as per build_search_index()."""
+        databases = {m: router.db_for_write(m) for m in model_classes}
+        supported = {m: db for m, db in databases.items() if fts5.is_supported(db)}
+        folded = self.site_search_fold_text
+        labels = {m: fts5.index_label(m._meta.label, folded) for m in model_classes}
+        # database alias -> the generation being built
+        generations = {}
+
+        for db in set(supported.values()):
+            fts5.ensure_tables(db)
+            generation = fts5.building_generation(db) if resume else None
+            if generation is None:
+                generation = fts5.start_generation(
+                    db, [labels[m] for m, d in supported.items() if d == db]
+                )
+            generations[db] = generation
+
+        for model_class in model_classes:
+            db = supported.get(model_class)
+            if db is None or (
+                resume
+                and fts5.indexed_labels(db, [labels[model_class]], generations[db])
+            ):
+                yield model_class, None
+            else:
+                yield (
+                    model_class,
+                    fts5.build(model_class, db, chunk_size, generations[db], folded),
+                )
+
+        for db, generation in generations.items():
+            try:
+                fts5.validate(
+                    db, generation, [m for m, d in supported.items() if d == db], folded
+                )
+            except ValueError:
+                fts5.drop_generation(db, generation)
+                raise
+            fts5.activate(db, generation)
+            fts5.collect_garbage(db, self.site_search_index_grace_period)
+
+    def _build_index_file(
+        self,
+        model_classes: List[Type[Model]],
+        resume: bool,
+        chunk_size: int,
+        workers: int,
+        part_size: int,
+    ) -> Iterator[Tuple[Type[Model], Optional[int]]]:
+        """Builds the segment file(s) of each model class, then merges every segment into the
+        site_search_index_path file, as per build_search_index()."""
+        # checked before any segment is written
+        import_path = self._get_import_path() if workers > 1 else None
+        directory = f"{self.site_search_index_path}.segments"
+        os.makedirs(directory, exist_ok=True)
+
+        if not resume:
+            for model_class in model_classes:
+                parallel.remove_parts(model_class, directory)
 
-        return JsonResponse({"results": results, "counts": counts, "errors": errors})
+        # model class -> parts that haven't been written (yet)
+        remaining = {}
+        for model_class in model_classes:
+            parts = parallel.plan_parts(
+                model_class, directory, part_size if workers > 1 else None
+            )
+            # segments are written atomically, so those that exist are complete
+            parts = [part for part in parts if not os.path.exists(part.path)]
+            if parts:
+                remaining[model_class] = parts
+            else:
+                yield model_class, None
+
+        pending = [part for parts in remaining.values() for part in parts]
+        if workers > 1:
+            written = parallel.build_parts(import_path, pending, chunk_size, workers)
+        else:
+            written = (
+                (
+                    part,
+                    self._write_segment(apps.get_model(part.label), part, chunk_size),
+                )
+                for part in pending
+            )
+
+        # model class -> number of objects written
+        counts = {}
+        for part, count in written:
+            model_class = apps.get_model(part.label)
+            counts[model_class] = counts.get(model_class, 0) + count
+            remaining[model_class].remove(part)
+            if not remaining[model_class]:
+                yield model_class, counts[model_class]
+
+        segments = sorted(
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.endswith(".idx")
+        )
+        # merged alongside the index file, which is only replaced once the merge is validated
+        staged_path = f"{self.site_search_index_path}.next"
+        merge_index(segments, staged_path)
+        try:
+            self._validate_index_file(staged_path, segments)
+        except ValueError:
+            os.remove(staged_path)
+            raise
+        os.replace(staged_path, self.site_search_index_path)
+
+    def _get_import_path(self) -> str:
+        """Returns the dotted path from which worker processes import this site: the
+        site_search_import_path, or django.contrib.admin.site if this is the default site.
+
+        :raises ImproperlyConfigured: If neither is the case."""
+        if self.site_search_import_path:
+            return self.site_search_import_path
+        if default_site == self:
+            return "django.contrib.admin.site"
+        raise ImproperlyConfigured(
+            "site_search_import_path must be set, to build the in_memory_index file of a site "
+            "other than admin.site with more than one worker"
+        )
+
+    def _validate_index_file(self, path: str, segments: List[str]):
+        """Checks that the (merged) index file can be mapped, and has the same document count
+        for each model as its segment(s).
+
+        :raises ValueError: If it doesn't."""
+        expected = {}
+        for segment in segments:
+            for label, count in index_counts(segment).items():
+                expected[label] = expected.get(label, 0) + count
+
+        counts = index_counts(path)
+        for label, count in expected.items():
+            if counts.get(label) != count:
+                raise ValueError(
+                    f"{label} has {counts.get(label)} documents in {path}, but {count} in "
+                    f"its segments"
+                )
+        MappedIndex(path).close()
+
+    def _write_segment(
+        self, model_class: Type[Model], part: "parallel.Part", chunk_size: int
+    ) -> int:
+        """Writes the segment file of a part of the model class.
+
+        :return: The number of objects written."""
+        count = 0
+
+        def rows():
+            nonlocal count
+            for row in self._index_rows(model_class, chunk_size, part.bounds):
+                count += 1
+                yield row
+
+        write_index(
+            part.path,
+            [(model_class._meta.label, rows())],
+            self.site_search_fold_text,
+        )
+        return count
+
+    def _index_rows(
+        self,
+        model_class: Type[Model],
+        chunk_size: int = 2000,
+        bounds: Optional[Tuple[Any, Any]] = None,
+    ) -> Iterable[Tuple[Any, str, list]]:
+        """Yields a (pk, display name, values) row for every object of the model class, in the
+        default order, where values are those of the indexed (Char) fields. Objects are read in
+        chunks, so memory use doesn't depend on the number of objects.
+
+        If (low, high) pk bounds are given, only the objects in that range are read, in pk
+        order."""
+        field_names = self._get_search_plan(model_class).field_names
+        if not field_names:
+            # nothing can be matched, so there's no need to read any objects
+            return
+
+        queryset = model_class._default_manager.all()
+        if bounds is not None:
+            low, high = bounds
+            queryset = queryset.order_by("pk")
+            if low is not None:
+                queryset = queryset.filter(pk__gte=low)
+            if high is not None:
+                queryset = queryset.filter(pk__lt=high)
+
+        # full objects, rather than values, since the display name may use any field
+        for obj in queryset.iterator(chunk_size=chunk_size):
+            yield obj.pk, str(obj), [getattr(obj, name) for name in field_names]
+
+    def search_index_sizes(
+        self, model_classes: Optional[Iterable[Type[Model]]] = None
+    ) -> Iterator[Tuple[Type[Model], int, int, bool]]:
+        """Yields the size of each model class' in_memory_index index, as a (model class,
+        objects, bytes, mapped) tuple - where mapped is True if the index is a section of the
+        site_search_index_path file (and so is shared between processes), rather than built
+        in-process. Indexes that haven't been built yet are built. Used by the
+        report_site_search_index management command.
+
+        :param model_classes: The model classes (defaults to all registered models)."""
+        if model_classes is None:
+            model_classes = list(self._registry)
+
+        mapped_index = self._get_mapped_index()
+        for model_class in model_classes:
+            label = model_class._meta.label
+            if mapped_index is not None and label in mapped_index:
+                index = mapped_index.section(label)
+                yield model_class, len(index), index.nbytes(), True
+            else:
+                indexes = self._get_trigram_indexes().get_many([model_class], wait=True)
+                index = indexes[model_class]
+                yield model_class, len(index), index.nbytes(), False
+
+    def _get_trigram_indexes(self) -> TrigramIndexRegistry:
+        """Returns the registry of (in-process) trigram indexes, used by the in_memory_index
+        site_search_method."""
+        if self._trigram_indexes is None:
+            self._trigram_indexes = TrigramIndexRegistry(
+                self.site_search_cache_alias,
+                self._build_trigram_index,
+                self._update_trigram_index,
+            )
+        return self._trigram_indexes
+
+    def _build_trigram_index(self, model_class: Type[Model]) -> TrigramIndex:
+        """Returns a new trigram index of the model class' Char fields (folded, if
+        site_search_fold_text is set)."""
+        field_names = self._get_search_plan(model_class).field_names
+        return build_trigram_index(model_class, field_names, self.site_search_fold_text)
+
+    def _update_trigram_index(
+        self, model_class: Type[Model], index: TrigramIndex, pks: List
+    ) -> TrigramIndex:
+        """Returns the model class' trigram index, updated with the objects with the pks."""
+        field_names = self._get_search_plan(model_class).field_names
+        return update_trigram_index(model_class, field_names, index, pks)
+
+    def _get_searchable_model_class(
+        self, request: HttpRequest, app: dict, model: dict
+    ) -> Optional[Model]:
+        """Returns the model class, or None if the model should be skipped."""
+        if not model["perms"]["view"]:
+            # user has no permission to view this model, so skip
+            return None
+
+        # None if unable to retrieve model class, so skip
+        return self.get_model_class(request, app["app_label"], model)
+
+    def _model_result(
+        self,
+        request: HttpRequest,
+        query: str,
+        app: dict,
+        model: dict,
+        model_class: Type[Model],
+        fields: List[Field],
+        objects: Iterable[Model],
+    ) -> Optional[dict]:
+        """Returns the result for a single model, or None if neither the model, nor any of its
+        objects, were matched."""
+        # haven't matched any objects, or model names, so skip
+        if not objects and not self._match_model(
+            request, query, model, model_class, fields
+        ):
+            return None
+
+        model_result = {
+            "id": f"{app['app_label']}.{model['object_name']}",
+            "name": model["name"],
+            "url": model["admin_url"],
+            "url_add": model["add_url"] if model["perms"]["add"] else None,
+            "objects": [],
+        }
+
+        for obj in objects:
+            object_result = {
+                "id": str(obj.pk),
+                "name": str(obj),
+                "url": f"{model['admin_url']}{obj.pk}",
+            }
+            model_result["objects"].append(object_result)
+
+        return model_result
+
+    def _match_model(
+        self,
+        request: HttpRequest,
+        query: str,
+        model: dict,
+        model_class: Type[Model],
+        fields: List[Field],
+    ) -> bool:
+        """Returns match_model(), using the metadata index in place of the default
+        implementation."""
+        if not self._is_overridden("match_model") and fields is (
+            self._get_search_plan(model_class).fields
+        ):
+            index = self._get_metadata_index()
+            if model_class in index:
+                # the (per-request) name is matched as-is, everything else is indexed
+                return query.lower() in model["name"].lower() or (
+                    model_class in index.match(query)
+                )
+
+        return self.match_model(
+            request, query, model["name"], model["object_name"], fields
+        )
+
+    def _get_metadata_index(self) -> MetadataIndex:
+        """Returns the metadata index of all registered models, for the active language."""
+        language = translation.get_language()
+        index = self._metadata_indexes.get(language)
+
+        if index is None:
+            plans = [self._get_search_plan(m) for m in list(self._registry)]
+            index = self._metadata_indexes.setdefault(
+                language,
+                MetadataIndex(
+                    (p.model_class, model_metadata_terms(p.model_class, p.fields))
+                    for p in plans
+                ),
+            )
+
+        return index
+
+    def _model_error(self, app: dict, model: dict, ex: Exception) -> dict:
+        """Returns the error dict for an exception raised while searching a model, if
+        DEBUG=True - otherwise an empty dict, which still marks the response as partial."""
+        # except/skip to avoid unexpected issues with one model preventing any results
+        # from being returned - log the error client-side instead (not in production)
+        if settings.DEBUG:
+            return {
+                "error": repr(ex),
+                "error_message": str(ex),
+                "app": app["app_label"],
+                "model": model["object_name"],
+            }
+        return {}
 
     def match_app(self, request: HttpRequest, query: str, name: str) -> bool:
         """Case-insensitive match the app name.
@@ -151,8 +2192,8 @@ class AdminSiteSearchView:
             # return early if we match a name
             return True
         for field in fields:
-            verbose_name = getattr(field, "verbose_name", "")
-            help_text = getattr(field, "help_text", "")
+            verbose_name = str(getattr(field, "verbose_name", "")).lower()
+            help_text = str(getattr(field, "help_text", "")).lower()
             if _query in field.name or _query in verbose_name or _query in help_text:
                 # return early if we match any field attr
                 return True
@@ -169,44 +2210,85 @@ class AdminSiteSearchView:
 
         - model_char_fields: OR filter across all Char fields in the model.
         - admin_search_fields: delegates search to the model's corresponding admin search_fields.
+        - sqlite_fts5/in_memory_index: as per model_char_fields, since the index is matched for
+          all models at once, in search().
+        - the dotted path of a SearchBackend: as per its filter(), if it's a QuerySetBackend.
+          Otherwise, no objects, since all models are matched at once, in its search().
 
         :param request: The HTTPRequest object.
         :param query: The search query string.
         :param model_class: The model class.
         :param model_fields: A list of the model's fields.
         """
-        results = model_class.objects.none()
-        model_admin = self._registry.get(model_class)
+        model_admin = self._get_search_plan(model_class).model_admin
         queryset = self.get_model_queryset(request, model_class, model_admin)
 
-        if self.site_search_method == "model_char_fields":
-            filters = Q()
+        return self._filter_objects(
+            request, query, model_class, model_fields, model_admin, queryset
+        )[:5]
 
-            for field in model_fields:
-                filter_ = self.filter_field(request, query, field)
-                if filter_:
-                    filters |= filter_
+    async def amatch_objects(
+        self,
+        request: HttpRequest,
+        query: str,
+        model_class: Model,
+        model_fields: List[Field],
+    ) -> List[Model]:
+        """Async variant of match_objects(), used by asearch(). Returns the list of (up to 5)
+        objects, evaluated with the async ORM - or, if match_objects() is overridden, with it
+        (in a thread).
 
-            if filters:
-                results = queryset.filter(filters)
-        elif self.site_search_method == "admin_search_fields":
-            if model_admin and model_admin.search_fields:
-                results, may_have_duplicates = model_admin.get_search_results(
-                    request=request, queryset=queryset, search_term=query
+        :param request: The HTTPRequest object.
+        :param query: The search query string.
+        :param model_class: The model class.
+        :param model_fields: A list of the model's fields.
+        """
+        if self._is_overridden("match_objects"):
+            # i.e. customisations of the sync view apply to the async view, too
+            return await sync_to_async(
+                lambda: list(
+                    self.match_objects(request, query, model_class, model_fields)
                 )
+            )()
 
-                if may_have_duplicates:
-                    # can happen if search_fields contains a many-to-many relation
-                    results = results.distinct()
+        model_admin = self._get_search_plan(model_class).model_admin
+        queryset = await self.aget_model_queryset(request, model_class, model_admin)
 
-        return results[:5]
+        results = self._filter_objects(
+            request, query, model_class, model_fields, model_admin, queryset
+        )[:5]
+
+        if hasattr(results, "__aiter__"):
+            return [obj async for obj in results]
+        # the async ORM interface is only available in django >= 4.1
+        return await sync_to_async(list)(results)
+
+    def _filter_objects(
+        self,
+        request: HttpRequest,
+        query: str,
+        model_class: Model,
+        model_fields: List[Field],
+        model_admin: Optional[ModelAdmin],
+        queryset: QuerySet,
+    ) -> QuerySet:
+        """Returns the queryset filtered as per the site_search_method (see match_objects)."""
+        backend = self._get_backend()
+        if not isinstance(backend, QuerySetBackend):
+            # i.e. objects are matched in search(), for all models at once
+            return model_class.objects.none()
+
+        return backend.filter(
+            request, query, model_class, model_fields, model_admin, queryset
+        )
 
     def filter_field(
         self, request: HttpRequest, query: str, field: Field
     ) -> Optional[Q]:
         """Returns a Q 'icontains' filter for Char fields, otherwise None.
 
-        Note: this method is only invoked if model_char_fields is the site_search_method.
+        Note: this method is only invoked if model_char_fields is the site_search_method (or
+        sqlite_fts5/in_memory_index, for models that can't be indexed).
 
         :param request: The HTTPRequest object.
         :param query: The search query string.
@@ -230,6 +2312,21 @@ class AdminSiteSearchView:
         """
         return model_class.objects.all()
 
+    async def aget_model_queryset(
+        self,
+        request: HttpRequest,
+        model_class: Model,
+        model_admin: Optional[ModelAdmin],
+    ) -> QuerySet:
+        """Async variant of get_model_queryset(), used by amatch_objects(). Defaults to the
+        (lazy, so safe to call here) result of get_model_queryset().
+
+        :param request: The HTTPRequest object.
+        :param model_class: The model class.
+        :param model_admin: The model admin, which is non-None for all registered models.
+        """
+        return self.get_model_queryset(request, model_class, model_admin)
+
     def get_model_class(
         self, request: HttpRequest, app_label: str, model_dict: dict
     ) -> Optional[Model]:
@@ -249,3 +2346,23 @@ class AdminSiteSearchView:
             # model_dict["model"] only available in django 4.x
             model_class = apps.get_model(app_label, model_dict["object_name"])
         return model_class
+
+    def _async_admin_view(self, view: Callable) -> Callable:
+        """Async equivalent of admin_view(), which (as of django 6.0) only wraps sync views.
+        Unauthorised requests are redirected to the login page, and responses are marked as
+        non-cacheable."""
+
+        async def inner(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+            if not await sync_to_async(self.has_permission)(request):
+                # inner import to avoid importing django.contrib.auth models on load
+                from django.contrib.auth.views import redirect_to_login
+
+                return redirect_to_login(
+                    request.get_full_path(),
+                    reverse("admin:login", current_app=self.name),
+                )
+            response = await view(request, *args, **kwargs)
+            add_never_cache_headers(response)
+            return response
+
+        return update_wrapper(inner, view)
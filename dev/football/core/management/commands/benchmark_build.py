@@ -0,0 +1,100 @@
+"""Management command for benchmarking parallel builds of the in_memory_index file, with an
+increasing number of workers. Should be run against a local (SQLite) copy of the database, e.g.
+the dev one, which is populated with benchmark teams (if it has fewer than --objects)."""
+
+import os
+import tempfile
+import time
+
+from django.contrib import admin
+from django.core.management import BaseCommand
+from django.utils.crypto import get_random_string
+
+from dev.football.teams.models import Team
+
+PREFIX = "benchmark-team-"
+
+
+class Command(BaseCommand):
+    """Builds the index file of the Team model with one worker, then each (other) number of
+    workers, and reports the time, rate, and speed-up (relative to one worker) of each"""
+
+    help = "Benchmark parallel builds of the search index file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--objects",
+            type=int,
+            default=200000,
+            help="The number of teams to index (default: 200000).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            nargs="+",
+            default=sorted({2, 4, os.cpu_count() or 1}),
+            help=(
+                "The numbers of workers to compare with one worker "
+                "(default: 2, 4, and the CPU count)."
+            ),
+        )
+        parser.add_argument(
+            "--part-size",
+            type=int,
+            default=10000,
+            help="The maximum number of objects per part (default: 10000).",
+        )
+
+    def handle(self, *args, **options):
+        self._populate(options["objects"])
+
+        site = admin.site
+        site.site_search_method = "in_memory_index"
+        results = {}
+
+        with tempfile.TemporaryDirectory() as directory:
+            site.site_search_index_path = os.path.join(directory, "site-search.idx")
+            # i.e. the baseline, which every other number of workers is compared to
+            for workers in sorted({1, *options["workers"]}):
+                start = time.perf_counter()
+                builds = site.build_search_index(
+                    model_classes=[Team],
+                    workers=workers,
+                    part_size=options["part_size"],
+                )
+                count = sum(count or 0 for _, count in builds)
+                results[workers] = time.perf_counter() - start
+                self.stdout.write(
+                    f"{workers} worker(s): {count} rows in {results[workers]:.2f}s "
+                    f"({count / results[workers]:.0f} rows/sec, "
+                    f"{results[1] / results[workers]:.2f}x)"
+                )
+
+        most = max(results)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"1 worker: {results[1]:.2f}s, {most} worker(s): {results[most]:.2f}s "
+                f"({results[1] / results[most]:.2f}x, CPU count: {os.cpu_count()})"
+            )
+        )
+
+    def _populate(self, objects: int):
+        """Creates benchmark teams, until there are at least the given number."""
+        count = Team.objects.filter(key__startswith=PREFIX).count()
+        if count >= objects:
+            return
+
+        self.stdout.write(f"Creating {objects - count} teams...")
+        Team.objects.bulk_create(
+            (
+                Team(
+                    name=f"{get_random_string(8)} {get_random_string(10)} FC",
+                    key=f"{PREFIX}{i}",
+                    type="CLUB",
+                    website=f"https://{get_random_string(12).lower()}.com",
+                    motto=" ".join(get_random_string(6) for _ in range(4)),
+                )
+                for i in range(count, objects)
+            ),
+            batch_size=5000,
+        )
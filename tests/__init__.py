@@ -5,6 +5,8 @@ from django.test import Client
 from django.urls import reverse
 
 from admin_site_search.views import AdminSiteSearchView, SiteSearchMethodType
+from dev.football.teams.factories import TeamFactory
+from dev.football.teams.models import Team
 
 
 def request_search(
@@ -28,3 +30,44 @@ def request_search(
             response = client.get(url)
 
     return response
+
+
+def request_search_index(client: Client, query: str):
+    """Performs a search, with the in_memory_index site_search_method"""
+    return request_search(client, query=query, site_search_method="in_memory_index")
+
+
+def count_searches(spy, model_class=Team) -> int:
+    """Returns the number of times the model was searched, as per the match_objects spy"""
+    return len([c for c in spy.call_args_list if c[0][3] is model_class])
+
+
+def create_team(name: str, **kwargs) -> Team:
+    """Returns a new team (without a stadium), with deterministic values for all Char
+    fields - so that only the given values can match a query"""
+    fields = {
+        "key": name,
+        "motto": "-",
+        "website": "https://example.com",
+        "stadium": None,
+    }
+    return TeamFactory(name=name, **{**fields, **kwargs})
+
+
+def object_names(response, model_id: str) -> list:
+    """Returns the (sorted) names of the model's objects in the response"""
+    for app in response.json()["results"]["apps"]:
+        for model in app["models"]:
+            if model["id"] == model_id:
+                return sorted(o["name"] for o in model["objects"])
+    return []
+
+
+def team_names(response) -> list:
+    """Returns the (sorted) names of the teams in the response"""
+    return object_names(response, "teams.Team")
+
+
+def player_names(response) -> list:
+    """Returns the (sorted) names of the players in the response"""
+    return object_names(response, "players.Player")
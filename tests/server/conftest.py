@@ -1,9 +1,17 @@
 """Pytest config and fixtures, for "unit" tests that run without a browser"""
 
+from unittest.mock import patch
+
 import pytest
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test.client import Client
 
+from admin_site_search import fts5
+from admin_site_search.bloom import BloomFilterRegistry
+from admin_site_search.trigrams import TrigramIndexRegistry
+from admin_site_search.views import AdminSiteSearchView
+
 
 @pytest.fixture(autouse=True)
 def enable_db_access_for_all_tests(db):
@@ -11,6 +19,25 @@ def enable_db_access_for_all_tests(db):
     pass
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Ensures every test starts (and ends) with an empty cache, i.e. no cached results, and
+    new generations - so in-process indexes built by other tests are rebuilt"""
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def rebuild_indexes_in_request():
+    """(Re)builds indexes in the request's thread, since background threads use their own
+    connections - which can't read the (uncommitted) data of each test"""
+    with patch.object(TrigramIndexRegistry, "background", False):
+        with patch.object(BloomFilterRegistry, "background", False):
+            with patch.object(fts5, "BACKGROUND_BUILDS", False):
+                yield
+
+
 @pytest.fixture()
 def user_standard(client):
     """An authenticated user"""
@@ -82,3 +109,16 @@ def client_super_admin(client_admin, user_admin):
     user_admin.save()
 
     return client_admin
+
+
+@pytest.fixture()
+def match_objects():
+    """Spies on match_objects, to count the searches that queried the database (see
+    tests.count_searches)"""
+    with patch.object(
+        AdminSiteSearchView,
+        "match_objects",
+        autospec=True,
+        side_effect=AdminSiteSearchView.match_objects,
+    ) as spy:
+        yield spy
@@ -0,0 +1,214 @@
+"""Tests verifying that superseded searches are abandoned (site_search_abandon_superseded), i.e.
+stop querying models once a later search from the same page has started"""
+
+import json
+from unittest.mock import patch
+
+import pytest
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from admin_site_search import abandon
+from admin_site_search.abandon import SearchAbandoned, parse_sequence
+from admin_site_search.views import AdminSiteSearchView
+from dev.admin import CustomAdminSite
+from dev.football.players.factories import PlayerFactory
+from dev.football.stadiums.factories import StadiumFactory
+from dev.football.teams.factories import TeamFactory
+
+urls_async = override_settings(ROOT_URLCONF="tests.server.test_async.urls_async")
+
+
+@pytest.fixture()
+def abandon_enabled():
+    """Enables abandoning superseded searches, checked before every model"""
+    with patch.object(AdminSiteSearchView, "site_search_abandon_superseded", True):
+        with patch.object(abandon, "CHECK_INTERVAL", 0):
+            yield
+
+
+@pytest.fixture()
+def data():
+    """Creates matching objects across multiple apps"""
+    TeamFactory(name="Manchester United")
+    PlayerFactory(name="Manuel Almunia")
+    StadiumFactory(name="Manchester Arena")
+
+
+def request_numbered(
+    client: Client, query: str, number: int, page: str = "page", **kwargs
+):
+    """Returns the response after performing a GET request against the "admin:site-search"
+    endpoint, numbered within the page's searches"""
+    return client.get(
+        f"{reverse('admin:site-search')}?q={query}",
+        HTTP_X_SITE_SEARCH_SEQUENCE=f"{page}:{number}",
+        **kwargs,
+    )
+
+
+def supersede_after(count: int, page: str = "page"):
+    """Returns a match_objects side effect, which starts a later search from the page after
+    matching count models"""
+    calls = []
+
+    def match_objects(self, request, *args, **kwargs):
+        calls.append(args)
+        if len(calls) == count:
+            header = f"{page}:99"
+            parse_sequence("default", self.name, request.user.pk, header).start()
+        return AdminSiteSearchView.match_objects(self, request, *args, **kwargs)
+
+    return match_objects
+
+
+@pytest.mark.usefixtures("abandon_enabled", "data")
+def test_superseded(client_super_admin):
+    """Verify that no more models are searched once a later search has started, and that
+    there's no content to respond with"""
+    with patch.object(
+        CustomAdminSite, "match_objects", autospec=True, side_effect=supersede_after(2)
+    ) as match_objects:
+        response = request_numbered(client_super_admin, query="man", number=1)
+
+    assert response.status_code == 204
+    assert match_objects.call_count == 2
+
+
+@pytest.mark.usefixtures("abandon_enabled", "data")
+def test_out_of_order(client_super_admin):
+    """Verify that a search arriving after a later one is abandoned straight away"""
+    request_numbered(client_super_admin, query="manc", number=2)
+
+    with patch.object(CustomAdminSite, "match_objects", autospec=True) as match_objects:
+        response = request_numbered(client_super_admin, query="man", number=1)
+
+    assert response.status_code == 204
+    assert match_objects.call_count == 0
+
+
+@pytest.mark.usefixtures("abandon_enabled", "data")
+def test_other_pages(client_super_admin):
+    """Verify that searches are only superseded by those from the same page"""
+    request_numbered(client_super_admin, query="manc", number=2, page="other")
+
+    response = request_numbered(client_super_admin, query="man", number=1)
+
+    assert response.status_code == 200
+    assert response.json()["counts"]["objects"] == 3
+
+
+@pytest.mark.usefixtures("abandon_enabled", "data")
+def test_threads(client_super_admin):
+    """Verify that queued models aren't searched by the thread pool, once superseded"""
+    with patch.object(AdminSiteSearchView, "site_search_max_workers", 2):
+        with patch.object(
+            CustomAdminSite,
+            "match_objects",
+            autospec=True,
+            side_effect=supersede_after(1),
+        ) as match_objects:
+            response = request_numbered(client_super_admin, query="man", number=1)
+
+    assert response.status_code == 204
+    # i.e. at most the model being searched by the other thread
+    assert match_objects.call_count <= 2
+
+
+@pytest.mark.usefixtures("abandon_enabled", "data")
+def test_stream(client_super_admin):
+    """Verify that a superseded stream ends, without counts"""
+    with patch.object(AdminSiteSearchView, "site_search_stream", True):
+        with patch.object(
+            CustomAdminSite,
+            "match_objects",
+            autospec=True,
+            side_effect=supersede_after(8),
+        ):
+            response = request_numbered(
+                client_super_admin,
+                query="man",
+                number=1,
+                HTTP_ACCEPT="application/x-ndjson",
+            )
+            lines = [json.loads(line) for line in response.streaming_content]
+
+    # i.e. the apps searched before it was superseded
+    assert [list(line) for line in lines] == [["app"], ["app"]]
+
+
+@pytest.mark.usefixtures("abandon_enabled", "data")
+@urls_async
+def test_async(client_super_admin):
+    """Verify that the async view abandons superseded searches"""
+    request_numbered(client_super_admin, query="manc", number=2)
+
+    response = request_numbered(client_super_admin, query="man", number=1)
+    response_latest = request_numbered(client_super_admin, query="man", number=3)
+
+    assert response.status_code == 204
+    assert response_latest.json()["counts"]["objects"] == 3
+
+
+@pytest.mark.usefixtures("abandon_enabled", "data")
+def test_not_cached(client_super_admin):
+    """Verify that abandoned searches aren't cached"""
+    with patch.object(AdminSiteSearchView, "site_search_cache_timeout", 60):
+        with patch.object(
+            CustomAdminSite,
+            "match_objects",
+            autospec=True,
+            side_effect=supersede_after(1),
+        ):
+            request_numbered(client_super_admin, query="man", number=1)
+        response = request_numbered(client_super_admin, query="man", number=100)
+
+    assert response.status_code == 200
+    assert response.json()["counts"]["objects"] == 3
+
+
+@pytest.mark.usefixtures("data")
+def test_disabled(client_super_admin):
+    """Verify that, by default, searches aren't abandoned"""
+    assert AdminSiteSearchView.site_search_abandon_superseded is False
+    request_numbered(client_super_admin, query="manc", number=2)
+
+    response = request_numbered(client_super_admin, query="man", number=1)
+
+    assert response.status_code == 200
+
+
+def test_sequence():
+    """Verify that searches are superseded by later ones, and invalid headers are ignored"""
+    first = parse_sequence("default", "admin", 1, "page:1")
+    second = parse_sequence("default", "admin", 1, "page:2")
+    first.start()
+    second.start()
+    first.start()
+
+    assert first.is_superseded()
+    assert not second.is_superseded()
+    with pytest.raises(SearchAbandoned):
+        first.check()
+    assert not parse_sequence("default", "admin", 2, "page:1").is_superseded()
+
+    for header in [None, "", "page", "page:x", "pa ge:1", f"{'p' * 65}:1"]:
+        assert parse_sequence("default", "admin", 1, header) is None
+
+
+def test_check_throttled():
+    """Verify that the cache is read at most once per CHECK_INTERVAL, rather than per check"""
+    first = parse_sequence("default", "admin", 1, "page:1")
+    first.start()
+    first.check()
+    parse_sequence("default", "admin", 1, "page:2").start()
+
+    with patch.object(abandon.time, "monotonic", return_value=first.checked_at):
+        first.check()
+    with patch.object(
+        abandon.time,
+        "monotonic",
+        return_value=first.checked_at + abandon.CHECK_INTERVAL,
+    ):
+        with pytest.raises(SearchAbandoned):
+            first.check()
@@ -20,10 +20,11 @@ def test_empty(client_admin):
     data = response.json()
 
     assert response.status_code == 200
-    assert len(data.keys()) == 3
+    assert len(data.keys()) == 4
     assert data["results"] == {"apps": []}
     assert data["counts"] == {"apps": 0, "models": 0, "objects": 0}
     assert not data["errors"]
+    assert not data["partial"]
 
 
 def test_apps(client_super_admin):
@@ -32,7 +33,7 @@ def test_apps(client_super_admin):
     data = response.json()
 
     assert response.status_code == 200
-    assert len(data.keys()) == 3
+    assert len(data.keys()) == 4
     assert data["results"] == {
         "apps": [
             {
@@ -229,7 +230,7 @@ def test_errors_on(client_super_admin):
         data = response.json()
 
     assert response.status_code == 200
-    assert len(data.keys()) == 3
+    assert len(data.keys()) == 4
     assert data["results"] == {
         "apps": [
             {
@@ -262,6 +263,7 @@ def test_errors_on(client_super_admin):
         "app": "stadiums",
         "model": "Stadium",
     }
+    assert data["partial"]
 
 
 @override_settings(DEBUG=False)
@@ -278,3 +280,4 @@ def test_errors_off(client_super_admin):
     assert data["results"] == {"apps": []}
     assert data["counts"] == {"apps": 0, "models": 0, "objects": 0}
     assert not data["errors"]
+    assert data["partial"]
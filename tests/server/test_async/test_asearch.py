@@ -0,0 +1,180 @@
+"""Tests verifying the async search view (site_search_async), which should behave the same
+as the sync view"""
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.contrib.auth.models import Permission
+from django.test import override_settings
+
+from dev.admin import CustomAdminSite
+from dev.football.core.factories import GroupFactory
+from dev.football.players.factories import PlayerAttributesFactory, PlayerFactory
+from dev.football.stadiums.factories import StadiumFactory
+from dev.football.stadiums.models import Stadium
+from dev.football.teams.factories import SquadFactory, TeamFactory
+from dev.football.teams.models import Team
+from tests import request_search
+from tests.server.test_async.urls_async import site
+
+urls_async = override_settings(ROOT_URLCONF="tests.server.test_async.urls_async")
+
+
+def search_view(admin_site):
+    """Returns the view function routed to search/, for the given admin site"""
+    urlpatterns, _, _ = admin_site.urls
+    return next(u.callback for u in urlpatterns if u.name == "site-search")
+
+
+@pytest.fixture()
+def data():
+    """Creates matching objects across multiple apps/models"""
+    GroupFactory(name="Manchester admins")
+    TeamFactory(name="Manchester United")
+    TeamFactory(name="Manchester City")
+    PlayerFactory(name="Manuel Almunia")
+    StadiumFactory(name="Manchester Arena")
+    PlayerAttributesFactory(nationality="Manx")
+    SquadFactory(team=TeamFactory(name="Mansfield"))
+
+
+def test_routed():
+    """Verify that search/ is routed to a coroutine function, only if site_search_async=True"""
+    assert asyncio.iscoroutinefunction(search_view(site))
+    assert not asyncio.iscoroutinefunction(search_view(admin.site))
+    assert isinstance(admin.site, CustomAdminSite)
+
+
+@pytest.mark.usefixtures("data")
+@pytest.mark.parametrize("method", ["model_char_fields", "admin_search_fields"])
+@pytest.mark.parametrize("query", ["man", "stadium", "authentication", "xyz", ""])
+def test_results_match_sync(client_super_admin, method, query):
+    """Verify that the async view returns the same response data as the sync view"""
+    response_sync = request_search(
+        client_super_admin, query=query, site_search_method=method
+    )
+
+    with urls_async:
+        response_async = request_search(
+            client_super_admin, query=query, site_search_method=method
+        )
+
+    assert response_async.status_code == 200
+    assert response_async.json() == response_sync.json()
+
+
+@urls_async
+def test_permissions(client_admin, user_admin):
+    """Verify that only models the user has permission to view are searched"""
+    TeamFactory(name="abcd")
+    StadiumFactory(name="abcd")
+
+    permission_ids = Permission.objects.filter(codename="view_team").values_list(
+        "id", flat=True
+    )
+    user_admin.user_permissions.add(*permission_ids)
+
+    response = request_search(client_admin, query="abcd")
+    data = response.json()
+
+    assert response.status_code == 200
+    assert [a["id"] for a in data["results"]["apps"]] == ["teams"]
+    assert data["counts"] == {"apps": 1, "models": 1, "objects": 1}
+
+
+@urls_async
+@pytest.mark.parametrize(
+    "is_staff, status_code", [(False, 302), (True, 200)], ids=["standard", "staff"]
+)
+def test_authenticated(client_standard, user_standard, is_staff, status_code):
+    """Verify that only staff users can access the async view, and responses aren't cached"""
+    user_standard.is_staff = is_staff
+    user_standard.save()
+
+    response = request_search(client_standard, query="abcd")
+
+    assert response.status_code == status_code
+    if status_code == 200:
+        assert "no-cache" in response["Cache-Control"]
+    else:
+        assert response.url.startswith("/admin/login/")
+
+
+@urls_async
+@override_settings(DEBUG=True)
+def test_errors(client_super_admin):
+    """Verify errors in one model are included in the response, without affecting others"""
+    TeamFactory(name="Arsenal")
+
+    async def error_if_stadium(_, query, model_class, model_fields):
+        """Fails for the Stadium model, and only matches teams otherwise"""
+        if model_class is Stadium:
+            raise Exception("A test error occurred")
+        if model_class is Team:
+            return [o async for o in Team.objects.filter(name=query)]
+        return []
+
+    with patch.object(CustomAdminSite, "amatch_objects", side_effect=error_if_stadium):
+        response = request_search(client_super_admin, query="Arsenal")
+
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["counts"] == {"apps": 1, "models": 1, "objects": 1}
+    assert data["errors"] == [
+        {
+            "error": "Exception('A test error occurred')",
+            "error_message": "A test error occurred",
+            "app": "stadiums",
+            "model": "Stadium",
+        }
+    ]
+
+
+@urls_async
+def test_match_objects(client_super_admin):
+    """Verify that an overridden match_objects is used to match objects, as per the sync
+    view"""
+    TeamFactory(name="Arsenal")
+
+    def match_none(_, request, query, model_class, model_fields):
+        """Matches no objects"""
+        return model_class.objects.none()
+
+    with patch.object(
+        CustomAdminSite, "match_objects", autospec=True, side_effect=match_none
+    ) as patched:
+        response = request_search(client_super_admin, query="Arsenal")
+
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["counts"]["objects"] == 0
+    assert Team in [c[0][3] for c in patched.call_args_list]
+
+
+@urls_async
+def test_aget_model_queryset(client_super_admin):
+    """Verify that aget_model_queryset is invoked for each model, and its queryset is used to
+    match objects"""
+    TeamFactory(name="Arsenal")
+    excluded = TeamFactory(name="Arsenal Women")
+
+    async def exclude_team(_, model_class, model_admin):
+        """Excludes the second team"""
+        return model_class.objects.exclude(pk=excluded.pk)
+
+    with patch.object(
+        CustomAdminSite, "aget_model_queryset", side_effect=exclude_team
+    ) as patched:
+        response = request_search(client_super_admin, query="Arsenal")
+
+    data = response.json()
+    model_classes = [c[0][1] for c in patched.call_args_list]
+
+    assert response.status_code == 200
+    assert data["counts"] == {"apps": 1, "models": 1, "objects": 1}
+    assert Team in model_classes
+    assert Stadium in model_classes
@@ -0,0 +1,21 @@
+"""URL conf for a project where the admin site routes search/ to the async view"""
+
+from django.contrib import admin
+from django.urls import path
+
+from dev.admin import CustomAdminSite
+
+
+class AsyncAdminSite(CustomAdminSite):
+    """Routes search/ to asearch()"""
+
+    site_search_async = True
+
+
+site = AsyncAdminSite()
+# share the default site's registered models/admins
+site._registry = admin.site._registry
+
+urlpatterns = [
+    path("admin/", site.urls),
+]
@@ -0,0 +1,220 @@
+"""Tests verifying pluggable search backends, i.e. a site_search_method that's the dotted path
+of a SearchBackend subclass"""
+
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.contrib.auth.models import Permission
+from django.core.exceptions import ImproperlyConfigured
+from django.test import override_settings
+
+from admin_site_search import updates
+from admin_site_search.backends import (
+    AdminSearchFieldsBackend,
+    ModelCharFieldsBackend,
+    QuerySetBackend,
+    SearchBackend,
+    get_backend_class,
+    related_models,
+)
+from admin_site_search.views import AdminSiteSearchView
+from dev.football.stadiums.factories import StadiumFactory
+from dev.football.teams.factories import TeamFactory
+from dev.football.players.models import Player
+from dev.football.teams.models import Squad, Team
+from tests import request_search
+
+BACKEND = "tests.server.test_backends.TeamNameBackend"
+
+
+class TeamNameBackend(SearchBackend):
+    """Matches teams whose name starts with the query, and records its calls"""
+
+    calls = []
+    updated = []
+
+    def search(self, request, query, models, limit=5):
+        self.calls.append((query, set(models)))
+        if query == "?":
+            raise ConnectionError("Backend unavailable")
+        if Team not in models:
+            return {}
+        if query == "!":
+            # i.e. model instances, rather than pks
+            return {Team: list(models[Team].order_by("name")[:limit])}
+        teams = models[Team].filter(name__istartswith=query).order_by("name")
+        return {Team: list(teams.values_list("pk", flat=True)[:limit])}
+
+    def index_build(self, model_classes, chunk_size):
+        for model_class in model_classes:
+            yield model_class, model_class.objects.count()
+
+    def index_update(self, model_class, pks, using):
+        self.updated.append((model_class, sorted(pks)))
+
+
+class TeamKeyBackend(QuerySetBackend):
+    """Filters teams by key, and no other models"""
+
+    def filter(self, request, query, model_class, model_fields, model_admin, queryset):
+        if model_class is not Team:
+            return model_class.objects.none()
+        return queryset.filter(key__iexact=query)
+
+
+@pytest.fixture(autouse=True)
+def reset_backend():
+    """Ensures every test creates its own backend, whose handler isn't kept"""
+    TeamNameBackend.calls = []
+    TeamNameBackend.updated = []
+    updates._pending().clear()
+    with patch.object(admin.site, "_backend", None):
+        with patch.object(updates, "_handlers", []):
+            yield
+
+
+def object_names(response) -> dict:
+    """Returns the names of the objects in the response, keyed by model id"""
+    return {
+        model["id"]: [o["name"] for o in model["objects"]]
+        for app in response.json()["results"]["apps"]
+        for model in app["models"]
+        if model["objects"]
+    }
+
+
+def test_search(client_super_admin):
+    """Verify that all models are matched with a single call to the backend's search(), with
+    pks retrieved from each model's queryset"""
+    TeamFactory(name="Arsenal")
+    TeamFactory(name="Aston Villa")
+    TeamFactory(name="Chelsea")
+    StadiumFactory(name="Arsenal Stadium")
+
+    response = request_search(client_super_admin, query="a", site_search_method=BACKEND)
+
+    assert response.status_code == 200
+    assert object_names(response) == {"teams.Team": ["Arsenal", "Aston Villa"]}
+    assert len(TeamNameBackend.calls) == 1
+    assert Team in TeamNameBackend.calls[0][1]
+
+
+def test_instances(client_super_admin):
+    """Verify that backends can return model instances, rather than pks"""
+    TeamFactory(name="Arsenal")
+
+    response = request_search(client_super_admin, query="!", site_search_method=BACKEND)
+
+    assert object_names(response) == {"teams.Team": ["Arsenal"]}
+
+
+def test_async(client_super_admin):
+    """Verify that asearch() calls the backend's search() once, too"""
+    TeamFactory(name="Arsenal")
+
+    with patch.object(AdminSiteSearchView, "site_search_async", True):
+        response = request_search(
+            client_super_admin, query="ars", site_search_method=BACKEND
+        )
+
+    assert object_names(response) == {"teams.Team": ["Arsenal"]}
+    assert len(TeamNameBackend.calls) == 1
+
+
+@override_settings(DEBUG=True)
+@pytest.mark.parametrize("site_search_async", [False, True])
+def test_search_error(client_super_admin, site_search_async):
+    """Verify that, if the backend's search() raises, an error is reported for every model -
+    rather than the search failing"""
+    TeamFactory(name="Arsenal")
+
+    with patch.object(AdminSiteSearchView, "site_search_async", site_search_async):
+        response = request_search(
+            client_super_admin, query="?", site_search_method=BACKEND
+        )
+
+    errors = response.json()["errors"]
+    assert response.status_code == 200
+    assert object_names(response) == {}
+    assert {(e["app"], e["model"]) for e in errors} >= {("teams", "Team")}
+    assert {e["error_message"] for e in errors} == {"Backend unavailable"}
+
+
+def test_permissions(client_admin, user_admin):
+    """Verify that the backend is only given models the user has permission to view"""
+    permission_ids = Permission.objects.filter(codename="view_team").values_list(
+        "id", flat=True
+    )
+    user_admin.user_permissions.add(*permission_ids)
+
+    request_search(client_admin, query="a", site_search_method=BACKEND)
+
+    assert TeamNameBackend.calls == [("a", {Team})]
+
+
+def test_queryset_backend(client_super_admin):
+    """Verify that QuerySetBackend subclasses filter each model's queryset"""
+    TeamFactory(name="Arsenal", key="afc")
+    TeamFactory(name="Arsenal Women", key="afcw")
+
+    response = request_search(
+        client_super_admin,
+        query="AFC",
+        site_search_method="tests.server.test_backends.TeamKeyBackend",
+    )
+
+    assert object_names(response) == {"teams.Team": ["Arsenal"]}
+
+
+def test_index_build():
+    """Verify that build_search_index() builds the backend's index, and that backends
+    without one raise ImproperlyConfigured"""
+    TeamFactory()
+
+    with patch.object(AdminSiteSearchView, "site_search_method", BACKEND):
+        assert list(admin.site.build_search_index([Team])) == [(Team, 1)]
+        with pytest.raises(ImproperlyConfigured):
+            list(admin.site.build_search_index([Team], workers=2))
+
+    with patch.object(
+        AdminSiteSearchView,
+        "site_search_method",
+        "tests.server.test_backends.TeamKeyBackend",
+    ):
+        with pytest.raises(ImproperlyConfigured):
+            list(admin.site.build_search_index([Team]))
+
+
+def test_index_update(client_super_admin, django_capture_on_commit_callbacks):
+    """Verify that prepare() registers index_update(), which is passed written objects once
+    they're committed"""
+    request_search(client_super_admin, query="a", site_search_method=BACKEND)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        team = TeamFactory()
+
+    assert (Team, [team.pk]) in TeamNameBackend.updated
+
+
+def test_get_backend_class():
+    """Verify that built-in names, dotted paths and unknown names are resolved"""
+    assert get_backend_class("model_char_fields") is ModelCharFieldsBackend
+    assert get_backend_class("admin_search_fields") is AdminSearchFieldsBackend
+    assert get_backend_class("sqlite_fts5") is ModelCharFieldsBackend
+    assert get_backend_class(BACKEND) is TeamNameBackend
+    # i.e. matches no objects
+    assert get_backend_class("invalid") is QuerySetBackend
+
+    with pytest.raises(ImproperlyConfigured):
+        get_backend_class("tests.server.test_backends.Unknown")
+    with pytest.raises(ImproperlyConfigured):
+        get_backend_class("tests.server.test_backends.object_names")
+
+
+def test_related_models():
+    """Verify that the models looked up by search fields, through relations, are found"""
+    assert related_models(Squad, "team__name") == [Team]
+    assert related_models(Squad, "^players__name") == [Player]
+    assert related_models(Squad, "=team__name__exact") == [Team]
+    assert related_models(Squad, "type") == []
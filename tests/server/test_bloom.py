@@ -0,0 +1,231 @@
+"""Tests verifying per-model trigram bloom filters (site_search_bloom_filters), which skip the
+queries of models that can't match"""
+
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.core.cache import cache
+from django.db.models import Q
+
+from admin_site_search import bloom
+from admin_site_search.views import AdminSiteSearchView
+from dev.admin import CustomAdminSite
+from dev.football.teams.factories import TeamFactory
+from dev.football.teams.models import Team
+from tests import count_searches, request_search, team_names
+
+
+@pytest.fixture()
+def bloom_enabled():
+    """Enables bloom filters, with new (empty) filters in every process"""
+    with patch.object(AdminSiteSearchView, "site_search_bloom_filters", True):
+        with patch.object(admin.site, "_bloom_filters", None):
+            yield
+
+
+@pytest.mark.usefixtures("bloom_enabled")
+def test_skipped(client_super_admin, match_objects):
+    """Verify that models are only queried if every trigram of the query is in their
+    filter"""
+    TeamFactory(name="Arsenal")
+
+    response_none = request_search(client_super_admin, query="xqzj")
+    searches = count_searches(match_objects)
+    response = request_search(client_super_admin, query="ARSEN")
+
+    assert searches == 0
+    assert team_names(response_none) == []
+    assert count_searches(match_objects) == 1
+    assert team_names(response) == ["Arsenal"]
+
+
+@pytest.mark.usefixtures("bloom_enabled")
+def test_short_query(client_super_admin, match_objects):
+    """Verify that queries without any trigrams are never skipped"""
+    TeamFactory(name="Arsenal")
+
+    request_search(client_super_admin, query="xq")
+
+    assert count_searches(match_objects) == 1
+
+
+@pytest.mark.usefixtures("bloom_enabled")
+def test_write_added(client_super_admin, django_capture_on_commit_callbacks):
+    """Verify that objects written after the filter is built are added to it, as deltas"""
+    TeamFactory(name="Arsenal")
+    request_search(client_super_admin, query="tottenham")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        TeamFactory(name="Tottenham")
+
+    response = request_search(client_super_admin, query="tottenham")
+
+    assert team_names(response) == ["Tottenham"]
+    assert cache.get(bloom.counter_key("teams.Team")) == 1
+
+
+@pytest.mark.usefixtures("bloom_enabled")
+def test_delta_missing(client_super_admin, django_capture_on_commit_callbacks):
+    """Verify that, if a delta is missing (e.g. evicted), the filter is rebuilt"""
+    TeamFactory(name="Arsenal")
+    request_search(client_super_admin, query="tottenham")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        TeamFactory(name="Tottenham")
+    cache.delete(bloom.delta_key("teams.Team", 1))
+
+    # the first search discards the filter, and the second rebuilds it
+    response = request_search(client_super_admin, query="tottenham")
+    response_rebuilt = request_search(client_super_admin, query="tottenham")
+
+    assert team_names(response) == ["Tottenham"]
+    assert team_names(response_rebuilt) == ["Tottenham"]
+    assert cache.get(bloom.filter_key("teams.Team"))["number"] == 1
+
+
+def test_write_without_filter(django_capture_on_commit_callbacks):
+    """Verify that objects written to models without a filter aren't read"""
+    bloom.track_filter_writes("default")
+
+    with patch.object(bloom, "model_trigrams") as model_trigrams:
+        with django_capture_on_commit_callbacks(execute=True):
+            TeamFactory(name="Tottenham")
+
+    assert model_trigrams.call_count == 0
+
+
+@pytest.mark.usefixtures("bloom_enabled")
+def test_expired(client_super_admin):
+    """Verify that filters are rebuilt once they expire - in the process, as well as the
+    cache - so that writes that didn't send signals are reflected"""
+    TeamFactory(name="Arsenal")
+    request_search(client_super_admin, query="tottenham")
+    Team.objects.update(name="Tottenham")
+
+    response = request_search(client_super_admin, query="tottenham")
+    with patch.object(bloom, "TIMEOUT", 0):
+        response_expired = request_search(client_super_admin, query="tottenham")
+
+    assert team_names(response) == []
+    assert team_names(response_expired) == ["Tottenham"]
+
+
+@pytest.mark.usefixtures("bloom_enabled")
+def test_being_built(client_super_admin, match_objects):
+    """Verify that models are queried while another process builds their filter"""
+    cache.add(f"{bloom.filter_key('teams.Team')}:lock", 1)
+
+    request_search(client_super_admin, query="xqzj")
+
+    assert count_searches(match_objects) == 1
+
+
+@pytest.mark.usefixtures("bloom_enabled", "transactional_db")
+def test_built_in_background(client_super_admin, match_objects):
+    """Verify that filters are built in a background thread (which reads committed data),
+    while the model is queried as usual - rather than by the search"""
+    TeamFactory(name="Arsenal")
+
+    with patch.object(bloom.BloomFilterRegistry, "background", True):
+        request_search(client_super_admin, query="xqzj")
+        searches = count_searches(match_objects)
+        admin.site._get_bloom_filters().join()
+        request_search(client_super_admin, query="xqzj")
+
+    assert searches == 1
+    assert count_searches(match_objects) == 1
+    assert cache.get(f"{bloom.filter_key('teams.Team')}:lock") is None
+
+
+@pytest.mark.usefixtures("bloom_enabled")
+def test_saturated(
+    client_super_admin, match_objects, django_capture_on_commit_callbacks
+):
+    """Verify that models with more trigrams than a filter can hold aren't filtered, without
+    reading every object - and that this is stored, rather than rebuilt by every search"""
+    for name in ["Arsenal", "Tottenham", "Chelsea"]:
+        TeamFactory(name=name)
+
+    with patch.object(bloom, "max_trigrams", return_value=5):
+        request_search(client_super_admin, query="xqzj")
+        with django_capture_on_commit_callbacks(execute=True):
+            TeamFactory(name="Fulham")
+        with patch.object(bloom, "model_trigrams") as model_trigrams:
+            request_search(client_super_admin, query="xqzj")
+
+    assert count_searches(match_objects) == 2
+    assert model_trigrams.call_count == 0
+    assert cache.get(bloom.filter_key("teams.Team"))["bits"] is None
+
+
+def test_scan_limited():
+    """Verify that the scan stops once there are more trigrams than the limit"""
+    for name in ["Arsenal", "Tottenham", "Chelsea"]:
+        TeamFactory(name=name)
+
+    trigram_set, count = bloom.model_trigrams(Team, limit=5)
+
+    assert count == 1
+    assert len(trigram_set) > 5
+
+
+@pytest.mark.usefixtures("bloom_enabled")
+@pytest.mark.parametrize("union_all", [False, True])
+def test_union_all(client_super_admin, union_all):
+    """Verify that filters are used with, and without, UNION ALL queries"""
+    with patch.object(AdminSiteSearchView, "site_search_union_all", union_all):
+        with patch.object(
+            AdminSiteSearchView,
+            "_filter_objects",
+            autospec=True,
+            side_effect=AdminSiteSearchView._filter_objects,
+        ) as filter_objects:
+            request_search(client_super_admin, query="xqzj")
+
+    assert Team not in [c[0][3] for c in filter_objects.call_args_list]
+
+
+@pytest.mark.usefixtures("bloom_enabled")
+def test_disabled_filter_field_overridden(client_super_admin, match_objects):
+    """Verify that filters aren't used if filter_field is overridden, since matching may not
+    be case-insensitive substring matching"""
+    with patch.object(
+        CustomAdminSite,
+        "filter_field",
+        return_value=Q(name__istartswith="xqzj"),
+    ):
+        request_search(client_super_admin, query="xqzj")
+
+    assert count_searches(match_objects) == 1
+
+
+@pytest.mark.usefixtures("bloom_enabled")
+def test_disabled_non_ascii(client_super_admin, match_objects):
+    """Verify that filters aren't used for non-ascii queries"""
+    request_search(client_super_admin, query="Øxqz")
+
+    assert count_searches(match_objects) == 1
+
+
+def test_disabled(client_super_admin, match_objects):
+    """Verify that, by default, filters aren't used"""
+    assert AdminSiteSearchView.site_search_bloom_filters is False
+
+    request_search(client_super_admin, query="xqzj")
+
+    assert count_searches(match_objects) == 1
+    assert cache.get(bloom.filter_key("teams.Team")) is None
+
+
+def test_filter():
+    """Verify that filters have no false negatives, few false positives, and are sized for
+    their trigrams"""
+    words = [f"team {i}" for i in range(1000)]
+    trigram_set = set().union(*(bloom.trigrams(w) for w in words))
+    bloom_filter = bloom.BloomFilter.for_trigrams(trigram_set)
+    absent = [f"{i}x{i}" for i in range(1000)]
+
+    assert all(bloom_filter.might_match(w.upper()) for w in words)
+    assert sum(bloom_filter.might_match(q) for q in absent) < 50
+    assert bloom.MIN_BYTES < len(bloom_filter.bits) < bloom.MAX_BYTES
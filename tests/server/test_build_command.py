@@ -0,0 +1,331 @@
+"""Tests verifying the build_site_search_index management command"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.utils.module_loading import import_string
+
+from admin_site_search import bloom, fts5, parallel
+from admin_site_search.diskindex import MappedIndex, file_signature, write_index
+from admin_site_search.management.commands.build_site_search_index import get_site
+from admin_site_search.views import AdminSiteSearchView
+from dev.admin import CustomAdminSite
+from dev.football.players.factories import PlayerFactory
+from dev.football.players.models import Player
+from dev.football.teams.factories import TeamFactory
+from dev.football.teams.models import Team
+from tests import request_search
+
+
+def build(*args) -> str:
+    """Calls the command with the arguments, and returns its output"""
+    out = StringIO()
+    call_command("build_site_search_index", *args, stdout=out)
+    return out.getvalue()
+
+
+def object_counts(client, query: str) -> int:
+    """Returns the number of objects matching the query, with the sqlite_fts5 method"""
+    response = request_search(client, query=query, site_search_method="sqlite_fts5")
+    return response.json()["counts"]["objects"]
+
+
+@pytest.fixture()
+def method_fts5():
+    """Sets the site_search_method to sqlite_fts5"""
+    with patch.object(AdminSiteSearchView, "site_search_method", "sqlite_fts5"):
+        yield
+
+
+@pytest.fixture()
+def index_path(tmp_path):
+    """Sets the site_search_method to in_memory_index, with an index file"""
+    path = str(tmp_path / "site-search.idx")
+    with patch.object(AdminSiteSearchView, "site_search_method", "in_memory_index"):
+        with patch.object(AdminSiteSearchView, "site_search_index_path", path):
+            yield path
+
+
+@pytest.mark.usefixtures("method_fts5")
+def test_fts5():
+    """Verify that every registered model is indexed, with its rate reported"""
+    TeamFactory.create_batch(3)
+
+    output = build()
+
+    assert "teams.Team: 3 rows in" in output
+    assert "rows/sec" in output
+    assert "players.Player: 0 rows in" in output
+    assert fts5.indexed_labels("default", ["teams.Team", "players.Player"]) == {
+        "teams.Team",
+        "players.Player",
+    }
+
+
+@pytest.mark.usefixtures("method_fts5")
+def test_fts5_models():
+    """Verify that only the given models are built"""
+    output = build("--models", "teams.Team", "players.Player")
+
+    assert "teams.Team" in output
+    assert "players.Player" in output
+    assert "stadiums.Stadium" not in output
+    assert fts5.indexed_labels("default", ["stadiums.Stadium"]) == set()
+
+
+@pytest.mark.usefixtures("method_fts5")
+def test_fts5_resume():
+    """Verify that, with --resume, models that are already built (in the generation being
+    built) are skipped"""
+    # as if the build was interrupted before this model
+    generation = fts5.start_generation("default", ["teams.Team", "players.Player"])
+    fts5.build(Team, "default", generation=generation)
+    PlayerFactory()
+
+    output = build("--models", "teams.Team", "players.Player", "--resume")
+
+    assert "teams.Team: skipped" in output
+    assert "players.Player: 1 rows in" in output
+    assert fts5.active_generation("default") == generation
+
+
+@pytest.mark.usefixtures("method_fts5")
+def test_fts5_blue_green(client_super_admin, django_capture_on_commit_callbacks):
+    """Verify that, during a rebuild, searches use the previous generation in full - with
+    writes synced to both - until the new generation is activated"""
+    TeamFactory(name="Arsenal")
+    PlayerFactory(name="Bukayo Saka")
+    fts5.ensure_indexed([Team, Player], "default")
+    previous = fts5.active_generation("default")
+
+    builds = admin.site.build_search_index(model_classes=[Team, Player])
+    next(builds)
+    with django_capture_on_commit_callbacks(execute=True):
+        TeamFactory(name="Arsenal Women")
+
+    assert fts5.active_generation("default") == previous
+    assert object_counts(client_super_admin, "arsenal") == 2
+    assert object_counts(client_super_admin, "saka") == 1
+
+    list(builds)
+
+    assert fts5.active_generation("default") != previous
+    assert object_counts(client_super_admin, "arsenal") == 2
+    assert object_counts(client_super_admin, "saka") == 1
+    # i.e. kept for the grace period
+    assert fts5.indexed_labels("default", ["teams.Team"], previous) == {"teams.Team"}
+    assert fts5.collect_garbage("default", 0) == [previous]
+    assert fts5.indexed_labels("default", ["teams.Team"], previous) == set()
+
+
+@pytest.mark.usefixtures("method_fts5")
+def test_fts5_models_copied(client_super_admin):
+    """Verify that models that aren't rebuilt are copied to the new generation"""
+    PlayerFactory(name="Bukayo Saka")
+    fts5.ensure_indexed([Player], "default")
+
+    build("--models", "teams.Team")
+
+    assert fts5.indexed_labels("default", ["players.Player"]) == {"players.Player"}
+    assert object_counts(client_super_admin, "saka") == 1
+
+
+@pytest.mark.usefixtures("method_fts5")
+def test_fts5_invalid(client_super_admin):
+    """Verify that a generation with the wrong number of rows isn't activated"""
+    TeamFactory(name="Arsenal")
+    previous = fts5.ensure_indexed([Team], "default")
+
+    builds = admin.site.build_search_index(model_classes=[Team])
+    next(builds)
+    # i.e. without signals, so not synced
+    Team.objects.bulk_create([Team(name="Arsenal Women")])
+
+    with pytest.raises(ValueError, match="teams.Team"):
+        list(builds)
+
+    assert fts5.active_generation("default") == previous
+    assert fts5.building_generation("default") is None
+
+
+def test_index_file(index_path):
+    """Verify that every registered model is written to the index file"""
+    TeamFactory(name="Arsenal")
+
+    output = build("--chunk-size", "1")
+    index = MappedIndex(index_path)
+
+    assert "teams.Team: 1 rows in" in output
+    assert "teams.Team" in index
+    assert "players.Player" in index
+    assert len(index.section("teams.Team").match("arsenal")) == 1
+
+
+def test_index_file_models(index_path):
+    """Verify that, if only some models are built, other models are kept in the index file"""
+    build()
+    TeamFactory(name="Arsenal")
+    PlayerFactory(name="Bukayo Saka")
+
+    output = build("--models", "teams.Team")
+    index = MappedIndex(index_path)
+
+    assert "players.Player" not in output
+    assert len(index.section("teams.Team").match("arsenal")) == 1
+    assert len(index.section("players.Player").match("saka")) == 0
+
+
+def test_index_file_resume(index_path):
+    """Verify that, with --resume, models with a segment are skipped"""
+    build("--models", "teams.Team", "players.Player")
+    # as if the build was interrupted before this model
+    os.remove(f"{index_path}.segments/players.Player.idx")
+
+    output = build("--models", "teams.Team", "players.Player", "--resume")
+
+    assert "teams.Team: skipped" in output
+    assert "players.Player: 0 rows in" in output
+    assert "players.Player" in MappedIndex(index_path)
+
+
+def test_index_file_invalid(index_path):
+    """Verify that, if the merged file doesn't match its segments, the index file isn't
+    replaced"""
+    build()
+    signature = file_signature(index_path)
+
+    with patch(
+        "admin_site_search.views.merge_index", lambda paths, path: write_index(path, [])
+    ):
+        with pytest.raises(CommandError, match="documents"):
+            build()
+
+    assert file_signature(index_path) == signature
+    assert not os.path.exists(f"{index_path}.next")
+
+
+@pytest.fixture()
+def thread_pool(transactional_db):
+    """Runs parallel builds in threads, rather than processes - which can't open the
+    (in-memory) test database"""
+    with patch.object(parallel, "ProcessPoolExecutor", ThreadPoolExecutor):
+        yield
+
+
+@pytest.mark.usefixtures("thread_pool")
+def test_index_file_parallel(index_path):
+    """Verify that, with --workers, large models are split into a segment per pk range, which
+    are merged into the index file in pk order"""
+    teams = [TeamFactory(name=f"Arsenal {i}") for i in range(5)]
+
+    with patch.object(parallel, "import_string", wraps=import_string) as spy:
+        output = build("--workers", "2", "--part-size", "2")
+    section = MappedIndex(index_path).section("teams.Team")
+
+    assert "teams.Team: 5 rows in" in output
+    assert "Built the search index:" in output
+    assert "players.Player.idx" in os.listdir(f"{index_path}.segments")
+    assert [
+        name
+        for name in sorted(os.listdir(f"{index_path}.segments"))
+        if name.startswith("teams.Team.")
+    ] == [
+        "teams.Team.00000.idx",
+        "teams.Team.00001.idx",
+        "teams.Team.00002.idx",
+        "teams.Team.parts.json",
+    ]
+    assert len(section) == 5
+    # i.e. workers import the site, rather than finding it among those they've set up
+    assert {c.args for c in spy.call_args_list} == {("django.contrib.admin.site",)}
+    assert [row.pk for row in section.match("arsenal", limit=10)] == [
+        str(t.pk) for t in sorted(teams, key=lambda t: t.pk)
+    ]
+
+
+@pytest.mark.usefixtures("thread_pool")
+def test_index_file_parallel_resume(index_path):
+    """Verify that, with --resume, only the parts without a segment are rebuilt - from the
+    saved pk ranges, even if objects have been created since"""
+    TeamFactory.create_batch(5)
+    build("--workers", "2", "--part-size", "2", "--models", "teams.Team")
+    # as if the build was interrupted before this part
+    os.remove(f"{index_path}.segments/teams.Team.00001.idx")
+    TeamFactory()
+
+    output = build("--resume", "--models", "teams.Team")
+
+    assert "teams.Team: 2 rows in" in output
+    assert len(MappedIndex(index_path).section("teams.Team")) == 5
+
+
+def test_index_file_parallel_import_path(index_path):
+    """Verify that sites other than admin.site can only be built with more than one worker
+    if their site_search_import_path is set, since workers import the site from it"""
+    site = CustomAdminSite(name="other")
+
+    with pytest.raises(ImproperlyConfigured, match="site_search_import_path"):
+        list(site.build_search_index(workers=2))
+
+    assert not os.path.exists(f"{index_path}.segments")
+    with patch.object(site, "site_search_import_path", "tests.other_site"):
+        assert site._get_import_path() == "tests.other_site"
+
+
+def test_index_file_path_required():
+    """Verify that the in_memory_index method requires site_search_index_path"""
+    with patch.object(AdminSiteSearchView, "site_search_method", "in_memory_index"):
+        with pytest.raises(CommandError, match="site_search_index_path"):
+            build()
+
+
+@pytest.mark.usefixtures("method_fts5")
+def test_fts5_workers():
+    """Verify that the FTS5 index can't be built in parallel"""
+    with pytest.raises(CommandError, match="worker"):
+        build("--workers", "2")
+
+
+def test_bloom_filters():
+    """Verify that, with site_search_bloom_filters, each model's bloom filter is built"""
+    TeamFactory.create_batch(3)
+
+    with patch.object(AdminSiteSearchView, "site_search_bloom_filters", True):
+        output = build("--models", "teams.Team")
+
+    assert "teams.Team: 3 rows in" in output
+    assert cache.get(bloom.filter_key("teams.Team"))["number"] == 0
+
+
+def test_no_index():
+    """Verify that methods without an index are rejected"""
+    with pytest.raises(CommandError, match="model_char_fields"):
+        build()
+
+
+@pytest.mark.parametrize("label", ["teams.Unknown", "invalid", "auth.Permission"])
+def test_invalid_models(label):
+    """Verify that unknown (or unregistered) models are rejected"""
+    with pytest.raises(CommandError):
+        build("--models", label)
+
+
+def test_site_name_shared():
+    """Verify that, if other sites share its name, admin.site is built"""
+    sites = [CustomAdminSite() for _ in range(5)]
+
+    assert all(site.name == "admin" for site in sites)
+    assert get_site("admin") == admin.site
+
+
+def test_invalid_site():
+    """Verify that unknown sites are rejected"""
+    with pytest.raises(CommandError):
+        build("--site", "unknown")
@@ -0,0 +1,357 @@
+"""Tests verifying the shared result cache (site_search_cache_timeout), and its invalidation via
+per-model generation counters"""
+
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.test import Client, override_settings
+
+from admin_site_search import cache as cache_module
+from admin_site_search.cache import (
+    SearchResultCache,
+    bump_generation,
+    generation_key,
+    get_generations,
+)
+from admin_site_search.views import AdminSiteSearchView
+from dev.admin import CustomAdminSite
+from dev.football.players.factories import PlayerFactory
+from dev.football.stadiums.factories import StadiumFactory
+from dev.football.teams.factories import SquadFactory, TeamFactory
+from dev.football.teams.models import Squad
+from tests import count_searches, request_search
+
+
+@pytest.fixture()
+def cache_enabled():
+    """Enables the result cache, for 60 seconds"""
+    with patch.object(AdminSiteSearchView, "site_search_cache_timeout", 60):
+        yield
+
+
+@pytest.fixture()
+def match_objects():
+    """Replaces the shared match_objects spy with one that matches nothing, to count the
+    number of un-cached searches"""
+    with patch.object(
+        AdminSiteSearchView, "match_objects", autospec=True, side_effect=lambda *a: []
+    ) as spy:
+        yield spy
+
+
+def add_view_permissions(user, *codenames):
+    """Gives the user permission to view the given models"""
+    permission_ids = Permission.objects.filter(codename__in=codenames).values_list(
+        "id", flat=True
+    )
+    user.user_permissions.add(*permission_ids)
+
+
+def cache_key(rf, user) -> str:
+    """Returns the result cache key of a request by the user"""
+    request = rf.get("/")
+    request.user = user
+    return admin.site._cache_key(request, query="query", app_list=[])
+
+
+def test_disabled(client_super_admin):
+    """Verify that, by default, results are not cached"""
+    assert AdminSiteSearchView.site_search_cache_timeout is None
+
+    request_search(client_super_admin, query="arsenal")
+    team = TeamFactory(name="Arsenal")
+    response = request_search(client_super_admin, query="arsenal")
+
+    assert response.json()["results"]["apps"][0]["models"][0]["objects"][0]["id"] == (
+        str(team.pk)
+    )
+
+
+@pytest.mark.usefixtures("cache_enabled")
+def test_hit(client_super_admin):
+    """Verify that repeated searches return the same content, without searching again"""
+    TeamFactory(name="Arsenal")
+
+    response_1 = request_search(client_super_admin, query="arsenal")
+    with patch.object(AdminSiteSearchView, "match_objects") as match_objects:
+        response_2 = request_search(client_super_admin, query="ARSENAL")
+
+    assert response_1.json()["counts"]["objects"] == 1
+    assert response_2.content == response_1.content
+    assert response_2["Content-Type"] == "application/json"
+    assert match_objects.call_count == 0
+
+
+@pytest.mark.usefixtures("cache_enabled")
+def test_query_case_admin_search_fields(client_super_admin, match_objects):
+    """Verify that queries are only normalised (lowercased) if all matching is
+    case-insensitive"""
+    for query in ["arsenal", "ARSENAL", "arsenal"]:
+        request_search(
+            client_super_admin, query=query, site_search_method="admin_search_fields"
+        )
+
+    assert count_searches(match_objects) == 2
+
+
+@pytest.mark.usefixtures("cache_enabled")
+def test_invalidated_on_write(client_super_admin, django_capture_on_commit_callbacks):
+    """Verify that results are invalidated once a write, to a searched model, is committed"""
+    request_search(client_super_admin, query="arsenal")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        team = TeamFactory(name="Arsenal")
+
+    response = request_search(client_super_admin, query="arsenal")
+    objects = response.json()["results"]["apps"][0]["models"][0]["objects"]
+
+    assert [o["id"] for o in objects] == [str(team.pk)]
+
+
+@pytest.mark.usefixtures("cache_enabled")
+def test_not_invalidated_before_commit(client_super_admin):
+    """Verify that generations aren't bumped until the write is committed"""
+    generations = get_generations("default", ["teams.Team"])
+    TeamFactory(name="Arsenal")
+
+    assert get_generations("default", ["teams.Team"]) == generations
+
+
+@pytest.mark.usefixtures("cache_enabled")
+def test_not_invalidated_other_model(
+    client_admin, user_admin, match_objects, django_capture_on_commit_callbacks
+):
+    """Verify that writes to models the user can't view don't invalidate their results"""
+    add_view_permissions(user_admin, "view_team")
+
+    request_search(client_admin, query="arsenal")
+    with django_capture_on_commit_callbacks(execute=True):
+        StadiumFactory(name="Arsenal")
+    request_search(client_admin, query="arsenal")
+
+    assert count_searches(match_objects) == 1
+
+
+@pytest.mark.usefixtures("cache_enabled")
+def test_invalidated_search_field_relation(
+    client_admin, user_admin, match_objects, django_capture_on_commit_callbacks
+):
+    """Verify that admin_search_fields results are invalidated by writes to the models that
+    search_fields look up through relations, even if the user can't view them"""
+    add_view_permissions(user_admin, "view_squad")
+    team = TeamFactory(name="Arsenal")
+
+    request_search(
+        client_admin, query="arsenal", site_search_method="admin_search_fields"
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        team.name = "Tottenham"
+        team.save()
+    request_search(
+        client_admin, query="arsenal", site_search_method="admin_search_fields"
+    )
+
+    assert count_searches(match_objects, Squad) == 2
+
+
+@pytest.mark.usefixtures("cache_enabled")
+def test_invalidated_m2m(client_super_admin, django_capture_on_commit_callbacks):
+    """Verify that many-to-many changes bump generations on both sides of the relation"""
+    squad = SquadFactory()
+    player = PlayerFactory()
+    labels = ["teams.Squad", "players.Player", "teams.Team"]
+    generations = get_generations("default", labels)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        squad.players.add(player)
+
+    generations_new = get_generations("default", labels)
+
+    assert generations_new["teams.Squad"] > generations["teams.Squad"]
+    assert generations_new["players.Player"] > generations["players.Player"]
+    assert generations_new["teams.Team"] == generations["teams.Team"]
+
+
+@pytest.mark.usefixtures("cache_enabled")
+def test_permissions(client_admin, user_admin, match_objects):
+    """Verify that results are only shared between users with the same permissions"""
+    add_view_permissions(user_admin, "view_team")
+
+    user_same = User.objects.create_user(username="same", is_staff=True)
+    add_view_permissions(user_same, "view_team")
+    client_same = Client()
+    client_same.force_login(user_same)
+
+    user_other = User.objects.create_user(username="other", is_staff=True)
+    add_view_permissions(user_other, "view_team", "view_stadium")
+    client_other = Client()
+    client_other.force_login(user_other)
+
+    request_search(client_admin, query="arsenal")
+    request_search(client_same, query="arsenal")
+    request_search(client_other, query="arsenal")
+
+    assert count_searches(match_objects) == 2
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "match_app",
+        "match_model",
+        "match_objects",
+        "amatch_objects",
+        "filter_field",
+        "get_model_queryset",
+        "aget_model_queryset",
+        "get_model_class",
+    ],
+)
+def test_request_hook_overridden(rf, user_admin, user_super, name):
+    """Verify that results aren't shared between users, if a method that's passed the request
+    is overridden (since its results may depend on the user)"""
+    assert cache_key(rf, user_admin) == cache_key(rf, user_super)
+
+    with patch.object(CustomAdminSite, name):
+        assert cache_key(rf, user_admin) != cache_key(rf, user_super)
+
+
+def test_backend(rf, user_admin, user_super):
+    """Verify that results aren't shared between users, if objects are matched by a custom
+    backend (which is passed the request)"""
+    with patch.object(
+        AdminSiteSearchView,
+        "site_search_method",
+        "tests.server.test_backends.TeamNameBackend",
+    ):
+        assert cache_key(rf, user_admin) != cache_key(rf, user_super)
+
+
+@pytest.mark.usefixtures("cache_enabled")
+@override_settings(DEBUG=True)
+def test_errors_not_cached(client_super_admin):
+    """Verify that responses with errors aren't cached"""
+    with patch.object(AdminSiteSearchView, "match_objects", side_effect=Exception):
+        response_1 = request_search(client_super_admin, query="arsenal")
+
+    TeamFactory(name="Arsenal")
+    response_2 = request_search(client_super_admin, query="arsenal")
+
+    assert response_1.json()["errors"]
+    assert not response_2.json()["errors"]
+    assert response_2.json()["counts"]["objects"] == 1
+
+
+@pytest.mark.usefixtures("cache_enabled")
+@override_settings(DEBUG=False)
+def test_partial_not_cached(client_super_admin):
+    """Verify that responses are partial, so aren't cached, if a model raised - even if the
+    error isn't included in the response"""
+    with patch.object(AdminSiteSearchView, "match_objects", side_effect=Exception):
+        response_1 = request_search(client_super_admin, query="arsenal")
+
+    TeamFactory(name="Arsenal")
+    response_2 = request_search(client_super_admin, query="arsenal")
+
+    assert not response_1.json()["errors"]
+    assert response_1.json()["partial"]
+    assert not response_2.json()["partial"]
+    assert response_2.json()["counts"]["objects"] == 1
+
+
+def test_stale_while_revalidate():
+    """Verify that once an entry's timeout passes, one caller refreshes it while others are
+    served the stale content"""
+    result_cache = SearchResultCache("default", timeout=0, stale_timeout=60)
+
+    content, ticket = result_cache.get("key", ["teams.Team"])
+    assert content is None
+    result_cache.set(ticket, b"content-1")
+
+    # stale, so the first caller refreshes...
+    content, ticket_refresh = result_cache.get("key", ["teams.Team"])
+    assert content is None
+    assert ticket_refresh is not None
+
+    # ...while others are served stale content
+    content, ticket = result_cache.get("key", ["teams.Team"])
+    assert content == b"content-1"
+    assert ticket is None
+
+    # until the refresh is stored
+    result_cache.set(ticket_refresh, b"content-2")
+    result_cache.timeout = 60
+    content, ticket = result_cache.get("key", ["teams.Team"])
+    assert content is None
+    result_cache.set(ticket, b"content-3")
+    assert result_cache.get("key", ["teams.Team"]) == (b"content-3", None)
+
+
+def test_miss_waits():
+    """Verify that, if there's no entry, one caller computes it while others wait for it to
+    be stored - rather than computing it too"""
+    result_cache = SearchResultCache("default", timeout=60, stale_timeout=60)
+    content, ticket = result_cache.get("key", ["teams.Team"])
+
+    # i.e. the entry is stored while the other caller waits
+    with patch.object(
+        cache_module.time, "sleep", side_effect=lambda _: result_cache.set(ticket, b"1")
+    ):
+        content_waited, ticket_waited = result_cache.get("key", ["teams.Team"])
+
+    assert content is None
+    assert ticket is not None
+    assert content_waited == b"1"
+    assert ticket_waited is None
+
+
+def test_miss_released():
+    """Verify that callers waiting for an entry compute it themselves, if it's released
+    without being stored (e.g. the results were partial) - or the wait times out"""
+    result_cache = SearchResultCache("default", timeout=60, stale_timeout=60)
+    _, ticket = result_cache.get("key", ["teams.Team"])
+
+    with patch.object(
+        cache_module.time, "sleep", side_effect=lambda _: result_cache.release(ticket)
+    ):
+        content_released, ticket_released = result_cache.get("key", ["teams.Team"])
+    with patch.object(cache_module, "MISS_WAIT", 0):
+        content_timed_out, ticket_timed_out = result_cache.get("key", ["teams.Team"])
+
+    assert content_released is None
+    assert ticket_released is not None
+    assert content_timed_out is None
+    assert ticket_timed_out is not None
+
+
+def test_stale_invalidated():
+    """Verify that stale entries are never served if a generation has changed"""
+    result_cache = SearchResultCache("default", timeout=0, stale_timeout=60)
+    _, ticket = result_cache.get("key", ["teams.Team"])
+    result_cache.set(ticket, b"content")
+    cache.add("key:lock", 1)
+
+    bump_generation("default", "teams.Team")
+    with patch.object(cache_module, "MISS_WAIT", 0):
+        content, ticket = result_cache.get("key", ["teams.Team"])
+
+    assert content is None
+    assert ticket is not None
+
+
+def test_generations_evicted():
+    """Verify that evicted generations are re-initialised with a new value, and that bumping
+    an evicted generation changes it"""
+    generation = get_generations("default", ["teams.Team"])["teams.Team"]
+
+    cache.delete(generation_key("teams.Team"))
+    generation_new = get_generations("default", ["teams.Team"])["teams.Team"]
+
+    cache.delete(generation_key("teams.Team"))
+    bump_generation("default", "teams.Team")
+    generation_bumped = get_generations("default", ["teams.Team"])["teams.Team"]
+
+    assert len({generation, generation_new, generation_bumped}) == 3
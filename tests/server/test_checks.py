@@ -0,0 +1,62 @@
+"""Tests verifying the system checks, i.e. the warnings about process-local caches and folding"""
+
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.test import override_settings
+
+from admin_site_search.views import AdminSiteSearchView
+
+
+def check_ids() -> list:
+    """Returns the ids of the admin site's system check messages"""
+    return [message.id for message in admin.site.check(None)]
+
+
+@pytest.mark.parametrize(
+    "attribute,value",
+    [
+        ("site_search_cache_timeout", 60),
+        ("site_search_prefix_memo_timeout", 60),
+        ("site_search_method", "in_memory_index"),
+        ("site_search_bloom_filters", True),
+        ("site_search_fuzzy_max_distance", 1),
+        ("site_search_completions", 10),
+        ("site_search_abandon_superseded", True),
+    ],
+)
+def test_process_local_cache(attribute, value):
+    """Verify that features relying on the cache warn if it isn't shared between processes"""
+    with patch.object(AdminSiteSearchView, attribute, value):
+        assert "admin_site_search.W001" in check_ids()
+
+
+def test_shared_cache():
+    """Verify that a shared cache doesn't warn"""
+    caches = {"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache"}}
+
+    with patch.object(AdminSiteSearchView, "site_search_cache_timeout", 60):
+        with override_settings(CACHES=caches):
+            assert "admin_site_search.W001" not in check_ids()
+
+
+def test_features_disabled():
+    """Verify that the default features don't warn, as none rely on the cache"""
+    assert "admin_site_search.W001" not in check_ids()
+
+
+@pytest.mark.parametrize(
+    "method,warned",
+    [
+        ("model_char_fields", True),
+        ("admin_search_fields", True),
+        ("sqlite_fts5", False),
+        ("in_memory_index", False),
+    ],
+)
+def test_fold_text_ignored(method, warned):
+    """Verify that folding warns with methods that query each model's own fields"""
+    with patch.object(AdminSiteSearchView, "site_search_fold_text", True):
+        with patch.object(AdminSiteSearchView, "site_search_method", method):
+            assert ("admin_site_search.W002" in check_ids()) == warned
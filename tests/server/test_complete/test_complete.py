@@ -0,0 +1,236 @@
+"""Tests verifying type-ahead completions (site_search_completions), returned by
+search/complete/ from an in-process vocabulary of each model"""
+
+import random
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth.models import Permission
+from django.db import DatabaseError, connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+
+from admin_site_search.completions import MAX_LENGTH, Vocabulary, VocabularyRegistry
+from dev.football.stadiums.factories import StadiumFactory
+from tests import create_team
+from tests.server.test_complete.urls_complete import CompleteAdminSite, site
+from tests.server.test_templates import request_admin_content
+
+urls_complete = override_settings(
+    ROOT_URLCONF="tests.server.test_complete.urls_complete"
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_vocabularies():
+    """Ensures every test starts (and ends) with new (empty) vocabularies"""
+    site._vocabularies = None
+    yield
+    site._vocabularies = None
+
+
+def request_complete(client: Client, query: str = ""):
+    """Returns the response after performing a GET request against the
+    "admin:site-search-complete" endpoint, with the given client and query"""
+    return client.get(f"{reverse('admin:site-search-complete')}?q={query}")
+
+
+@urls_complete
+def test_completions(client_super_admin):
+    """Verify that values starting with the query are completed, most frequent (then in
+    order) first, across models"""
+    create_team("Stoke City")
+    create_team("Stockport County")
+    create_team("stockport county")
+    StadiumFactory(name="Stockport Arena")
+
+    response = request_complete(client_super_admin, query="STO")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "completions": ["Stockport County", "Stockport Arena", "Stoke City"]
+    }
+
+
+@urls_complete
+def test_names_first(client_super_admin):
+    """Verify that app and model names are completed before values, and that completions
+    are limited to site_search_completions"""
+    for name in ["Sta", "Stb", "Stc", "Std"]:
+        create_team(name)
+
+    response = request_complete(client_super_admin, query="st")
+
+    assert response.json() == {"completions": ["Stadiums", "Sta", "Stb", "Stc", "Std"]}
+
+
+@urls_complete
+def test_permissions(client_admin, user_admin):
+    """Verify that only models the user has permission to view are completed"""
+    create_team("Stoke City")
+    StadiumFactory(name="Stockport Arena")
+
+    permission_ids = Permission.objects.filter(codename="view_team").values_list(
+        "id", flat=True
+    )
+    user_admin.user_permissions.add(*permission_ids)
+
+    response = request_complete(client_admin, query="sto")
+
+    assert response.json() == {"completions": ["Stoke City"]}
+
+
+@urls_complete
+@pytest.mark.parametrize("query", ["", "%20", "xyz"])
+def test_empty(client_super_admin, query):
+    """Verify that blank queries, and those without completions, return none"""
+    create_team("Stoke City")
+
+    response = request_complete(client_super_admin, query=query)
+
+    assert response.json() == {"completions": []}
+
+
+@urls_complete
+def test_authenticated(client_standard):
+    """Verify that only staff users can request completions"""
+    response = request_complete(client_standard, query="sto")
+
+    assert response.status_code == 302
+    assert response.url.startswith("/admin/login/")
+
+
+@urls_complete
+def test_no_queries(client_super_admin, django_capture_on_commit_callbacks):
+    """Verify that the database is only queried to build vocabularies, which are rebuilt
+    once a write, to the model, is committed"""
+    create_team("Stoke City")
+    request_complete(client_super_admin, query="sto")
+
+    with CaptureQueriesContext(connection) as queries:
+        response = request_complete(client_super_admin, query="sto")
+    model_queries = [q for q in queries if "teams_team" in q["sql"]]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        create_team("Stockport County")
+    response_written = request_complete(client_super_admin, query="sto")
+
+    assert response.json() == {"completions": ["Stoke City"]}
+    assert model_queries == []
+    assert response_written.json() == {
+        "completions": ["Stockport County", "Stoke City"]
+    }
+
+
+@urls_complete
+@pytest.mark.usefixtures("transactional_db")
+def test_built_in_background(client_super_admin):
+    """Verify that a model's vocabulary is first built in a background thread, while only
+    names are completed - rather than waiting for it"""
+    create_team("Stoke City")
+
+    # (with a new registry, so no vocabulary of the model was built by an earlier test)
+    with patch.object(site, "_vocabularies", None):
+        with patch.object(VocabularyRegistry, "background", True):
+            response = request_complete(client_super_admin, query="sto")
+            site._get_vocabularies().join()
+            response_built = request_complete(client_super_admin, query="sto")
+
+    assert response.json() == {"completions": []}
+    assert response_built.json() == {"completions": ["Stoke City"]}
+
+
+@urls_complete
+@pytest.mark.usefixtures("transactional_db")
+def test_rebuilt_in_background(client_super_admin):
+    """Verify that, after a write, the previous vocabulary is used while the model's
+    vocabulary is rebuilt in a background thread - rather than by the request"""
+    create_team("Stoke City")
+    request_complete(client_super_admin, query="sto")
+
+    with patch.object(VocabularyRegistry, "background", True):
+        create_team("Stockport County")
+        response_stale = request_complete(client_super_admin, query="sto")
+        site._get_vocabularies().join()
+        response_rebuilt = request_complete(client_super_admin, query="sto")
+
+    assert response_stale.json() == {"completions": ["Stoke City"]}
+    assert response_rebuilt.json() == {
+        "completions": ["Stockport County", "Stoke City"]
+    }
+
+
+@urls_complete
+def test_build_error(client_super_admin):
+    """Verify that if a model's vocabulary can't be built, names are still completed"""
+    create_team("Stoke City")
+
+    with patch.object(
+        CompleteAdminSite, "_build_vocabulary", side_effect=DatabaseError("Test error")
+    ):
+        response = request_complete(client_super_admin, query="st")
+
+    assert response.status_code == 200
+    assert response.json() == {"completions": ["Stadiums"]}
+
+
+def test_disabled(client_super_admin):
+    """Verify that, by default, search/complete/ isn't routed, nor referenced by the page"""
+    content = request_admin_content(client_super_admin)
+
+    with pytest.raises(NoReverseMatch):
+        reverse("admin:site-search-complete")
+    assert "data-complete-path" not in content
+
+
+@urls_complete
+def test_template(client_super_admin):
+    """Verify that the page references search/complete/, if completions are enabled"""
+    content = request_admin_content(client_super_admin)
+
+    assert 'data-complete-path="/admin/search/complete/"' in content
+
+
+def test_vocabulary():
+    """Verify that a prefix's completions are the same as from sorting every term starting
+    with it, by weight (then in order)"""
+    rng = random.Random(0)
+    weighted_terms = [
+        ("".join(rng.choices("abcAB", k=rng.randint(1, 6))), rng.randint(1, 9))
+        for _ in range(500)
+    ]
+    vocabulary = Vocabulary(weighted_terms)
+
+    weights = {}
+    for term, weight in weighted_terms:
+        weights[term.lower()] = weights.get(term.lower(), 0) + weight
+
+    for prefix in ["", "a", "AB", "bca", "cc", "abcabc", "z"]:
+        expected = sorted(
+            (-w, t) for t, w in weights.items() if t.startswith(prefix.lower())
+        )[:10]
+        assert [(t.lower(), w) for t, w in vocabulary.complete(prefix, 10)] == [
+            (t, -w) for w, t in expected
+        ]
+
+
+def test_vocabulary_case():
+    """Verify that terms differing by case are combined, keeping the first's case"""
+    vocabulary = Vocabulary([("Arsenal", 1), ("ARSENAL", 2), ("Arsenic", 2)])
+
+    assert vocabulary.complete("ars", 5) == [("Arsenal", 3), ("Arsenic", 2)]
+    assert vocabulary.complete("arsenal", 5) == [("Arsenal", 3)]
+    assert len(vocabulary) == 2
+    assert Vocabulary([]).complete("a", 5) == []
+
+
+@urls_complete
+def test_max_length(client_super_admin):
+    """Verify that values longer than MAX_LENGTH aren't completed"""
+    create_team("Stoke City")
+    create_team("Sto" + "o" * MAX_LENGTH)
+
+    response = request_complete(client_super_admin, query="sto")
+
+    assert response.json() == {"completions": ["Stoke City"]}
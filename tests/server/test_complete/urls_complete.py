@@ -0,0 +1,21 @@
+"""URL conf for a project where the admin site routes search/complete/ to completions"""
+
+from django.contrib import admin
+from django.urls import path
+
+from dev.admin import CustomAdminSite
+
+
+class CompleteAdminSite(CustomAdminSite):
+    """Returns up to 5 completions"""
+
+    site_search_completions = 5
+
+
+site = CompleteAdminSite()
+# share the default site's registered models/admins
+site._registry = admin.site._registry
+
+urlpatterns = [
+    path("admin/", site.urls),
+]
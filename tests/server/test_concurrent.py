@@ -0,0 +1,101 @@
+"""Tests verifying that searches run in a thread pool (site_search_max_workers) return the
+same results as searches run one model at a time"""
+
+from unittest.mock import patch
+
+import pytest
+from django.apps import apps
+from django.test import override_settings
+
+from admin_site_search.views import AdminSiteSearchView
+from dev.football.core.factories import GroupFactory
+from dev.football.players.factories import PlayerFactory
+from dev.football.stadiums.factories import StadiumFactory
+from dev.football.teams.factories import TeamFactory
+from tests import request_search
+
+# threads use their own connections, so data must be committed to be visible
+pytestmark = pytest.mark.usefixtures("transactional_db")
+
+
+def request_search_threaded(client, query: str, max_workers: int = 4, **kwargs):
+    """Performs a search, with site_search_max_workers patched"""
+    with patch.object(AdminSiteSearchView, "site_search_max_workers", max_workers):
+        return request_search(client, query=query, **kwargs)
+
+
+@pytest.mark.parametrize("method", ["model_char_fields", "admin_search_fields"])
+def test_results_match_serial(client_super_admin, method):
+    """Verify that threaded searches return the same results, in the same order, as serial
+    searches"""
+    GroupFactory(name="Manchester admins")
+    TeamFactory(name="Manchester United")
+    TeamFactory(name="Manchester City")
+    PlayerFactory(name="Manuel Almunia")
+    StadiumFactory(name="Manchester Arena")
+
+    serial = request_search(client_super_admin, query="man", site_search_method=method)
+    threaded = request_search_threaded(
+        client_super_admin, query="man", site_search_method=method
+    )
+
+    assert threaded.status_code == 200
+    assert threaded.json() == serial.json()
+    assert threaded.json()["counts"]["objects"] > 0
+
+
+@override_settings(DEBUG=True)
+def test_errors(client_super_admin):
+    """Verify that errors raised in a thread are added to the errors list, in app/model order"""
+
+    def error_if_stadium_or_team(_, app_label, model_dict):
+        """Fails for the Stadium and Team models, default otherwise"""
+        if model_dict["object_name"] in ["Stadium", "Team"]:
+            raise Exception(f"Error for {model_dict['object_name']}")
+        return apps.get_model(app_label, model_dict["object_name"])
+
+    with patch.object(AdminSiteSearchView, "get_model_class") as get_model_class:
+        get_model_class.side_effect = error_if_stadium_or_team
+        response = request_search_threaded(client_super_admin, query="stadium")
+
+    data = response.json()
+
+    assert response.status_code == 200
+    assert [(e["app"], e["model"]) for e in data["errors"]] == [
+        ("stadiums", "Stadium"),
+        ("teams", "Team"),
+    ]
+    assert [m["id"] for a in data["results"]["apps"] for m in a["models"]] == [
+        "stadiums.Pitch"
+    ]
+
+
+def test_connections_closed(client_super_admin):
+    """Verify that every model's thread closes its database connections, once the model has
+    been searched"""
+    with patch.object(
+        AdminSiteSearchView,
+        "_search_model",
+        autospec=True,
+        side_effect=AdminSiteSearchView._search_model,
+    ) as search_model:
+        with patch("admin_site_search.views.connections") as connections:
+            response = request_search_threaded(client_super_admin, query="stadium")
+
+    models_total = sum(len(a["models"]) for a in response.json()["results"]["apps"])
+
+    assert response.status_code == 200
+    assert models_total > 0
+    assert connections.close_all.call_count == search_model.call_count > 1
+
+
+@pytest.mark.parametrize("max_workers", [None, 0, 1])
+def test_serial(client_super_admin, max_workers):
+    """Verify that models are searched in the request's thread, if the thread pool is disabled"""
+    with patch("admin_site_search.views.ThreadPoolExecutor") as executor:
+        response = request_search_threaded(
+            client_super_admin, query="stadium", max_workers=max_workers
+        )
+
+    assert response.status_code == 200
+    assert executor.call_count == 0
@@ -0,0 +1,216 @@
+"""Tests verifying the on-disk (mmap) index file, used by the in_memory_index site_search_method
+if site_search_index_path is set"""
+
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from admin_site_search.diskindex import (
+    MappedIndex,
+    MappedRow,
+    decode_varint,
+    encode_postings,
+    index_counts,
+    merge_index,
+    write_index,
+)
+from admin_site_search.views import AdminSiteSearchView
+from dev.admin import CustomAdminSite
+from dev.football.core.factories import GroupFactory
+from dev.football.players.factories import PlayerAttributesFactory, PlayerFactory
+from dev.football.stadiums.factories import StadiumFactory
+from dev.football.teams.factories import TeamFactory
+from tests import request_search, request_search_index
+
+
+@pytest.fixture()
+def index_path(tmp_path):
+    """Sets site_search_index_path to a (not yet written) file"""
+    path = str(tmp_path / "site-search.idx")
+    with patch.object(AdminSiteSearchView, "site_search_index_path", path):
+        yield path
+
+
+@pytest.fixture()
+def data():
+    """Creates matching objects across multiple apps/models, with different pk types"""
+    GroupFactory(name="Manchester admins")
+    for i in range(7):
+        TeamFactory(name=f"Manchester {i}")
+    PlayerFactory(name="Manuel Almunia")
+    StadiumFactory(name="Manchester Arena")
+    PlayerAttributesFactory(nationality="Manx")
+
+
+@pytest.mark.usefixtures("data")
+@pytest.mark.parametrize("query", ["man", "MANCHESTER 3", "ma", "stadium", "xyz"])
+def test_results_match(client_super_admin, index_path, query):
+    """Verify that the index file returns the same results as model_char_fields"""
+    admin.site.write_search_index()
+
+    response = request_search(client_super_admin, query=query)
+    response_index = request_search_index(client_super_admin, query=query)
+
+    assert response_index.status_code == 200
+    assert response_index.json() == response.json()
+
+
+@pytest.mark.usefixtures("data")
+def test_queries(client_super_admin, index_path):
+    """Verify that, with the index file, the database is only queried for the pks of the
+    matches of each model with any (groups, players, player attributes, stadiums and teams) -
+    not to match objects, or retrieve their display names"""
+    admin.site.write_search_index()
+
+    with CaptureQueriesContext(connection) as queries:
+        response = request_search_index(client_super_admin, query="man")
+
+    assert response.json()["counts"]["objects"] == 9
+    assert not [q for q in queries if "LIKE" in q["sql"]]
+    assert len(queries) == 5 + 2  # +2 for session/user
+
+
+@pytest.mark.usefixtures("data")
+def test_get_model_queryset_overridden(client_super_admin, index_path):
+    """Verify that, if get_model_queryset is overridden, matches are retrieved from it"""
+    admin.site.write_search_index()
+
+    with patch.object(
+        CustomAdminSite,
+        "get_model_queryset",
+        lambda self, request, model_class, model_admin: model_class.objects.filter(
+            name__endswith="3"
+        ),
+        create=True,
+    ):
+        response = request_search_index(client_super_admin, query="manchester")
+
+    teams = response.json()["results"]["apps"][-1]["models"][0]
+    assert [o["name"] for o in teams["objects"]] == ["Manchester 3"]
+
+
+def test_replaced(client_super_admin, index_path):
+    """Verify that the file is re-mapped once it's replaced, and that objects written since the
+    file was written aren't matched until then"""
+    TeamFactory(name="Arsenal")
+    admin.site.write_search_index()
+    request_search_index(client_super_admin, query="arsenal")
+
+    TeamFactory(name="Arsenal Women")
+    response = request_search_index(client_super_admin, query="arsenal")
+    assert response.json()["counts"]["objects"] == 1
+
+    admin.site.write_search_index()
+    response = request_search_index(client_super_admin, query="arsenal")
+    assert response.json()["counts"]["objects"] == 2
+
+
+def test_deleted(client_super_admin, index_path):
+    """Verify that rows of objects deleted since the file was written aren't matched"""
+    TeamFactory(name="Arsenal")
+    TeamFactory(name="Arsenal Women").delete()
+    team = TeamFactory(name="Arsenal Academy")
+    admin.site.write_search_index()
+    team.delete()
+
+    response = request_search_index(client_super_admin, query="arsenal")
+
+    teams = response.json()["results"]["apps"][0]["models"][0]
+    assert [o["name"] for o in teams["objects"]] == ["Arsenal"]
+
+
+def test_missing(client_super_admin, index_path):
+    """Verify that, if the file doesn't exist (yet), indexes are built in-process"""
+    TeamFactory(name="Arsenal")
+
+    response = request_search_index(client_super_admin, query="arsenal")
+
+    assert response.json()["counts"]["objects"] == 1
+
+
+def test_write_path_required():
+    """Verify that a path is required to write the index, if site_search_index_path isn't
+    set"""
+    with pytest.raises(ValueError):
+        admin.site.write_search_index()
+
+
+def test_varints():
+    """Verify that postings are delta-encoded, with multi-byte varints for large deltas"""
+    encoded = encode_postings([3, 5, 1000, 100000])
+    values = []
+    position = 0
+    while position < len(encoded):
+        value, position = decode_varint(encoded, position)
+        values.append(value)
+
+    assert values == [3, 2, 995, 99000]
+    assert len(encoded) == 1 + 1 + 2 + 3
+
+
+def test_mapped_index(tmp_path):
+    """Verify that non-ascii text is matched, and models without rows are included"""
+    path = str(tmp_path / "index")
+    write_index(
+        path,
+        [
+            (
+                "teams.Team",
+                [(1, "Ødegaard", ["Ødegaard"]), (2, "Ødeg", ["ØDEG", None])],
+            ),
+            ("teams.Squad", []),
+        ],
+    )
+    index = MappedIndex(path)
+
+    assert "teams.Team" in index
+    assert "teams.Squad" in index
+    assert "players.Player" not in index
+    assert index.section("teams.Team").match("øde") == [
+        MappedRow("1", "Ødegaard"),
+        MappedRow("2", "Ødeg"),
+    ]
+    assert index.section("teams.Team").match("gaa") == [MappedRow("1", "Ødegaard")]
+    assert index.section("teams.Team").match("ø", limit=1) == [
+        MappedRow("1", "Ødegaard")
+    ]
+    assert index.section("teams.Squad").match("øde") == []
+
+    index.close()
+
+
+def test_merged_parts(tmp_path):
+    """Verify that a model's sections in multiple files (i.e. parts) are kept, and matched in
+    order"""
+    paths = [str(tmp_path / name) for name in ["part-1", "part-2", "other", "index"]]
+    write_index(paths[0], [("teams.Team", [(1, "Arsenal", ["Arsenal"])])])
+    write_index(paths[1], [("teams.Team", [(2, "Arsenal W", ["Arsenal W"])])])
+    write_index(paths[2], [("players.Player", [(1, "Saka", ["Saka"])])])
+
+    merge_index(paths[:3], paths[3])
+    index = MappedIndex(paths[3])
+
+    assert index_counts(paths[3]) == {"teams.Team": 2, "players.Player": 1}
+    assert len(index.section("teams.Team")) == 2
+    assert index.section("teams.Team").match("arsenal") == [
+        MappedRow("1", "Arsenal"),
+        MappedRow("2", "Arsenal W"),
+    ]
+    assert index.section("teams.Team").match("arsenal", limit=1) == [
+        MappedRow("1", "Arsenal")
+    ]
+    assert index.section("players.Player").match("saka") == [MappedRow("1", "Saka")]
+
+    index.close()
+
+
+def test_invalid_file(tmp_path):
+    """Verify that files that aren't index files are rejected"""
+    path = tmp_path / "index"
+    path.write_bytes(b"not an index file")
+
+    with pytest.raises(ValueError):
+        MappedIndex(str(path))
@@ -0,0 +1,150 @@
+"""Tests verifying accent- and case-folded matching (site_search_fold_text), against folded
+copies of the indexed text"""
+
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.db import connection
+
+from admin_site_search import fts5
+from admin_site_search.diskindex import MappedIndex, write_index
+from admin_site_search.folding import fold
+from admin_site_search.trigrams import TrigramIndex
+from admin_site_search.views import AdminSiteSearchView
+from dev.football.players.factories import PlayerFactory
+from dev.football.players.models import Player
+from tests import player_names, request_search
+
+METHODS = ["sqlite_fts5", "in_memory_index"]
+
+
+@pytest.fixture()
+def fold_enabled():
+    """Enables folded matching"""
+    with patch.object(AdminSiteSearchView, "site_search_fold_text", True):
+        yield
+
+
+def test_fold():
+    """Verify that text is casefolded, and stripped of accents - including letters without a
+    decomposition"""
+    assert fold("Ødegaard") == "odegaard"
+    assert fold("Martin ØDEGAARD") == "martin odegaard"
+    assert fold("Mbappé") == "mbappe"
+    assert fold("Müller") == "muller"
+    assert fold("Szczęsny") == "szczesny"
+    assert fold("Łukasz") == "lukasz"
+    assert fold("Großkreutz") == "grosskreutz"
+    assert fold("Ǳeko") == "dzeko"
+    assert fold("Aston Villa") == "aston villa"
+
+
+@pytest.mark.usefixtures("fold_enabled")
+@pytest.mark.parametrize("site_search_method", METHODS)
+@pytest.mark.parametrize("query", ["odegaard", "Ødegaard", "ØDEGAARD", "ødé"])
+def test_folded(client_super_admin, site_search_method, query):
+    """Verify that queries match regardless of accents and case, with each index method"""
+    PlayerFactory(name="Martin Ødegaard")
+    PlayerFactory(name="Martin Odegaard")
+    PlayerFactory(name="Bukayo Saka")
+
+    response = request_search(
+        client_super_admin, query=query, site_search_method=site_search_method
+    )
+
+    assert player_names(response) == ["Martin Odegaard", "Martin Ødegaard"]
+
+
+@pytest.mark.parametrize("site_search_method", METHODS)
+def test_disabled(client_super_admin, site_search_method):
+    """Verify that, by default, accents must match"""
+    assert AdminSiteSearchView.site_search_fold_text is False
+    PlayerFactory(name="Martin Ødegaard")
+
+    response = request_search(
+        client_super_admin, query="odegaard", site_search_method=site_search_method
+    )
+
+    assert player_names(response) == []
+
+
+@pytest.mark.usefixtures("fold_enabled")
+def test_fts5_shadow_labels(client_super_admin, django_capture_on_commit_callbacks):
+    """Verify that the FTS5 index holds folded text under the model's shadow label, which is
+    kept in sync with writes - without folding rows at query time"""
+    request_search(client_super_admin, query="x", site_search_method="sqlite_fts5")
+    with django_capture_on_commit_callbacks(execute=True):
+        PlayerFactory(name="Kylian Mbappé")
+
+    generation = fts5.active_generation(connection.alias)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT label, body FROM {fts5.table_name(generation)} "
+            f"WHERE label IN (%s, %s)",
+            ["players.Player", "players.Player:folded"],
+        )
+        rows = cursor.fetchall()
+    response = request_search(
+        client_super_admin, query="MBAPPE", site_search_method="sqlite_fts5"
+    )
+
+    assert [label for label, _ in rows] == ["players.Player:folded"]
+    assert "kylian mbappe" in rows[0][1]
+    assert player_names(response) == ["Kylian Mbappé"]
+
+
+@pytest.mark.usefixtures("fold_enabled")
+def test_fts5_build(client_super_admin):
+    """Verify that rebuilding the FTS5 index rebuilds (and validates) the shadow labels"""
+    PlayerFactory(name="Martin Ødegaard")
+
+    with patch.object(AdminSiteSearchView, "site_search_method", "sqlite_fts5"):
+        built = dict(admin.site.build_search_index())
+    response = request_search(
+        client_super_admin, query="odegaard", site_search_method="sqlite_fts5"
+    )
+
+    assert built[Player] == 1
+    assert fts5.indexed_labels(connection.alias, ["players.Player:folded"]) == {
+        "players.Player:folded"
+    }
+    assert player_names(response) == ["Martin Ødegaard"]
+
+
+@pytest.mark.usefixtures("fold_enabled")
+def test_index_file(client_super_admin, tmp_path):
+    """Verify that the index file is folded as per the site when written, and that queries of
+    it are folded as per the file"""
+    PlayerFactory(name="Martin Ødegaard")
+    path = str(tmp_path / "site-search.idx")
+    admin.site.write_search_index(path)
+
+    with patch.object(AdminSiteSearchView, "site_search_index_path", path):
+        response = request_search(
+            client_super_admin, query="odegaard", site_search_method="in_memory_index"
+        )
+
+    assert player_names(response) == ["Martin Ødegaard"]
+
+
+def test_indexes(tmp_path):
+    """Verify that folded indexes match folded queries, and unfolded ones don't"""
+    rows = [(1, ["Ødegaard"]), (2, ["Saka"]), (3, ["Mbappé"])]
+    path = str(tmp_path / "site-search.idx")
+    write_index(path, [("a.A", [(pk, "", values) for pk, values in rows])], True)
+    write_index(f"{path}.b", [("b.B", [(pk, "", values) for pk, values in rows])])
+
+    mapped_index = MappedIndex(path)
+    unfolded_index = MappedIndex(f"{path}.b")
+    try:
+        assert [r.pk for r in mapped_index.section("a.A").match("ODEG")] == ["1"]
+        assert [r.pk for r in mapped_index.section("a.A").match("pé")] == ["3"]
+        assert [r.pk for r in unfolded_index.section("b.B").match("odeg")] == []
+    finally:
+        mapped_index.close()
+        unfolded_index.close()
+
+    assert TrigramIndex(rows, folded=True).match("ØDEG") == ["1"]
+    assert TrigramIndex(rows, folded=True).match("mbappe") == ["3"]
+    assert TrigramIndex(rows).match("mbappe") == []
@@ -0,0 +1,286 @@
+"""Tests verifying the sqlite_fts5 site_search_method, which matches objects in all models with a
+single query against a SQLite FTS5 index"""
+
+from unittest.mock import patch
+
+import pytest
+from django.db import DatabaseError, connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+
+from admin_site_search import fts5
+from admin_site_search.views import AdminSiteSearchView
+from dev.admin import CustomAdminSite
+from dev.football.core.factories import GroupFactory
+from dev.football.players.factories import PlayerAttributesFactory, PlayerFactory
+from dev.football.stadiums.factories import StadiumFactory
+from dev.football.teams.factories import TeamFactory
+from dev.football.teams.models import Team
+from tests import request_search
+
+
+def request_search_fts5(client, query: str):
+    """Performs a search, with the sqlite_fts5 site_search_method"""
+    return request_search(client, query=query, site_search_method="sqlite_fts5")
+
+
+def object_ids(response) -> dict:
+    """Returns the set of matched object ids, for each model id in the response"""
+    return {
+        model["id"]: {o["id"] for o in model["objects"]}
+        for app in response.json()["results"]["apps"]
+        for model in app["models"]
+    }
+
+
+@pytest.fixture()
+def data():
+    """Creates matching objects across multiple apps/models, with different pk types"""
+    GroupFactory(name="Manchester admins")
+    for i in range(3):
+        TeamFactory(name=f"Manchester {i}")
+    PlayerFactory(name="Manuel Almunia")
+    StadiumFactory(name="Manchester Arena")
+    PlayerAttributesFactory(nationality="Manx")
+
+
+@pytest.mark.usefixtures("data")
+@pytest.mark.parametrize("query", ["man", "MANCHESTER 1", "ma", "stadium", "xyz"])
+def test_results_match(client_super_admin, query):
+    """Verify that the index matches the same objects as model_char_fields (for fewer than 5
+    matches per model, since the order differs)"""
+    response = request_search(client_super_admin, query=query)
+    response_fts5 = request_search_fts5(client_super_admin, query=query)
+
+    assert response_fts5.status_code == 200
+    assert response_fts5.json()["counts"] == response.json()["counts"]
+    assert object_ids(response_fts5) == object_ids(response)
+
+
+@pytest.mark.usefixtures("data")
+def test_queries(client_super_admin):
+    """Verify that, once indexed, objects are matched with a single MATCH query, after which the
+    display names are retrieved for each model with matches"""
+    request_search_fts5(client_super_admin, query="xyz")
+
+    with CaptureQueriesContext(connection) as queries:
+        response = request_search_fts5(client_super_admin, query="man")
+
+    queries_match = [q for q in queries if " MATCH " in q["sql"]]
+    queries_like = [q for q in queries if "LIKE" in q["sql"]]
+
+    assert response.status_code == 200
+    assert response.json()["counts"]["objects"] == 7
+    assert len(queries_match) == 1
+    assert not queries_like
+
+
+def test_limit(client_super_admin):
+    """Verify that up to 5 objects are returned per model"""
+    for i in range(7):
+        TeamFactory(name=f"Arsenal {i}")
+
+    response = request_search_fts5(client_super_admin, query="arsenal")
+
+    assert len(object_ids(response)["teams.Team"]) == 5
+
+
+@pytest.mark.parametrize("query", ['"', 'ars"enal', "a%", "_", "ars OR NOT"])
+def test_special_characters(client_super_admin, query):
+    """Verify that FTS5 syntax, and LIKE wildcards, are matched literally"""
+    TeamFactory(name="Arsenal")
+
+    response = request_search_fts5(client_super_admin, query=query)
+
+    assert response.status_code == 200
+    assert response.json()["errors"] == []
+    assert not object_ids(response).get("teams.Team")
+
+
+def test_synced_on_write(client_super_admin, django_capture_on_commit_callbacks):
+    """Verify that saved/deleted objects are synced to the index, once committed"""
+    team = TeamFactory(name="Arsenal")
+    request_search_fts5(client_super_admin, query="arsenal")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        team.name = "Tottenham"
+        team.save()
+        team_new = TeamFactory(name="Arsenal Women")
+
+    assert object_ids(request_search_fts5(client_super_admin, query="arsenal")) == {
+        "teams.Team": {str(team_new.pk)}
+    }
+    assert object_ids(request_search_fts5(client_super_admin, query="tott")) == {
+        "teams.Team": {str(team.pk)}
+    }
+
+    with django_capture_on_commit_callbacks(execute=True):
+        team_new.delete()
+
+    assert object_ids(request_search_fts5(client_super_admin, query="arsenal")) == {}
+
+
+def test_not_synced_before_indexed(django_capture_on_commit_callbacks):
+    """Verify that writes before the index exists are ignored, and don't raise errors"""
+    fts5.track_index_writes()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        TeamFactory(name="Arsenal")
+
+    fts5.ensure_tables("default")
+    assert fts5.indexed_labels("default", ["teams.Team"]) == set()
+
+
+def test_restricted_queryset(client_super_admin):
+    """Verify that matches are retrieved from get_model_queryset()"""
+    TeamFactory(name="Arsenal")
+    team = TeamFactory(name="Arsenal Women")
+
+    with patch.object(
+        AdminSiteSearchView,
+        "get_model_queryset",
+        lambda self, request, model_class, model_admin: model_class.objects.filter(
+            name__endswith="Women"
+        ),
+    ):
+        response = request_search_fts5(client_super_admin, query="arsenal")
+
+    assert object_ids(response)["teams.Team"] == {str(team.pk)}
+
+
+def test_unsupported_database(client_super_admin):
+    """Verify that, if the index can't be used, each model is searched as per
+    model_char_fields"""
+    team = TeamFactory(name="Arsenal")
+
+    with patch.object(fts5, "is_supported", return_value=False):
+        with CaptureQueriesContext(connection) as queries:
+            response = request_search_fts5(client_super_admin, query="arsenal")
+
+    assert object_ids(response)["teams.Team"] == {str(team.pk)}
+    assert not [q for q in queries if fts5.TABLE in q["sql"]]
+
+
+def test_filter_field_overridden(client_super_admin):
+    """Verify that, if filter_field is overridden, each model is searched with it rather than
+    the index (since the indexed fields may not be the ones it filters on)"""
+    team = TeamFactory(name="Arsenal", motto="Victoria Concordia Crescit")
+
+    def filter_motto(self, request, term, field):
+        """Only matches the motto field"""
+        if field.name == "motto":
+            return Q(motto__icontains=term)
+        return None
+
+    with patch.object(CustomAdminSite, "filter_field", filter_motto):
+        with CaptureQueriesContext(connection) as queries:
+            response = request_search_fts5(client_super_admin, query="concordia")
+        response_name = request_search_fts5(client_super_admin, query="arsenal")
+
+    assert object_ids(response)["teams.Team"] == {str(team.pk)}
+    assert not object_ids(response_name).get("teams.Team")
+    assert not [q for q in queries if fts5.TABLE in q["sql"]]
+
+
+def test_build_claimed(client_super_admin):
+    """Verify that models whose first build is claimed elsewhere are searched with per-model
+    queries, rather than built again (or waited for)"""
+    team = TeamFactory(name="Arsenal")
+    generation = fts5.ensure_tables("default")
+
+    with fts5.claim_build("default", "default", generation, "teams.Team") as claimed:
+        assert claimed
+        response = request_search_fts5(client_super_admin, query="arsenal")
+        indexed = fts5.indexed_labels("default", ["teams.Team", "players.Player"])
+
+    assert object_ids(response)["teams.Team"] == {str(team.pk)}
+    assert indexed == {"players.Player"}
+
+
+@pytest.mark.usefixtures("transactional_db")
+def test_built_in_background(client_super_admin):
+    """Verify that a model that hasn't been indexed is built in a background thread (which
+    reads committed data) once it's searched - and searched with per-model queries, rather than
+    waited for, until it's built"""
+    team = TeamFactory(name="Arsenal")
+
+    with patch.object(fts5, "BACKGROUND_BUILDS", True):
+        # i.e. the build isn't started until the search has finished, since SQLite's shared
+        # cache (of the in-memory test database) fails, rather than waits, on locked tables
+        with patch.object(fts5, "start_builds") as start_builds:
+            with CaptureQueriesContext(connection) as queries:
+                response = request_search_fts5(client_super_admin, query="arsenal")
+        fts5.start_builds(*start_builds.call_args.args)
+        fts5.join_builds()
+        response_built = request_search_fts5(client_super_admin, query="arsenal")
+
+    assert object_ids(response)["teams.Team"] == {str(team.pk)}
+    assert not [q for q in queries if "MATCH" in q["sql"]]
+    assert "teams.Team" in fts5.indexed_labels("default", ["teams.Team"])
+    assert object_ids(response_built)["teams.Team"] == {str(team.pk)}
+
+
+@pytest.mark.usefixtures("transactional_db")
+def test_background_build_error(caplog):
+    """Verify that if a background build fails, the error is logged - and the model is built
+    again once it's next searched"""
+    TeamFactory(name="Arsenal")
+    generation = fts5.ensure_tables("default")
+
+    with patch.object(fts5, "build", side_effect=DatabaseError("Test error")):
+        fts5.start_builds([Team], "default", generation)
+        fts5.join_builds()
+
+    fts5.start_builds([Team], "default", generation)
+    fts5.join_builds()
+
+    assert "Failed to index teams.Team in the background" in caplog.text
+    assert fts5.indexed_labels("default", ["teams.Team"]) == {"teams.Team"}
+
+
+def test_tables_created_once(client_super_admin):
+    """Verify that, once the index tables exist, searches don't (re)create them"""
+    request_search_fts5(client_super_admin, query="arsenal")
+
+    with CaptureQueriesContext(connection) as queries:
+        request_search_fts5(client_super_admin, query="arsenal")
+
+    assert not [q for q in queries if "CREATE" in q["sql"]]
+
+
+def test_build_chunked():
+    """Verify that a model is built in chunks, each committed in its own (short) transaction -
+    rather than holding SQLite's writer lock for the whole build"""
+    TeamFactory.create_batch(5)
+    fts5.ensure_tables("default")
+
+    with CaptureQueriesContext(connection) as queries:
+        count = fts5.build(Team, "default", chunk_size=2)
+
+    savepoints = [q for q in queries if q["sql"].startswith("SAVEPOINT")]
+    assert count == 5
+    # i.e. one to start the build, then one per chunk - the last finding no objects
+    assert len(savepoints) == 1 + 4
+    fts5.validate("default", fts5.active_generation("default"), [Team])
+
+
+def test_build_interrupted(django_capture_on_commit_callbacks):
+    """Verify that a partially built model isn't matched, but is synced - and is built in
+    full (without duplicate rows) by the next build"""
+    teams = TeamFactory.create_batch(5, name="Arsenal")
+    fts5.ensure_tables("default")
+
+    with patch.object(fts5, "_insert", side_effect=[None, DatabaseError()]):
+        with pytest.raises(DatabaseError):
+            fts5.build(Team, "default", chunk_size=2)
+
+    assert fts5.indexed_labels("default", ["teams.Team"]) == set()
+    with django_capture_on_commit_callbacks(execute=True):
+        teams[0].name = "Tottenham"
+        teams[0].save()
+    assert fts5.match("default", "tottenham", ["teams.Team"]) == {
+        "teams.Team": [str(teams[0].pk)]
+    }
+
+    fts5.ensure_indexed([Team], "default")
+    fts5.validate("default", fts5.active_generation("default"), [Team])
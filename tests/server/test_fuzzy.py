@@ -0,0 +1,234 @@
+"""Tests verifying typo-tolerant matching (site_search_fuzzy_max_distance), which searches
+models without matches for the nearest variants of the query"""
+
+import random
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.db import DatabaseError
+
+from admin_site_search.fuzzy import (
+    TermDictionary,
+    TermDictionaryRegistry,
+    levenshtein,
+)
+from admin_site_search.views import AdminSiteSearchView
+from dev.admin import CustomAdminSite
+from dev.football.teams.models import Team
+from tests import create_team, request_search, team_names
+
+
+@pytest.fixture()
+def fuzzy_enabled():
+    """Enables typo-tolerant matching, within 2 edits per word - with new dictionaries"""
+    with patch.object(AdminSiteSearchView, "site_search_fuzzy_max_distance", 2):
+        with patch.object(admin.site, "_term_dictionaries", None):
+            yield
+
+
+@pytest.mark.usefixtures("fuzzy_enabled")
+@pytest.mark.parametrize(
+    "site_search_method", ["model_char_fields", "sqlite_fts5", "in_memory_index"]
+)
+def test_typo(client_super_admin, site_search_method):
+    """Verify that misspelt queries match, with each site_search_method"""
+    create_team("Arsenal")
+    create_team("Chelsea")
+
+    response = request_search(
+        client_super_admin, query="Arsneal", site_search_method=site_search_method
+    )
+
+    assert team_names(response) == ["Arsenal"]
+
+
+@pytest.mark.usefixtures("fuzzy_enabled")
+def test_union_all(client_super_admin):
+    """Verify that misspelt queries match, with UNION ALL queries"""
+    create_team("Arsenal")
+
+    with patch.object(AdminSiteSearchView, "site_search_union_all", True):
+        response = request_search(client_super_admin, query="arsenl")
+
+    assert team_names(response) == ["Arsenal"]
+
+
+@pytest.mark.usefixtures("fuzzy_enabled")
+def test_max_distance(client_super_admin):
+    """Verify that variants are within the edit distance cap, and the (length-based) limit
+    of each word"""
+    create_team("Arsenal")
+
+    response_far = request_search(client_super_admin, query="Axxenxl")
+    response_short = request_search(client_super_admin, query="arsxx")
+    with patch.object(AdminSiteSearchView, "site_search_fuzzy_max_distance", 1):
+        response_capped = request_search(client_super_admin, query="Arsneal")
+
+    assert team_names(response_far) == []
+    # 5 characters, so only 1 edit is allowed
+    assert team_names(response_short) == []
+    assert team_names(response_capped) == []
+
+
+@pytest.mark.usefixtures("fuzzy_enabled")
+def test_exact_not_expanded(client_super_admin):
+    """Verify that models with matching objects aren't searched for variants"""
+    create_team("Arsenal")
+    create_team("Arsenel")
+
+    with patch.object(
+        TermDictionaryRegistry,
+        "get_many",
+        autospec=True,
+        side_effect=TermDictionaryRegistry.get_many,
+    ) as get_many:
+        response = request_search(client_super_admin, query="arsenal")
+
+    assert team_names(response) == ["Arsenal"]
+    assert get_many.call_count == 1
+    assert Team not in get_many.call_args.args[1]
+
+
+@pytest.mark.usefixtures("fuzzy_enabled")
+def test_max_expansions(client_super_admin):
+    """Verify that at most site_search_fuzzy_max_expansions variants are searched"""
+    for name in ["Arsenal", "Arsenel", "Arsenab"]:
+        create_team(name)
+
+    with patch.object(AdminSiteSearchView, "site_search_fuzzy_max_expansions", 1):
+        with patch.object(
+            AdminSiteSearchView,
+            "match_objects",
+            autospec=True,
+            side_effect=AdminSiteSearchView.match_objects,
+        ) as match_objects:
+            request_search(client_super_admin, query="arsenax")
+
+    queries = {c.args[2] for c in match_objects.call_args_list if c.args[3] is Team}
+    assert len(queries) == 2
+
+
+@pytest.mark.usefixtures("fuzzy_enabled")
+def test_rebuilt_on_write(client_super_admin, django_capture_on_commit_callbacks):
+    """Verify that dictionaries are rebuilt once a write, to the model, is committed"""
+    create_team("Arsenal")
+    request_search(client_super_admin, query="tottenhm")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        create_team("Tottenham")
+
+    response = request_search(client_super_admin, query="tottenhm")
+
+    assert team_names(response) == ["Tottenham"]
+
+
+@pytest.mark.usefixtures("fuzzy_enabled", "transactional_db")
+def test_built_in_background(client_super_admin):
+    """Verify that a model's dictionary is first built in a background thread, while the
+    search goes without its variants - rather than waiting for it"""
+    create_team("Arsenal")
+
+    # (with a new registry, so no dictionary of the model was built by an earlier test)
+    with patch.object(admin.site, "_term_dictionaries", None):
+        with patch.object(TermDictionaryRegistry, "background", True):
+            response = request_search(client_super_admin, query="arsneal")
+            admin.site._get_term_dictionaries().join()
+            response_built = request_search(client_super_admin, query="arsneal")
+
+    assert team_names(response) == []
+    assert team_names(response_built) == ["Arsenal"]
+
+
+@pytest.mark.usefixtures("fuzzy_enabled", "transactional_db")
+def test_rebuilt_in_background(client_super_admin):
+    """Verify that, after a write, the previous dictionary is used while the model's
+    dictionary is rebuilt in a background thread - rather than by the search"""
+    create_team("Arsenal")
+    request_search(client_super_admin, query="tottenhm")
+    registry = admin.site._get_term_dictionaries()
+
+    with patch.object(TermDictionaryRegistry, "background", True):
+        create_team("Tottenham")
+        response_stale = request_search(client_super_admin, query="tottenhm")
+        registry.join()
+        response_rebuilt = request_search(client_super_admin, query="tottenhm")
+
+    assert team_names(response_stale) == []
+    assert team_names(response_rebuilt) == ["Tottenham"]
+
+
+@pytest.mark.usefixtures("fuzzy_enabled")
+def test_build_error(client_super_admin):
+    """Verify that if a model's dictionary can't be built, the search succeeds - without
+    variants"""
+    create_team("Arsenal")
+
+    with patch.object(
+        CustomAdminSite,
+        "_build_term_dictionary",
+        side_effect=DatabaseError("Test error"),
+    ):
+        response = request_search(client_super_admin, query="arsneal")
+        response_exact = request_search(client_super_admin, query="arsenal")
+
+    assert response.status_code == 200
+    assert response.json()["errors"] == []
+    assert team_names(response) == []
+    assert team_names(response_exact) == ["Arsenal"]
+
+
+def test_disabled(client_super_admin):
+    """Verify that, by default, misspelt queries don't match"""
+    assert AdminSiteSearchView.site_search_fuzzy_max_distance is None
+    create_team("Arsenal")
+
+    response = request_search(client_super_admin, query="Arsneal")
+
+    assert team_names(response) == []
+
+
+def test_levenshtein():
+    """Verify edit distances, and that they're cut off beyond the limit"""
+    assert levenshtein("arsenal", "arsenal") == 0
+    assert levenshtein("arsneal", "arsenal") == 2
+    assert levenshtein("chelsea", "chelse") == 1
+    assert levenshtein("", "abc") == 3
+    assert levenshtein("arsenal", "chelsea", limit=2) == 3
+    assert levenshtein("arsenal", "ars", limit=2) == 3
+
+
+def test_expand():
+    """Verify that the terms near a token are the same as from comparing every term, by edit
+    distance (then frequency)"""
+    rng = random.Random(0)
+    texts = ["".join(rng.choices("abcde", k=rng.randint(3, 7))) for _ in range(500)]
+    dictionary = TermDictionary(texts)
+    counts = {t: texts.count(t) for t in texts}
+
+    for token in rng.sample(texts, 20) + ["abcdeab", "eee"]:
+        for max_distance in [1, 2]:
+            expected = sorted(
+                (levenshtein(token, t), -counts[t], t)
+                for t in counts
+                if 0 < levenshtein(token, t) <= max_distance
+            )
+            assert dictionary.expand(token, max_distance, 1000) == [
+                (t, d) for d, _, t in expected
+            ]
+
+
+def test_variants():
+    """Verify that variants replace unknown words with the nearest (then most frequent)
+    terms, keeping the query's other characters"""
+    dictionary = TermDictionary(
+        ["Arsenal FC", "Arsenal Women", "Arsenic", "Chelsea FC", "Chelsey"]
+    )
+
+    assert dictionary.variants("Arsenl - Chelsae", 2, 3) == [
+        ("arsenal - chelsae", 1),
+        ("arsenic - chelsae", 2),
+        ("arsenl - chelsea", 2),
+    ]
+    assert dictionary.variants("Arsenl FC", 2, 1) == [("arsenal fc", 1)]
+    assert dictionary.variants("arsenal", 2, 3) == []
@@ -0,0 +1,110 @@
+"""Tests verifying the debounce recommended to the search modal (in the X-Site-Search-Debounce
+header), as per the latency of recent searches"""
+
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.test import override_settings
+from django.urls import reverse
+
+from admin_site_search.latency import SearchLatency
+from admin_site_search.views import AdminSiteSearchView
+from dev.football.teams.factories import TeamFactory
+from tests import request_search
+from tests.server.test_async.urls_async import site as site_async
+
+urls_async = override_settings(ROOT_URLCONF="tests.server.test_async.urls_async")
+
+
+@pytest.fixture(autouse=True)
+def reset_latency():
+    """Ensures every test starts without recorded latencies"""
+    with patch.object(admin.site, "_search_latency", SearchLatency()):
+        yield
+
+
+@pytest.fixture()
+def data():
+    """Creates a matching object"""
+    TeamFactory(name="Arsenal")
+
+
+@pytest.mark.usefixtures("data")
+def test_hint(client_super_admin):
+    """Verify that each search records its latency, from which its response recommends a
+    debounce - within site_search_debounce_range"""
+    response = request_search(client_super_admin, query="ars")
+
+    assert admin.site._search_latency.average is not None
+    assert 150 <= int(response["X-Site-Search-Debounce"]) <= 1000
+
+
+def test_no_hint(client_super_admin):
+    """Verify that no debounce is recommended until a search has been recorded"""
+    response = request_search(client_super_admin)
+
+    assert "X-Site-Search-Debounce" not in response
+
+
+@pytest.mark.usefixtures("data")
+@pytest.mark.parametrize("average,expected", [(0.01, "150"), (5.0, "1000")])
+def test_hint_range(client_super_admin, average, expected):
+    """Verify that the recommended debounce is clamped to site_search_debounce_range"""
+    admin.site._search_latency.average = average
+
+    response = request_search(client_super_admin, query="ars")
+
+    assert response["X-Site-Search-Debounce"] == expected
+
+
+@pytest.mark.usefixtures("data")
+def test_stream(client_super_admin):
+    """Verify that streamed searches recommend a debounce, and record their latency once
+    consumed"""
+    admin.site._search_latency.average = 0.2
+
+    with patch.object(AdminSiteSearchView, "site_search_stream", True):
+        response = client_super_admin.get(
+            f"{reverse('admin:site-search')}?q=ars", HTTP_ACCEPT="application/x-ndjson"
+        )
+        assert response["X-Site-Search-Debounce"] == "400"
+        list(response.streaming_content)
+
+    assert admin.site._search_latency.average < 0.2
+
+
+@pytest.mark.usefixtures("data")
+def test_cached(client_super_admin):
+    """Verify that cache hits recommend a debounce, without recording their latency"""
+    with patch.object(AdminSiteSearchView, "site_search_cache_timeout", 60):
+        request_search(client_super_admin, query="ars")
+        average = admin.site._search_latency.average
+        response = request_search(client_super_admin, query="ars")
+
+    assert admin.site._search_latency.average == average
+    assert "X-Site-Search-Debounce" in response
+
+
+@pytest.mark.usefixtures("data")
+@urls_async
+def test_async(client_super_admin):
+    """Verify that the async view records latencies, and recommends a debounce"""
+    with patch.object(site_async, "_search_latency", SearchLatency()):
+        response = request_search(client_super_admin, query="ars")
+
+        assert site_async._search_latency.average is not None
+    assert 150 <= int(response["X-Site-Search-Debounce"]) <= 1000
+
+
+def test_latency():
+    """Verify the moving average, and that no debounce is recommended until it's recorded"""
+    latency = SearchLatency()
+    assert latency.debounce((150, 1000)) is None
+
+    latency.record(0.1)
+    latency.record(0.6)
+
+    assert latency.average == pytest.approx(0.2)
+    assert latency.debounce((150, 1000)) == 400
+    assert latency.debounce((500, 1000)) == 500
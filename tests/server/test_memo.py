@@ -0,0 +1,184 @@
+"""Tests verifying the per-user prefix memo (site_search_prefix_memo_timeout), which answers
+queries that extend a previous query without querying the database"""
+
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.test import Client
+
+from admin_site_search.memo import MemoRow
+from admin_site_search.views import AdminSiteSearchView
+from dev.admin import CustomAdminSite
+from dev.football.teams.models import Team
+from tests import count_searches, create_team, request_search
+
+
+@pytest.fixture()
+def memo_enabled():
+    """Enables the prefix memo, for 60 seconds"""
+    with patch.object(AdminSiteSearchView, "site_search_prefix_memo_timeout", 60):
+        yield
+
+
+def team_results(response) -> list:
+    """Returns the (id, name, url) of each team in the response"""
+    for app in response.json()["results"]["apps"]:
+        for model in app["models"]:
+            if model["id"] == "teams.Team":
+                return [(o["id"], o["name"], o["url"]) for o in model["objects"]]
+    return []
+
+
+@pytest.mark.usefixtures("memo_enabled")
+def test_complete(client_super_admin, match_objects):
+    """Verify that, if a prefix matched fewer than 5 objects, extended queries are filtered
+    from those objects - with the same results as a search"""
+    team_1 = create_team("Arsenal")
+    create_team("Aston Villa")
+    team_3 = create_team("Ars Nova", motto="ARSENIC")
+
+    request_search(client_super_admin, query="ars")
+    response = request_search(client_super_admin, query="ArsEn")
+    searches = count_searches(match_objects)
+
+    with patch.object(AdminSiteSearchView, "site_search_prefix_memo_timeout", None):
+        response_expected = request_search(client_super_admin, query="arsen")
+
+    assert searches == 1
+    assert [r[0] for r in team_results(response)] == [str(team_1.pk), str(team_3.pk)]
+    assert team_results(response) == team_results(response_expected)
+
+
+@pytest.mark.usefixtures("memo_enabled")
+def test_no_matches(client_super_admin, match_objects):
+    """Verify that, if a prefix matched nothing, extended queries aren't searched"""
+    create_team("Arsenal")
+
+    request_search(client_super_admin, query="xyz")
+    request_search(client_super_admin, query="xyzw")
+
+    assert count_searches(match_objects) == 1
+
+
+@pytest.mark.usefixtures("memo_enabled")
+def test_incomplete(client_super_admin, match_objects):
+    """Verify that, if a prefix matched 5 objects (i.e. maybe more), extended queries are
+    searched"""
+    for i in range(5):
+        create_team(f"Arsenal {i}")
+
+    request_search(client_super_admin, query="ars")
+    request_search(client_super_admin, query="arse")
+
+    assert count_searches(match_objects) == 2
+
+
+@pytest.mark.usefixtures("memo_enabled")
+def test_not_prefix(client_super_admin, match_objects):
+    """Verify that queries which don't extend the previous query are searched"""
+    create_team("Arsenal")
+
+    request_search(client_super_admin, query="arsenal")
+    request_search(client_super_admin, query="ars")
+    request_search(client_super_admin, query="xyz")
+
+    assert count_searches(match_objects) == 3
+
+
+@pytest.mark.usefixtures("memo_enabled")
+def test_invalidated_on_write(client_super_admin, django_capture_on_commit_callbacks):
+    """Verify that the memo is discarded once a write, to a searched model, is committed"""
+    request_search(client_super_admin, query="ars")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        team = create_team("Arsenal")
+
+    response = request_search(client_super_admin, query="arsenal")
+
+    assert [r[0] for r in team_results(response)] == [str(team.pk)]
+
+
+@pytest.mark.usefixtures("memo_enabled")
+def test_per_user(client_super_admin, match_objects):
+    """Verify that memos aren't shared between users"""
+    user_other = User.objects.create_user(
+        username="other", is_staff=True, is_superuser=True
+    )
+    client_other = Client()
+    client_other.force_login(user_other)
+
+    request_search(client_super_admin, query="xyz")
+    request_search(client_other, query="xyzw")
+
+    assert count_searches(match_objects) == 2
+
+
+@pytest.mark.usefixtures("memo_enabled")
+@pytest.mark.parametrize("union_all", [False, True])
+def test_union_all(client_super_admin, union_all):
+    """Verify that the memo is used with, and without, UNION ALL queries"""
+    team = create_team("Arsenal")
+
+    with patch.object(AdminSiteSearchView, "site_search_union_all", union_all):
+        request_search(client_super_admin, query="ars")
+        with patch.object(AdminSiteSearchView, "_filter_objects") as filter_objects:
+            response = request_search(client_super_admin, query="arsenal")
+
+    assert [r[0] for r in team_results(response)] == [str(team.pk)]
+    assert Team not in [c[0][2] for c in filter_objects.call_args_list]
+
+
+@pytest.mark.usefixtures("memo_enabled")
+def test_disabled_admin_search_fields(client_super_admin, match_objects):
+    """Verify that the memo isn't used with admin_search_fields, since matching depends on
+    the model admin"""
+    for query in ["xyz", "xyzw"]:
+        request_search(
+            client_super_admin, query=query, site_search_method="admin_search_fields"
+        )
+
+    assert count_searches(match_objects) == 2
+
+
+@pytest.mark.usefixtures("memo_enabled")
+def test_disabled_filter_field_overridden(client_super_admin, match_objects):
+    """Verify that the memo isn't used if filter_field is overridden, since matching may not be
+    case-insensitive substring matching"""
+    with patch.object(
+        CustomAdminSite, "filter_field", return_value=Q(name__istartswith="xyz")
+    ):
+        request_search(client_super_admin, query="xyz")
+        request_search(client_super_admin, query="xyzw")
+
+    assert count_searches(match_objects) == 2
+
+
+@pytest.mark.usefixtures("memo_enabled")
+def test_disabled_non_ascii(client_super_admin, match_objects):
+    """Verify that the memo isn't used for non-ascii queries, since the database may not
+    lowercase them like python does"""
+    request_search(client_super_admin, query="Ø")
+    request_search(client_super_admin, query="Øx")
+
+    assert count_searches(match_objects) == 2
+
+
+def test_disabled(client_super_admin, match_objects):
+    """Verify that, by default, the memo isn't used"""
+    assert AdminSiteSearchView.site_search_prefix_memo_timeout is None
+
+    request_search(client_super_admin, query="xyz")
+    request_search(client_super_admin, query="xyzw")
+
+    assert count_searches(match_objects) == 2
+
+
+def test_row():
+    """Verify that rows behave like objects when building results, and match values"""
+    row = MemoRow(pk=1, name="Arsenal", values=("arsenal", "ars"))
+
+    assert str(row) == "Arsenal"
+    assert row.matches("arse")
+    assert not row.matches("xyz")
@@ -0,0 +1,108 @@
+"""Tests verifying the prebuilt metadata index, used to match model and field names"""
+
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.utils import translation
+
+from admin_site_search.metadata import MetadataIndex, model_metadata_terms
+from admin_site_search.views import AdminSiteSearchView
+from dev.football.stadiums.models import Pitch, Stadium
+from dev.football.teams.models import Team
+from tests import request_search
+
+
+@pytest.fixture(autouse=True)
+def invalidate_plans():
+    """Ensures every test starts (and ends) without any cached indexes"""
+    admin.site.invalidate_search_plans()
+    yield
+    admin.site.invalidate_search_plans()
+
+
+@pytest.mark.parametrize(
+    "query, matches_expected",
+    [
+        ("a", {"one", "two", "three"}),
+        ("apple", {"one", "three"}),
+        ("APPle", {"one", "three"}),
+        ("banana", {"one"}),
+        ("ARRo", {"two"}),
+        # matches can't span multiple terms, or keys
+        ("bananacherry", set()),
+        ("cherryd", set()),
+        ("xyz", set()),
+        ("", set()),
+        ("\x00", set()),
+    ],
+)
+def test_index(query, matches_expected):
+    """Verify that keys are matched if any of their terms contain the query"""
+    index = MetadataIndex(
+        [
+            ("one", ["Apple", "Banana"]),
+            ("two", ["Cherry", "Date", "Carrot", ""]),
+            ("three", ["pineapple", "apple"]),
+        ]
+    )
+
+    assert index.match(query) == matches_expected
+    assert "one" in index
+    assert "four" not in index
+
+
+def test_terms():
+    """Verify that the terms include the model's class name, and field attributes"""
+    terms = model_metadata_terms(Pitch, Pitch._meta.get_fields())
+
+    assert terms[0] == "Pitch"
+    assert "surface_type" in terms
+    assert "The type of playing surface" in terms
+
+
+def test_match_model_default(client_super_admin):
+    """Verify that, by default, match_model isn't invoked - the index is used instead"""
+    with patch.object(
+        AdminSiteSearchView, "match_model", wraps=AdminSiteSearchView.match_model
+    ) as match_model:
+        response = request_search(client_super_admin, query="playing surface")
+
+    models = [m["id"] for a in response.json()["results"]["apps"] for m in a["models"]]
+
+    assert models == ["stadiums.Pitch"]
+    assert match_model.call_count == 0
+
+
+def test_match_model_not_indexed(client_super_admin):
+    """Verify that match_model is invoked for models that aren't in the index"""
+    index = MetadataIndex([(Team, ["Team"])])
+
+    with patch.object(AdminSiteSearchView, "_get_metadata_index", return_value=index):
+        with patch.object(
+            AdminSiteSearchView, "match_model", return_value=False
+        ) as match_model:
+            request_search(client_super_admin, query="xyz")
+
+    called_with = {c[0][2] for c in match_model.call_args_list}
+
+    assert "Teams" not in called_with
+    assert "Stadiums" in called_with
+
+
+def test_languages():
+    """Verify that an index is built, once, per language"""
+    with translation.override("en"):
+        index_en = admin.site._get_metadata_index()
+        assert admin.site._get_metadata_index() is index_en
+
+    with translation.override("fr"):
+        index_fr = admin.site._get_metadata_index()
+
+    assert index_fr is not index_en
+    assert Stadium in index_en
+    assert Stadium in index_fr
+    assert set(admin.site._metadata_indexes) == {"en", "fr"}
+
+    admin.site.invalidate_search_plans(Stadium)
+    assert not admin.site._metadata_indexes
@@ -0,0 +1,115 @@
+"""Tests verifying that per-model search plans are built once, reused, and invalidated"""
+
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.contrib.auth.models import Permission
+
+from admin_site_search.plans import build_search_plan
+from admin_site_search.views import AdminSiteSearchView
+from dev.football.teams.admin import TeamAdmin
+from dev.football.teams.factories import TeamFactory
+from dev.football.teams.models import Team
+from tests import request_search
+
+
+@pytest.fixture(autouse=True)
+def invalidate_plans():
+    """Ensures every test starts (and ends) without any cached plans"""
+    admin.site.invalidate_search_plans()
+    yield
+    admin.site.invalidate_search_plans()
+
+
+def test_plan():
+    """Verify the contents of a plan"""
+    plan = build_search_plan(Team, admin.site._registry[Team])
+
+    assert plan.model_class is Team
+    assert isinstance(plan.model_admin, TeamAdmin)
+    assert plan.fields == Team._meta.get_fields()
+    assert plan.lookups == (
+        "name__icontains",
+        "key__icontains",
+        "type__icontains",
+        "website__icontains",
+        "motto__icontains",
+    )
+
+    fields = {"name": "Chelsea", "motto": "motto", "website": "https://example.com"}
+    match_name = TeamFactory(**{**fields, "key": "key-1", "name": "Arsenal"})
+    match_motto = TeamFactory(**{**fields, "key": "key-2", "motto": "(ARS)"})
+    TeamFactory(**{**fields, "key": "key-3", "description": "Not a Char: Arsenal"})
+
+    matches = Team.objects.filter(plan.filters("ARS"))
+
+    assert set(matches) == {match_name, match_motto}
+
+
+def test_plans_reused(client_super_admin):
+    """Verify that plans are built once per model, then reused across requests"""
+    TeamFactory(name="Arsenal")
+
+    with patch(
+        "admin_site_search.views.build_search_plan", wraps=build_search_plan
+    ) as build:
+        response_1 = request_search(client_super_admin, query="arsenal")
+        calls_1 = build.call_count
+        response_2 = request_search(client_super_admin, query="arsenal")
+        calls_2 = build.call_count
+
+    assert response_1.json() == response_2.json()
+    assert response_1.json()["counts"]["objects"] == 1
+    assert calls_1 > 0
+    assert calls_2 == calls_1
+
+
+def test_filter_field_default(client_super_admin):
+    """Verify that, by default, filter_field isn't invoked - the plan's lookups are used"""
+    TeamFactory(name="Arsenal")
+
+    with patch.object(
+        AdminSiteSearchView, "filter_field", wraps=AdminSiteSearchView.filter_field
+    ) as filter_field:
+        response = request_search(client_super_admin, query="arsenal")
+
+    assert response.json()["counts"]["objects"] == 1
+    assert filter_field.call_count == 0
+
+
+def test_invalidate(client_super_admin):
+    """Verify that invalidate_search_plans removes a single model's plan, or all plans"""
+    request_search(client_super_admin, query="arsenal")
+    plans = admin.site._search_plans._plans
+
+    assert Team in plans
+    assert len(plans) > 1
+
+    admin.site.invalidate_search_plans(Team)
+    assert Team not in plans
+    assert len(plans) > 0
+
+    admin.site.invalidate_search_plans()
+    assert len(plans) == 0
+
+
+def test_register(client_super_admin):
+    """Verify that registering/unregistering a model invalidates plans, so that searches
+    reflect models registered dynamically"""
+    Permission.objects.create(
+        codename="dynamic", name="Dynamic permission", content_type_id=1
+    )
+
+    response = request_search(client_super_admin, query="dynamic permission")
+    assert response.json()["counts"]["objects"] == 0
+
+    admin.site.register(Permission)
+    try:
+        response = request_search(client_super_admin, query="dynamic permission")
+        assert response.json()["counts"]["objects"] == 1
+        assert admin.site._get_search_plan(Permission).model_admin is not None
+    finally:
+        admin.site.unregister(Permission)
+
+    assert Permission not in admin.site._search_plans._plans
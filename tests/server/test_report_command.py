@@ -0,0 +1,52 @@
+"""Tests verifying the report_site_search_index management command"""
+
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.core.management import CommandError, call_command
+
+from admin_site_search.views import AdminSiteSearchView
+from dev.football.teams.factories import TeamFactory
+
+
+def report(*args) -> str:
+    """Calls the command with the arguments, and returns its output"""
+    out = StringIO()
+    call_command("report_site_search_index", *args, stdout=out)
+    return out.getvalue()
+
+
+def test_in_process():
+    """Verify that the size of each model's in-process index is reported"""
+    TeamFactory.create_batch(2)
+
+    output = report("--models", "teams.Team", "players.Player")
+
+    assert "teams.Team: " in output
+    assert " bytes for 2 rows (" in output
+    assert "players.Player: " in output
+    assert "bytes for 0 rows (-" in output
+    assert "in-process" in output
+    assert "Total: " in output
+
+
+def test_mapped(tmp_path):
+    """Verify that models in the index file are reported as mapped"""
+    path = str(tmp_path / "site-search.idx")
+    TeamFactory(name="Arsenal")
+
+    with patch.object(AdminSiteSearchView, "site_search_index_path", path):
+        admin.site.write_search_index()
+        output = report("--models", "teams.Team")
+
+    assert "teams.Team: " in output
+    assert "bytes for 1 rows" in output
+    assert "mapped" in output
+
+
+def test_invalid_models():
+    """Verify that unknown models are rejected"""
+    with pytest.raises(CommandError):
+        report("--models", "teams.Unknown")
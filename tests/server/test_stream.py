@@ -0,0 +1,161 @@
+"""Tests verifying streamed results (site_search_stream), as NDJSON lines of each app's results
+followed by the counts and errors"""
+
+import json
+from unittest.mock import patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from admin_site_search.views import AdminSiteSearchView
+from dev.admin import CustomAdminSite
+from dev.football.players.factories import PlayerFactory
+from dev.football.stadiums.factories import StadiumFactory
+from dev.football.teams.factories import TeamFactory
+from tests import request_search
+
+NDJSON = "application/x-ndjson, application/json"
+
+urls_async = override_settings(ROOT_URLCONF="tests.server.test_async.urls_async")
+
+
+@pytest.fixture()
+def stream_enabled():
+    """Enables streamed results"""
+    with patch.object(AdminSiteSearchView, "site_search_stream", True):
+        yield
+
+
+@pytest.fixture()
+def data():
+    """Creates matching objects across multiple apps"""
+    TeamFactory(name="Manchester United")
+    PlayerFactory(name="Manuel Almunia")
+    StadiumFactory(name="Manchester Arena")
+
+
+def request_stream(client: Client, query: str, site_search_method: str = None):
+    """Returns the response after performing a GET request against the "admin:site-search"
+    endpoint, accepting NDJSON"""
+    url = f"{reverse('admin:site-search')}?q={query}"
+    method = site_search_method or AdminSiteSearchView.site_search_method
+
+    with patch.object(AdminSiteSearchView, "site_search_method", method):
+        response = client.get(url, HTTP_ACCEPT=NDJSON)
+        if response.streaming:
+            # i.e. the search is run as the content is consumed
+            response.lines = stream_lines(response)
+    return response
+
+
+def stream_lines(response) -> list:
+    """Returns the decoded lines of the streamed response"""
+    if getattr(response, "is_async", False):
+
+        async def collect() -> list:
+            return [chunk async for chunk in response.streaming_content]
+
+        chunks = async_to_sync(collect)()
+    else:
+        chunks = list(response.streaming_content)
+
+    return [json.loads(line) for line in b"".join(chunks).splitlines()]
+
+
+def joined(lines: list) -> dict:
+    """Returns the response data of the streamed lines, as per the JSON response"""
+    return {
+        "results": {"apps": [line["app"] for line in lines[:-1]]},
+        **lines[-1],
+    }
+
+
+@pytest.mark.usefixtures("stream_enabled", "data")
+@pytest.mark.parametrize(
+    "method", ["model_char_fields", "admin_search_fields", "sqlite_fts5"]
+)
+@pytest.mark.parametrize("query", ["man", "stadium", "xyz"])
+def test_stream(client_super_admin, method, query):
+    """Verify that an app line is streamed for each app in the results, then the counts,
+    errors and partial flag - the same as the JSON response"""
+    response_json = request_search(
+        client_super_admin, query=query, site_search_method=method
+    )
+
+    response = request_stream(
+        client_super_admin, query=query, site_search_method=method
+    )
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/x-ndjson"
+    assert response["X-Accel-Buffering"] == "no"
+    assert all("app" in line for line in response.lines[:-1])
+    assert set(response.lines[-1]) == {"counts", "errors", "partial"}
+    assert joined(response.lines) == response_json.json()
+
+
+@pytest.mark.usefixtures("stream_enabled", "data")
+@urls_async
+def test_async(client_super_admin):
+    """Verify that the async view streams the same lines"""
+    response_json = request_search(client_super_admin, query="man")
+
+    response = request_stream(client_super_admin, query="man")
+
+    assert response.is_async
+    assert joined(response.lines) == response_json.json()
+
+
+@pytest.mark.usefixtures("stream_enabled", "data")
+def test_progressive(client_super_admin):
+    """Verify that each app is streamed once its models are searched, before later apps"""
+    with patch.object(
+        CustomAdminSite,
+        "match_objects",
+        autospec=True,
+        side_effect=AdminSiteSearchView.match_objects,
+    ) as match_objects:
+        response = client_super_admin.get(
+            f"{reverse('admin:site-search')}?q=man", HTTP_ACCEPT=NDJSON
+        )
+        content = iter(response.streaming_content)
+        first_app = json.loads(next(content))["app"]
+        searched_first = match_objects.call_count
+        list(content)
+        searched_all = match_objects.call_count
+
+    assert first_app["id"] == "players"
+    assert searched_first < searched_all
+
+
+@pytest.mark.usefixtures("data")
+def test_disabled(client_super_admin):
+    """Verify that, by default, results are returned as JSON"""
+    assert AdminSiteSearchView.site_search_stream is False
+
+    response = request_stream(client_super_admin, query="man")
+
+    assert not response.streaming
+    assert response.json()["counts"]["objects"] == 3
+
+
+@pytest.mark.usefixtures("stream_enabled", "data")
+def test_not_accepted(client_super_admin):
+    """Verify that results are only streamed to clients that accept NDJSON"""
+    response = request_search(client_super_admin, query="man")
+
+    assert not response.streaming
+    assert response.json()["counts"]["objects"] == 3
+
+
+@pytest.mark.usefixtures("stream_enabled", "data")
+def test_cached(client_super_admin):
+    """Verify that streamed results are cached, and cache hits returned as JSON"""
+    with patch.object(AdminSiteSearchView, "site_search_cache_timeout", 60):
+        response = request_stream(client_super_admin, query="man")
+        response_cached = request_stream(client_super_admin, query="man")
+
+    assert not response_cached.streaming
+    assert response_cached.json() == joined(response.lines)
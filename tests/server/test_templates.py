@@ -1,11 +1,15 @@
 """Tests verifying templates are included in the admin site. I.e. ensure the extension
 to admin/base_site.html is supported/working."""
 
+from unittest.mock import patch
+
 import django
 import pytest
 from django.test import Client
 from django.urls import reverse
 
+from admin_site_search.views import AdminSiteSearchView
+
 # presence confirms that the package's templates have loaded correctly
 ELEMENTS_CUSTOM = [
     '<script src="/static/admin_site_search/alpinejs/focus-3-12-0.min.js" defer>',
@@ -91,3 +95,37 @@ def test_logout(client_super_admin):
     assert ELEMENT_HEADER in content
     assert ELEMENT_FOOTER in content
     assert ELEMENT_USER_TOOL not in content
+
+
+@pytest.mark.parametrize("persist", [False, True])
+def test_client_cache(client_super_admin, user_admin, persist):
+    """Verify that the browser's result cache is configured by the script element, scoped to
+    the user and language"""
+    with patch.object(AdminSiteSearchView, "site_search_client_cache_timeout", 30):
+        with patch.object(
+            AdminSiteSearchView, "site_search_client_cache_persist", persist
+        ):
+            content = request_admin_content(client_super_admin)
+
+    scope = f"{user_admin.pk}:en-us"
+    assert f'data-cache-timeout="30" data-cache-scope="{scope}"' in content
+    assert ("data-cache-persist" in content) is persist
+
+
+def test_client_cache_disabled(client_super_admin):
+    """Verify that, by default, the browser doesn't cache results"""
+    assert AdminSiteSearchView.site_search_client_cache_timeout is None
+
+    content = request_admin_content(client_super_admin)
+
+    assert "data-cache-timeout" not in content
+    assert "data-cache-persist" not in content
+
+
+def test_debounce_range(client_super_admin):
+    """Verify that the range of the modal's debounce is set on the script element"""
+    with patch.object(AdminSiteSearchView, "site_search_debounce_range", (100, 500)):
+        content = request_admin_content(client_super_admin)
+
+    assert 'data-debounce-min="100" data-debounce-max="500"' in content
+    assert "input.debounce" not in content
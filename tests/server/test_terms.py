@@ -0,0 +1,191 @@
+"""Tests verifying multi-term queries (site_search_match_terms), which match objects containing
+every term of the query, each in any field"""
+
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from admin_site_search import fts5
+from admin_site_search.plans import split_terms
+from admin_site_search.trigrams import TrigramIndex
+from admin_site_search.views import AdminSiteSearchView
+from dev.admin import CustomAdminSite
+from dev.football.teams.models import Team
+from tests import create_team, request_search, team_names
+
+METHODS = ["model_char_fields", "sqlite_fts5", "in_memory_index"]
+
+
+@pytest.fixture()
+def terms_enabled():
+    """Enables multi-term queries"""
+    with patch.object(AdminSiteSearchView, "site_search_match_terms", True):
+        yield
+
+
+@pytest.fixture()
+def data():
+    """Creates teams whose name and motto each contain one of the terms"""
+    create_team("Arsenal", motto="Victoria Concordia Crescit")
+    create_team("Arsenal Women")
+    create_team("Crescent City")
+
+
+@pytest.mark.usefixtures("terms_enabled", "data")
+@pytest.mark.parametrize("site_search_method", METHODS)
+@pytest.mark.parametrize(
+    "query", ["arsenal crescit", "CRESCIT  Arsenal", "ars cres", "ars arsenal crescit"]
+)
+def test_terms(client_super_admin, site_search_method, query):
+    """Verify that objects match if each term is in any of their fields, with each
+    site_search_method"""
+    response = request_search(
+        client_super_admin, query=query, site_search_method=site_search_method
+    )
+
+    assert team_names(response) == ["Arsenal"]
+
+
+@pytest.mark.usefixtures("terms_enabled", "data")
+@pytest.mark.parametrize("site_search_method", METHODS)
+def test_short_terms(client_super_admin, site_search_method):
+    """Verify that terms too short for trigrams are matched too"""
+    response = request_search(
+        client_super_admin, query="wo ar", site_search_method=site_search_method
+    )
+
+    assert team_names(response) == ["Arsenal Women"]
+
+
+@pytest.mark.usefixtures("terms_enabled", "data")
+def test_union_all(client_super_admin):
+    """Verify that terms are matched with UNION ALL queries"""
+    with patch.object(AdminSiteSearchView, "site_search_union_all", True):
+        response = request_search(client_super_admin, query="crescit arsenal")
+
+    assert team_names(response) == ["Arsenal"]
+
+
+@pytest.mark.usefixtures("terms_enabled", "data")
+def test_index_file(client_super_admin, tmp_path):
+    """Verify that terms are matched against the index file"""
+    path = str(tmp_path / "site-search.idx")
+    admin.site.write_search_index(path)
+
+    with patch.object(AdminSiteSearchView, "site_search_index_path", path):
+        response = request_search(
+            client_super_admin,
+            query="crescit arsenal",
+            site_search_method="in_memory_index",
+        )
+
+    assert team_names(response) == ["Arsenal"]
+
+
+@pytest.mark.usefixtures("terms_enabled", "data")
+def test_filter_order(client_super_admin):
+    """Verify that the ORM filter has one condition per term, most selective (i.e. longest)
+    first"""
+    with CaptureQueriesContext(connection) as queries:
+        request_search(client_super_admin, query="ars crescit")
+
+    sql = next(q["sql"] for q in queries if 'FROM "teams_team"' in q["sql"])
+    assert "%crescit%" in sql and "%ars%" in sql
+    assert sql.index("%crescit%") < sql.index("%ars%")
+
+
+@pytest.mark.usefixtures("terms_enabled", "data")
+def test_filter_field_overridden(client_super_admin):
+    """Verify that filter_field() is called with each term"""
+    with patch.object(
+        CustomAdminSite,
+        "filter_field",
+        autospec=True,
+        side_effect=AdminSiteSearchView.filter_field,
+    ) as filter_field:
+        response = request_search(client_super_admin, query="arsenal crescit")
+
+    assert team_names(response) == ["Arsenal"]
+    assert {c.args[2] for c in filter_field.call_args_list} == {"arsenal", "crescit"}
+
+
+@pytest.mark.usefixtures("terms_enabled", "data")
+def test_bloom_filters(client_super_admin):
+    """Verify that bloom filters are checked per term, rather than for trigrams spanning
+    terms"""
+    with patch.object(AdminSiteSearchView, "site_search_bloom_filters", True):
+        with patch.object(admin.site, "_bloom_filters", None):
+            response = request_search(client_super_admin, query="arsenal crescit")
+
+    assert team_names(response) == ["Arsenal"]
+
+
+@pytest.mark.usefixtures("terms_enabled", "data")
+def test_memo(client_super_admin):
+    """Verify that extended queries are answered from the memo, per term"""
+    with patch.object(AdminSiteSearchView, "site_search_prefix_memo_timeout", 60):
+        request_search(client_super_admin, query="arsenal")
+        with CaptureQueriesContext(connection) as queries:
+            response = request_search(client_super_admin, query="arsenal wo")
+
+    assert team_names(response) == ["Arsenal Women"]
+    assert not [q for q in queries if 'FROM "teams_team"' in q["sql"]]
+
+
+@pytest.mark.usefixtures("data")
+@pytest.mark.parametrize("site_search_method", METHODS)
+def test_disabled(client_super_admin, site_search_method):
+    """Verify that, by default, the query is matched as a whole"""
+    assert AdminSiteSearchView.site_search_match_terms is False
+
+    response = request_search(
+        client_super_admin,
+        query="arsenal crescit",
+        site_search_method=site_search_method,
+    )
+    response_phrase = request_search(
+        client_super_admin, query="arsenal wo", site_search_method=site_search_method
+    )
+
+    assert team_names(response) == []
+    assert team_names(response_phrase) == ["Arsenal Women"]
+
+
+def test_split_terms():
+    """Verify that terms are lowercased, ordered longest first, and left out if they're in
+    another term"""
+    assert split_terms("Saka  Arsenal") == ["arsenal", "saka"]
+    assert split_terms("ars arsenal saka ARS") == ["arsenal", "saka"]
+    assert split_terms("b a c") == ["b", "a", "c"]
+    assert split_terms("  ") == []
+
+
+def test_match_all():
+    """Verify that indexes match objects containing every term, in any of their values"""
+    index = TrigramIndex(
+        [(1, ["Arsenal", "London"]), (2, ["Arsenal Women", "London"]), (3, ["Arsenic"])]
+    )
+
+    assert index.match_all(["arsenal", "london"]) == ["1", "2"]
+    assert index.match_all(["london", "wom"]) == ["2"]
+    assert index.match_all(["ar", "ic"]) == ["3"]
+    assert index.match_all(["arsenal", "xyz"]) == []
+    assert index.match_all([]) == []
+
+
+@pytest.mark.usefixtures("data")
+def test_fts5_match_all():
+    """Verify that FTS5 matches every term, with MATCH and LIKE for short terms"""
+    fts5.ensure_indexed([Team], "default")
+    pks = {t.name: str(t.pk) for t in Team.objects.all()}
+
+    assert fts5.match_all("default", ["arsenal", "crescit"], ["teams.Team"]) == {
+        "teams.Team": [pks["Arsenal"]]
+    }
+    assert fts5.match_all("default", ["wo", "ar"], ["teams.Team"]) == {
+        "teams.Team": [pks["Arsenal Women"]]
+    }
+    assert fts5.match_all("default", [], ["teams.Team"]) == {}
@@ -0,0 +1,230 @@
+"""Tests verifying the in_memory_index site_search_method, which matches objects against an
+in-process trigram index of each model"""
+
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+
+from admin_site_search.trigrams import (
+    TrigramIndex,
+    TrigramIndexRegistry,
+    counter_key,
+    delta_key,
+    trigrams,
+)
+from dev.admin import CustomAdminSite
+from dev.football.core.factories import GroupFactory
+from dev.football.players.factories import PlayerAttributesFactory, PlayerFactory
+from dev.football.stadiums.factories import StadiumFactory
+from dev.football.teams.factories import TeamFactory
+from dev.football.teams.models import Team
+from tests import count_searches, request_search, request_search_index, team_names
+
+
+@pytest.fixture()
+def data():
+    """Creates matching objects across multiple apps/models, with different pk types"""
+    GroupFactory(name="Manchester admins")
+    for i in range(7):
+        TeamFactory(name=f"Manchester {i}")
+    PlayerFactory(name="Manuel Almunia")
+    StadiumFactory(name="Manchester Arena")
+    PlayerAttributesFactory(nationality="Manx")
+
+
+@pytest.mark.usefixtures("data")
+@pytest.mark.parametrize("query", ["man", "MANCHESTER 3", "ma", "m", "stadium", "xyz"])
+def test_results_match(client_super_admin, query):
+    """Verify that the index returns the same results as model_char_fields"""
+    response = request_search(client_super_admin, query=query)
+    response_index = request_search_index(client_super_admin, query=query)
+
+    assert response_index.status_code == 200
+    assert response_index.json() == response.json()
+
+
+@pytest.mark.usefixtures("data")
+def test_queries(client_super_admin):
+    """Verify that, once indexed, objects aren't matched in the database - the only queries
+    retrieve display names for each model with matches"""
+    request_search_index(client_super_admin, query="xyz")
+
+    with CaptureQueriesContext(connection) as queries:
+        response = request_search_index(client_super_admin, query="man")
+
+    assert response.status_code == 200
+    assert response.json()["counts"]["objects"] == 9
+    assert not [q for q in queries if "LIKE" in q["sql"]]
+    assert len(queries) == 5 + 2  # +2 for session/user
+
+
+def test_rebuilt_on_write(client_super_admin, django_capture_on_commit_callbacks):
+    """Verify that the index is rebuilt once a write to the model is committed"""
+    team = TeamFactory(name="Arsenal")
+    request_search_index(client_super_admin, query="arsenal")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        team.name = "Tottenham"
+        team.save()
+
+    response = request_search_index(client_super_admin, query="tott")
+
+    assert response.json()["counts"]["objects"] == 1
+
+
+@pytest.mark.usefixtures("transactional_db")
+def test_built_in_background(client_super_admin, match_objects):
+    """Verify that a model's index is first built in a background thread (which reads
+    committed data), while the model is searched in the database - rather than by the search"""
+    TeamFactory(name="Arsenal")
+
+    # (with a new registry, so no index of the model was built by an earlier test)
+    with patch.object(admin.site, "_trigram_indexes", None):
+        with patch.object(TrigramIndexRegistry, "background", True):
+            response = request_search_index(client_super_admin, query="arsenal")
+            admin.site._get_trigram_indexes().join()
+            response_built = request_search_index(client_super_admin, query="arsenal")
+
+    assert count_searches(match_objects) == 1
+    assert team_names(response) == team_names(response_built) == ["Arsenal"]
+
+
+@pytest.mark.usefixtures("transactional_db")
+def test_updated_on_write(client_super_admin):
+    """Verify that, after a write, the model's index is updated with the written objects
+    (once committed) - rather than rebuilt"""
+    team = TeamFactory(name="Arsenal")
+    team_deleted = TeamFactory(name="Arsenal Academy")
+    request_search_index(client_super_admin, query="arsenal")
+    registry = admin.site._get_trigram_indexes()
+
+    with patch.object(CustomAdminSite, "_build_trigram_index") as build:
+        team.name = "Tottenham"
+        team.save()
+        team_deleted.delete()
+        team_new = TeamFactory(name="Arsenal Women")
+        index = registry.get_many([Team])[Team]
+
+    assert build.call_count == 0
+    assert index.match("arsenal") == [str(team_new.pk)]
+    assert index.match("tott") == [str(team.pk)]
+    assert len(index) == 2
+
+
+@pytest.mark.usefixtures("transactional_db")
+def test_rebuilt_in_background(client_super_admin):
+    """Verify that, after a write that can't be applied (e.g. its delta was evicted), the
+    previous index is returned while the model's index is rebuilt in a background thread
+    (which reads committed data)"""
+    team = TeamFactory(name="Arsenal")
+    request_search_index(client_super_admin, query="arsenal")
+    registry = admin.site._get_trigram_indexes()
+    index = registry.get_many([Team])[Team]
+
+    with patch.object(TrigramIndexRegistry, "background", True):
+        team.name = "Tottenham"
+        team.save()
+        cache.delete(delta_key("teams.Team", cache.get(counter_key("teams.Team"))))
+        index_stale = registry.get_many([Team])[Team]
+        registry.join()
+        index_rebuilt = registry.get_many([Team])[Team]
+
+    assert index_stale is index
+    assert index_rebuilt.match("tott") == [str(team.pk)]
+
+
+def test_updated():
+    """Verify that updated objects are matched after the others, and that written objects
+    are no longer matched as they were"""
+    index = TrigramIndex([(1, ["Arsenal"]), (2, ["Arsenal Academy"]), (3, ["Chelsea"])])
+
+    index_updated = index.updated(
+        [(1, ["Arsenal Women"]), (4, ["Arsenal U21"])], [1, 2, 4]
+    )
+    index_updated_again = index_updated.updated([(4, ["Fulham"])], [4])
+
+    assert index_updated.match("arsenal") == ["1", "4"]
+    assert index_updated.match("academy") == []
+    assert index_updated_again.match("arsenal") == ["1"]
+    assert index_updated_again.match("fulham") == ["4"]
+    assert index.match("arsenal") == ["1", "2"]
+    assert (len(index), len(index_updated), len(index_updated_again)) == (3, 3, 3)
+
+
+def test_build_error(client_super_admin):
+    """Verify that if a model's index can't be built, it's searched in the database"""
+    TeamFactory(name="Arsenal")
+
+    with patch.object(
+        CustomAdminSite, "_build_trigram_index", side_effect=DatabaseError("Test error")
+    ):
+        response = request_search_index(client_super_admin, query="arsenal")
+
+    assert response.json()["counts"]["objects"] == 1
+    assert response.json()["errors"] == []
+
+
+def test_filter_field_overridden(client_super_admin):
+    """Verify that, if filter_field is overridden, objects are matched in the database"""
+    team = TeamFactory(name="Arsenal", description="Gunners")
+
+    def filter_field(self, request, query, field):
+        if field.name == "description":
+            return Q(description__icontains=query)
+
+    with patch.object(CustomAdminSite, "filter_field", filter_field, create=True):
+        response = request_search_index(client_super_admin, query="gunners")
+
+    assert response.json()["counts"]["objects"] == 1
+    assert response.json()["results"]["apps"][0]["models"][0]["objects"][0]["id"] == (
+        str(team.pk)
+    )
+
+
+def test_trigrams():
+    """Verify that every substring of 3 characters is returned"""
+    assert trigrams("arsenal") == {"ars", "rse", "sen", "ena", "nal"}
+    assert trigrams("ar") == set()
+
+
+def test_index_match():
+    """Verify that candidates are verified, and matches are returned in order, up to the
+    limit"""
+    index = TrigramIndex(
+        [
+            (1, ["Arsenal", None]),
+            (2, ["abcd", "bcde"]),
+            (3, ["Arsenal Women", ""]),
+            (4, ["Arsenal Academy", "U21"]),
+        ]
+    )
+
+    assert len(index) == 4
+    assert index.match("ARSENAL") == ["1", "3", "4"]
+    assert index.match("arsenal", limit=2) == ["1", "3"]
+    # every trigram is in the 2nd object, but it doesn't contain the query
+    assert index.match("abcde") == []
+    assert index.match("u2") == ["4"]
+    assert index.match("xyz") == []
+    assert index.match("") == []
+
+
+def test_index_scan():
+    """Verify that queries without trigrams don't match across two objects' texts"""
+    index = TrigramIndex([(1, ["ab"]), (2, [""]), (3, ["cd"]), (4, ["xbc"])])
+
+    assert index.match("bc") == ["4"]
+    assert index.match("c") == ["3", "4"]
+
+
+def test_index_compact():
+    """Verify that the index takes well under 100 bytes per (short) object"""
+    index = TrigramIndex((i, [f"Team {i}", "CLUB"]) for i in range(10000))
+
+    assert index.match("team 1234") == ["1234"]
+    assert index.nbytes() / len(index) < 100
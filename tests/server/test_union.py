@@ -0,0 +1,175 @@
+"""Tests verifying that objects can be matched with a single UNION ALL query
+(site_search_union_all), with the same results as one query per model"""
+
+from unittest.mock import patch
+
+import pytest
+from django.contrib import admin
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from admin_site_search.views import AdminSiteSearchView
+from dev.admin import CustomAdminSite
+from dev.football.core.factories import GroupFactory
+from dev.football.players.factories import PlayerAttributesFactory, PlayerFactory
+from dev.football.stadiums.factories import StadiumFactory
+from dev.football.teams.factories import TeamFactory
+from dev.football.teams.models import Team
+from tests import request_search
+
+
+def request_search_union(client, query: str, **kwargs):
+    """Performs a search, with site_search_union_all patched"""
+    with patch.object(AdminSiteSearchView, "site_search_union_all", True):
+        return request_search(client, query=query, **kwargs)
+
+
+@pytest.fixture()
+def data():
+    """Creates matching objects across multiple apps/models, with different pk types"""
+    GroupFactory(name="Manchester admins")
+    for i in range(7):
+        TeamFactory(name=f"Manchester {i}")
+    PlayerFactory(name="Manuel Almunia")
+    StadiumFactory(name="Manchester Arena")
+    PlayerAttributesFactory(nationality="Manx")
+
+
+@pytest.mark.usefixtures("data")
+@pytest.mark.parametrize("query", ["man", "manchester 3", "stadium", "xyz"])
+def test_results_match(client_super_admin, query):
+    """Verify that the UNION ALL query returns the same results as one query per model"""
+    response = request_search(client_super_admin, query=query)
+    response_union = request_search_union(client_super_admin, query=query)
+
+    assert response_union.status_code == 200
+    assert response_union.json() == response.json()
+
+
+@pytest.mark.usefixtures("data")
+def test_queries(client_super_admin):
+    """Verify that objects are matched with a single query, after which the display names are
+    retrieved for each model with matches (groups, players, player attributes, stadiums and
+    teams)"""
+    with CaptureQueriesContext(connection) as queries:
+        response = request_search_union(client_super_admin, query="man")
+
+    queries_union = [q for q in queries if "UNION ALL" in q["sql"]]
+    queries_savepoint = [q for q in queries if "SAVEPOINT" in q["sql"]]
+
+    assert response.status_code == 200
+    assert response.json()["counts"]["objects"] == 9
+    assert len(queries_union) == 1
+    # +2 for session/user, and the savepoint (created/released) around the UNION ALL query
+    assert len(queries) == len(queries_union) + 5 + 2 + len(queries_savepoint)
+
+
+def test_admin_search_fields(client_super_admin):
+    """Verify that the UNION ALL query is only used with model_char_fields"""
+    TeamFactory(name="Arsenal")
+
+    with CaptureQueriesContext(connection) as queries:
+        response = request_search_union(
+            client_super_admin,
+            query="arsenal",
+            site_search_method="admin_search_fields",
+        )
+
+    assert response.status_code == 200
+    assert response.json()["counts"]["objects"] == 1
+    assert not [q for q in queries if "UNION ALL" in q["sql"]]
+
+
+def test_match_objects_overridden(client_super_admin):
+    """Verify that the UNION ALL query isn't used if match_objects is overridden, since it
+    would ignore how the override matches objects"""
+    TeamFactory(name="Arsenal")
+
+    def match_nothing(self, request, query, model_class, model_fields):
+        """Matches no objects, e.g. to leave them out of the search"""
+        return model_class.objects.none()
+
+    with patch.object(CustomAdminSite, "match_objects", match_nothing):
+        with CaptureQueriesContext(connection) as queries:
+            response = request_search_union(client_super_admin, query="arsenal")
+
+    assert response.status_code == 200
+    assert response.json()["counts"]["objects"] == 0
+    assert not [q for q in queries if "UNION ALL" in q["sql"]]
+
+
+@override_settings(DEBUG=True)
+def test_fallback(client_super_admin):
+    """Verify that if the UNION ALL query fails, objects are matched with one query per model,
+    so an error in one model doesn't prevent results from others - after rolling back to a
+    savepoint, so the request's transaction can still be used"""
+    TeamFactory(name="Arsenal")
+    StadiumFactory(name="Arsenal Stadium")
+
+    def invalid_team_queryset(request, model_class, model_admin):
+        """Returns an invalid queryset for the Team model, default otherwise"""
+        if model_class is Team:
+            return Team.objects.extra(where=["invalid_column = 1"])
+        return model_class.objects.all()
+
+    with patch.object(
+        CustomAdminSite, "get_model_queryset", side_effect=invalid_team_queryset
+    ):
+        with CaptureQueriesContext(connection) as queries:
+            response = request_search_union(client_super_admin, query="arsenal")
+
+    data = response.json()
+
+    assert response.status_code == 200
+    assert any("ROLLBACK TO SAVEPOINT" in q["sql"] for q in queries)
+    assert data["counts"] == {"apps": 1, "models": 1, "objects": 1}
+    assert data["results"]["apps"][0]["id"] == "stadiums"
+    assert len(data["errors"]) == 1
+    assert data["errors"][0]["model"] == "Team"
+
+
+def test_objects_by_pks():
+    """Verify that matched objects are retrieved in the order of their pks, which are compared
+    as per the pk field (rather than as strings)"""
+    first = TeamFactory()
+    second = TeamFactory()
+
+    objects = admin.site._objects_by_pks(
+        Team.objects.all(), [f" {second.pk}", str(first.pk), "0"]
+    )
+
+    assert objects == [second, first]
+
+
+@override_settings(DEBUG=True)
+def test_errors(client_super_admin):
+    """Verify that errors raised while building a model's query are included in the
+    response"""
+    StadiumFactory(name="Arsenal Stadium")
+
+    with patch.object(
+        CustomAdminSite, "filter_field", side_effect=Exception("A test error occurred")
+    ):
+        response = request_search_union(client_super_admin, query="arsenal")
+
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["counts"] == {"apps": 0, "models": 0, "objects": 0}
+    assert len(data["errors"]) > 0
+    assert {e["error_message"] for e in data["errors"]} == {"A test error occurred"}
+
+
+@pytest.mark.usefixtures("data")
+@override_settings(ROOT_URLCONF="tests.server.test_async.urls_async")
+def test_async(client_super_admin):
+    """Verify that the async view also matches objects with a single UNION ALL query"""
+    response = request_search(client_super_admin, query="man")
+
+    with CaptureQueriesContext(connection) as queries:
+        response_union = request_search_union(client_super_admin, query="man")
+
+    assert response_union.status_code == 200
+    assert response_union.json() == response.json()
+    assert len([q for q in queries if "UNION ALL" in q["sql"]]) == 1
@@ -0,0 +1,139 @@
+"""Tests verifying batched, incremental index updates (admin_site_search.updates), as used by the
+sqlite_fts5 site_search_method"""
+
+from datetime import date
+from unittest.mock import Mock, patch
+
+import pytest
+from django.contrib.admin.models import ADDITION, LogEntry
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import transaction
+
+from admin_site_search import fts5, updates
+from admin_site_search.cache import get_generations, track_generations
+from dev.football.players.factories import PlayerFactory
+from dev.football.players.models import PlayerContract
+from dev.football.teams.factories import TeamFactory
+from dev.football.teams.models import Team
+from tests import request_search, team_names
+
+
+@pytest.fixture()
+def sync():
+    """Indexes the Team model, and spies on the (only) handler: the FTS5 index"""
+    fts5.ensure_indexed([Team], "default")
+    # i.e. written by other tests, which are never committed
+    updates._pending().clear()
+    spy = Mock(wraps=fts5.sync)
+    with patch.object(updates, "_handlers", [spy]):
+        yield spy
+
+
+def matching_team_names(client, query: str) -> list:
+    """Returns the names of the teams matching the query, with the sqlite_fts5 method"""
+    return team_names(
+        request_search(client, query=query, site_search_method="sqlite_fts5")
+    )
+
+
+def test_batched(client_super_admin, sync, django_capture_on_commit_callbacks):
+    """Verify that writes in a transaction are flushed in one batch, once committed, with
+    repeated saves of the same object collapsed"""
+    team = TeamFactory(name="Arsenal")
+    team_deleted = TeamFactory(name="Arsenal Academy")
+    team_deleted_pk = team_deleted.pk
+
+    with django_capture_on_commit_callbacks(execute=True):
+        with transaction.atomic():
+            team.name = "Arsenal Women"
+            team.save()
+            team.save()
+            team_new = TeamFactory(name="Arsenal U21")
+            team_deleted.delete()
+            assert sync.call_count == 0
+
+    calls = [c for c in sync.call_args_list if c[0][0] is Team]
+    assert len(calls) == 1
+    _, pks, _ = calls[0][0]
+    assert sorted(pks) == sorted([team.pk, team_new.pk, team_deleted_pk])
+    assert matching_team_names(client_super_admin, "arsenal") == [
+        "Arsenal U21",
+        "Arsenal Women",
+    ]
+
+
+def test_rolled_back(client_super_admin, sync, django_capture_on_commit_callbacks):
+    """Verify that writes that are rolled back (e.g. in a savepoint) aren't flushed, while
+    the rest of the transaction is"""
+    team = TeamFactory(name="Arsenal")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        with transaction.atomic():
+            with pytest.raises(ValueError):
+                with transaction.atomic():
+                    team.name = "Tottenham"
+                    team.save()
+                    raise ValueError()
+            team_new = TeamFactory(name="Chelsea")
+
+    calls = [c for c in sync.call_args_list if c[0][0] is Team]
+    assert [pks for _, pks, _ in (c[0] for c in calls)] == [[team_new.pk]]
+    assert matching_team_names(client_super_admin, "chelsea") == ["Chelsea"]
+    assert matching_team_names(client_super_admin, "tottenham") == []
+
+
+def test_not_indexed(sync, django_capture_on_commit_callbacks):
+    """Verify that models without any indexed (Char) fields aren't recorded"""
+    player = PlayerFactory()
+    team = TeamFactory()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        PlayerContract.objects.create(
+            player=player, team=team, valid_from=date.today(), duration=1
+        )
+
+    assert not [c for c in sync.call_args_list if c[0][0] is PlayerContract]
+
+
+def test_not_registered(user_super, sync, django_capture_on_commit_callbacks):
+    """Verify that models not registered with any admin site, i.e. sessions and admin log
+    entries, aren't recorded"""
+    with django_capture_on_commit_callbacks(execute=True):
+        SessionStore().create()
+        LogEntry.objects.create(
+            user=user_super, object_repr="Arsenal", action_flag=ADDITION
+        )
+        assert updates._pending() == {}
+
+    assert sync.call_count == 0
+
+
+def test_handler_error(caplog, django_capture_on_commit_callbacks):
+    """Verify that a handler's error is logged, rather than raised (failing the committed
+    write), and doesn't stop the other handlers"""
+    updates._pending().clear()
+    failing = Mock(side_effect=ValueError("index is locked"))
+    handler = Mock()
+
+    with patch.object(updates, "_handlers", [failing, handler]):
+        with django_capture_on_commit_callbacks(execute=True):
+            team = TeamFactory(name="Arsenal")
+
+    handler.assert_any_call(Team, [team.pk], "default")
+    assert "Failed to flush teams.Team objects" in caplog.text
+
+
+def test_reindex_queryset(client_super_admin, sync, django_capture_on_commit_callbacks):
+    """Verify that reindex_queryset() re-indexes objects written without signals, and bumps
+    the model's generation"""
+    TeamFactory.create_batch(3, name="Arsenal")
+    track_generations("default")
+    generation = get_generations("default", ["teams.Team"])
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Team.objects.update(name="Tottenham")
+        updates.reindex_queryset(Team.objects.all())
+
+    assert matching_team_names(client_super_admin, "arsenal") == []
+    assert matching_team_names(client_super_admin, "tottenham") == ["Tottenham"] * 3
+    assert get_generations("default", ["teams.Team"]) != generation